@@ -0,0 +1,214 @@
+import random
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .caching import bump_versions
+from .importer import RowError, decode, to_int, to_price, to_text
+from .models import InventoryValuation, Item, ItemHistory, ItemVisibility
+from .rollups import record_changes
+from .signals import valuations_enabled
+
+# Attempts at applying a batch that keeps losing races with other writers.
+DEFAULT_ATTEMPTS = 8
+# Items written per versioned UPDATE statement.
+UPDATE_BATCH_SIZE = 500
+
+
+class Adjustment(NamedTuple):
+    """A change to one item: a new quantity or a quantity delta, a new price,
+    name or description, and optionally the version the change was based on."""
+    item_id: int
+    quantity: Optional[int] = None
+    quantity_delta: Optional[int] = None
+    price: Optional[Decimal] = None
+    name: Optional[str] = None
+    description: Optional[str] = None
+    version: Optional[int] = None
+
+
+class AdjustmentError(ValueError):
+    """Adjustments that cannot be applied.
+
+    Args:
+        errors (List[Tuple[int, str]]): index of each rejected adjustment and the reason.
+    """
+
+    def __init__(self, errors: List[Tuple[int, str]]) -> None:
+        super().__init__(f"{len(errors)} adjustments rejected")
+        self.errors = errors
+
+
+class StaleVersion(AdjustmentError):
+    """Adjustments rejected only because their items have moved past the
+    version they name; the client should reread the items and try again."""
+
+
+class VersionConflict(Exception):
+    """An item changed between being read and being written."""
+
+
+def clean_adjustment(raw: Any) -> Adjustment:
+    """Validates an adjustment such as {"id": 4, "quantity_delta": -2, "price": "3.10"}."""
+    row = decode(raw)
+
+    def given(field: str) -> bool:
+        return row.get(field) is not None
+
+    if given('quantity') and given('quantity_delta'):
+        raise RowError("give quantity or quantity_delta, not both")
+    adjustment = Adjustment(
+        item_id=to_int(row, 'id'),
+        quantity=to_int(row, 'quantity') if given('quantity') else None,
+        quantity_delta=to_int(row, 'quantity_delta') if given('quantity_delta') else None,
+        price=to_price(row, 'price') if given('price') else None,
+        name=to_text(row, 'name', 30) if given('name') else None,
+        description=to_text(row, 'description', 100) if given('description') else None,
+        version=to_int(row, 'version') if given('version') else None)
+    if all(value is None for value in adjustment[1:6]):
+        raise RowError("nothing to adjust")
+    return adjustment
+
+
+def clean_adjustments(rows: List[Any]) -> List[Adjustment]:
+    """Validates a batch of adjustments, raising AdjustmentError listing every bad one."""
+    adjustments, errors = [], []
+    for index, raw in enumerate(rows):
+        try:
+            adjustments.append(clean_adjustment(raw))
+        except RowError as error:
+            errors.append((index, str(error)))
+    if errors:
+        raise AdjustmentError(errors)
+    return adjustments
+
+
+def retryable(error: Exception) -> bool:
+    """True for errors a fresh attempt can get past: a lost version race, a
+    locked SQLite database, or a PostgreSQL deadlock or serialization failure."""
+    if isinstance(error, VersionConflict):
+        return True
+    message = str(error)
+    return any(reason in message for reason in ('locked', 'deadlock', 'could not serialize'))
+
+
+def apply_adjustments(user: Any, adjustments: List[Adjustment],
+                      attempts: Optional[int] = None) -> List[Item]:
+    """Applies a batch of adjustments to items visible to user, all or nothing.
+
+    Each attempt runs in one transaction: the items are loaded under a row
+    lock, changed in memory, written with a version checked UPDATE per 500
+    items and a bulk insert of ItemHistory rows. When another writer wins a
+    race for one of the items, the attempt is rolled back and retried from
+    fresh rows, so no update is lost and history records the true before
+    values.
+
+    Args:
+        user (User): user making the adjustments.
+        adjustments (List[Adjustment]): adjustments to apply; several
+            adjustments to one item apply in order.
+        attempts (int, optional): tries before giving up. Defaults to
+            settings.ADJUSTMENT_ATTEMPTS, or 8.
+
+    Raises:
+        AdjustmentError: if an item is not visible to user, would go below
+            zero stock, or has moved past the version an adjustment names;
+            StaleVersion if the versions are all that is wrong.
+        VersionConflict: if every attempt lost a race with another writer.
+
+    Returns:
+        List[Item]: the adjusted items, in order of first adjustment.
+    """
+    attempts = attempts or getattr(settings, 'ADJUSTMENT_ATTEMPTS', DEFAULT_ATTEMPTS)
+    for attempt in range(attempts):
+        try:
+            return adjust_once(user, adjustments)
+        except (VersionConflict, OperationalError) as error:
+            if attempt == attempts - 1 or not retryable(error):
+                raise
+            # Jittered exponential backoff, capped at about a quarter second.
+            time.sleep(random.uniform(0, min(0.25, 0.005 * 2 ** attempt)))
+
+
+def adjust_once(user: Any, adjustments: List[Adjustment]) -> List[Item]:
+    """One attempt at apply_adjustments."""
+    with transaction.atomic():
+        items: Dict[int, Item] = Item.objects.visible_to(user).select_for_update().in_bulk(
+            {adjustment.item_id for adjustment in adjustments})
+        changed = timezone.now()
+        adjusted: Dict[int, Item] = {}
+        worth_before: Dict[int, Decimal] = {}
+        fields: Set[str] = set()
+        histories, errors, stale = [], [], []
+        for index, adjustment in enumerate(adjustments):
+            item = items.get(adjustment.item_id)
+            if item is None:
+                errors.append((index, f"item {adjustment.item_id} does not exist or is not visible"))
+                continue
+            if adjustment.version is not None and adjustment.version != item.version:
+                errors.append((index, f"item {item.id} changed since version {adjustment.version}, "
+                                      f"it is now at version {item.version}"))
+                stale.append(index)
+                continue
+            quantity = item.quantity
+            if adjustment.quantity is not None:
+                quantity = adjustment.quantity
+            elif adjustment.quantity_delta is not None:
+                quantity += adjustment.quantity_delta
+            if quantity < 0:
+                errors.append((index, f"item {item.id} would have negative quantity {quantity}"))
+                continue
+            price = item.price if adjustment.price is None else adjustment.price
+            if quantity != item.quantity or price != item.price:
+                histories.append(ItemHistory(item_id=item, date_of_change=changed,
+                                             quantity_before=item.quantity, quantity_after=quantity,
+                                             price_before=float(item.price), price_after=float(price)))
+            worth_before.setdefault(item.id, item.price * item.quantity)
+            new_values = {"quantity": quantity, "price": price,
+                          "name": adjustment.name, "description": adjustment.description}
+            for field, value in new_values.items():
+                if value is not None and value != getattr(item, field):
+                    setattr(item, field, value)
+                    fields.add(field)
+                    adjusted.setdefault(item.id, item)
+        if errors:
+            raise (StaleVersion if len(stale) == len(errors) else AdjustmentError)(errors)
+        update_versioned(list(adjusted.values()), sorted(fields))
+        ItemHistory.objects.bulk_create(histories)
+        # Bulk writes skip the signals that maintain rollups, valuations and cached pages.
+        record_changes(histories)
+        viewer_ids = list(ItemVisibility.objects.filter(
+            item__in=list(adjusted)).values_list('user_id', flat=True)) if adjusted else []
+        bump_versions(viewer_ids)
+        if histories and valuations_enabled():
+            InventoryValuation.shift_items({item_id: (item.price * item.quantity - worth_before[item_id], 0)
+                                            for item_id, item in adjusted.items()})
+    return list(adjusted.values())
+
+
+def update_versioned(items: List[Item], fields: List[str]) -> None:
+    """Writes fields of items, and bumps their version, if no one else has.
+
+    Each UPDATE only matches rows still at the version they were read at;
+    fewer matched rows than items means another writer got there first.
+
+    Raises:
+        VersionConflict: if any item's version has moved on.
+    """
+    for start in range(0, len(items), UPDATE_BATCH_SIZE):
+        batch = items[start:start + UPDATE_BATCH_SIZE]
+        unchanged = Q()
+        for item in batch:
+            unchanged |= Q(id=item.id, version=item.version)
+        values = {field: Case(*[When(id=item.id, then=Value(getattr(item, field)))
+                                for item in batch], output_field=Item._meta.get_field(field))
+                  for field in fields}
+        if Item.objects.filter(unchanged).update(version=F('version') + 1, **values) != len(batch):
+            raise VersionConflict(f"{len(batch)} items changed while being adjusted")
+        for item in batch:
+            item.version += 1
@@ -1,8 +1,9 @@
 from django.contrib import admin
 
 # Register your models here.
-from home.models import User, Item, ItemHistory
+from home.models import User, Item, ItemHistory, ItemVisibility
 
 admin.site.register(Item)
 admin.site.register(User)
 admin.site.register(ItemHistory)
+admin.site.register(ItemVisibility)
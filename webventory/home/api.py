@@ -0,0 +1,257 @@
+'''
+JSON API for scanners and ERP sync, mounted under /api/.
+
+Clients authenticate with the session cookie from /login and send the
+csrftoken cookie back in an X-CSRFToken header on writes. Items follow the
+same visibility rules as the web pages: any user an item is visible to may
+read and adjust it, only its owner may delete it or change who sees it.
+'''
+
+import json
+from typing import Any, Dict, List, Set
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.views.decorators.http import require_http_methods, require_POST
+
+from .adjustments import (AdjustmentError, StaleVersion, VersionConflict, apply_adjustments,
+                          clean_adjustment, clean_adjustments)
+from .caching import bump_versions
+from .decorators import api_login_required
+from .deletion import delete_items
+from .directory import lookup_users, visible_usernames
+from .importer import RowError, clean_item, to_text
+from .models import Item, User
+from .pagination import paginate
+from .search import search_items
+
+# Adjustments accepted in one batch request.
+DEFAULT_MAX_BATCH = 5000
+
+
+def api_response(data: Any, status: int = 200) -> JsonResponse:
+    """JSON response without the whitespace the default encoder adds."""
+    return JsonResponse(data, status=status, safe=False,
+                        json_dumps_params={"separators": (',', ':')})
+
+
+def api_error(message: str, status: int = 400) -> JsonResponse:
+    return api_response({"error": message}, status)
+
+
+def read_json(request: HttpRequest) -> Any:
+    try:
+        return json.loads(request.body or b'null')
+    except (json.JSONDecodeError, UnicodeDecodeError) as error:
+        raise RowError(f"invalid JSON: {error}")
+
+
+def item_json(item: Item) -> Dict[str, Any]:
+    return {"id": item.id, "name": item.name, "description": item.description,
+            "quantity": item.quantity, "price": str(item.price), "version": item.version,
+            "owner": item.owner.username if item.owner else None}
+
+
+def stock_json(item: Item) -> Dict[str, Any]:
+    return {"id": item.id, "quantity": item.quantity, "price": str(item.price),
+            "version": item.version}
+
+
+def usernames_in(value: Any) -> Set[str]:
+    return {str(username) for username in value} if isinstance(value, list) else set()
+
+
+def errors_json(error: AdjustmentError) -> JsonResponse:
+    """Rejected adjustments by index, with a 409 if only their versions are stale."""
+    return api_response({"errors": [{"index": index, "error": reason}
+                                    for index, reason in error.errors]},
+                        409 if isinstance(error, StaleVersion) else 400)
+
+
+@api_login_required
+@require_http_methods(['GET', 'POST'])
+def items(request: HttpRequest) -> JsonResponse:
+    """Lists the items visible to the user, or creates an item.
+
+    GET takes ?after=<id>&per_page=<n> for keyset pages, or ?q=<text>&page=<n>
+    to search. POST takes {"name", "description", "quantity", "price",
+    "visible_to": [usernames]}.
+
+    Args:
+        request (HttpRequest): HTTP request.
+
+    Returns:
+        JsonResponse: a page of items, or the created item.
+    """
+    if request.method == 'GET':
+        query = request.GET.get('q', '')
+        if query:
+            number = request.GET.get('page', '1')
+            page = search_items(request.user, query, int(number) if number.isdigit() else 1)
+            return api_response({"items": [item_json(item) for item in page],
+                                 "next_page": page.number + 1 if page.has_next else None})
+        after = request.GET.get('after', '')
+        page = paginate(request, Item.objects.visible_to(request.user).select_related('owner'),
+                        int(after) if after.isdigit() else 0)
+        return api_response({"items": [item_json(item) for item in page],
+                             "next": page.next_cursor if page.has_next else None})
+    try:
+        row = read_json(request)
+        item_id, fields, shared = clean_item(row)
+    except RowError as error:
+        return api_error(str(error))
+    if item_id is not None:
+        return api_error("id is assigned by the server")
+    viewers = list(User.objects.filter(username__in=shared))
+    unknown = set(shared) - {viewer.username for viewer in viewers}
+    if unknown:
+        return api_error(f"unknown users: {', '.join(sorted(unknown))}")
+    viewer_ids = {request.user.id, *(viewer.id for viewer in viewers)}
+    with transaction.atomic():
+        item = Item.objects.create(owner=request.user, **fields)
+        # add() rather than bulk_create, so the viewers' valuations are shifted.
+        item.visible_to.add(*viewer_ids)
+    bump_versions(viewer_ids)
+    return api_response(item_json(item), 201)
+
+
+@api_login_required
+@require_http_methods(['GET', 'PATCH', 'DELETE'])
+def item(request: HttpRequest, item_id: int) -> HttpResponse:
+    """Reads, edits or deletes one item.
+
+    PATCH takes any of "name", "description", "quantity", "quantity_delta"
+    and "price"; stock changes are recorded in the item's history. With
+    "version", the edit is refused with a 409 if the item has changed since.
+
+    Args:
+        request (HttpRequest): HTTP request.
+        item_id (int): Item ID number.
+
+    Returns:
+        HttpResponse: the item, or 204 after a delete.
+    """
+    item = Item.objects.visible_to(request.user).select_related('owner').filter(id=item_id).first()
+    if item is None:
+        return api_error("not found", 404)
+    if request.method == 'GET':
+        return api_response(item_json(item))
+    if request.method == 'DELETE':
+        if item.owner_id != request.user.id:
+            return api_error("only the owner can delete an item", 403)
+        delete_items(request.user, [item.id])
+        return HttpResponse(status=204)
+    try:
+        row = read_json(request)
+        if not isinstance(row, dict):
+            raise RowError("row is not an object")
+        adjustment = clean_adjustment(dict(row, id=item.id))
+    except RowError as error:
+        return api_error(str(error))
+    try:
+        apply_adjustments(request.user, [adjustment])
+    except StaleVersion as error:
+        return api_error(error.errors[0][1], 409)
+    except AdjustmentError as error:
+        return api_error(error.errors[0][1])
+    except VersionConflict:
+        return api_error("item is being changed by another request, try again", 409)
+    item.refresh_from_db()
+    return api_response(item_json(item))
+
+
+@api_login_required
+@require_POST
+def adjust(request: HttpRequest) -> JsonResponse:
+    """Applies a batch of stock adjustments in one transaction.
+
+    Takes {"adjustments": [{"id", "quantity" or "quantity_delta", "price"}, ...]}.
+    Either every adjustment is applied or, with a 400 listing the rejected
+    ones by index, none is. The status is 409 if the only fault is items
+    having moved past the "version" their adjustments name.
+
+    Args:
+        request (HttpRequest): HTTP request.
+
+    Returns:
+        JsonResponse: the new quantity and price of each adjusted item.
+    """
+    try:
+        body = read_json(request)
+    except RowError as error:
+        return api_error(str(error))
+    rows: List[Any] = body.get('adjustments') if isinstance(body, dict) else body
+    if not isinstance(rows, list) or not rows:
+        return api_error("expected a non-empty list of adjustments")
+    max_batch = getattr(settings, 'API_MAX_BATCH', DEFAULT_MAX_BATCH)
+    if len(rows) > max_batch:
+        return api_error(f"at most {max_batch} adjustments per request")
+    try:
+        adjusted = apply_adjustments(request.user, clean_adjustments(rows))
+    except AdjustmentError as error:
+        return errors_json(error)
+    except VersionConflict:
+        return api_error("items are being changed by other requests, try again", 409)
+    return api_response({"adjusted": len(rows), "items": [stock_json(item) for item in adjusted]})
+
+
+@api_login_required
+@require_http_methods(['GET'])
+def users(request: HttpRequest) -> JsonResponse:
+    """Pages through users by username, optionally by prefix.
+
+    Takes ?q=<prefix>&after=<username>, and ?item=<id> to flag which of
+    the listed users can see that item.
+
+    Args:
+        request (HttpRequest): HTTP request.
+
+    Returns:
+        JsonResponse: the users on the page and the cursor of the next page.
+    """
+    page = lookup_users(request.GET.get('q', ''), request.GET.get('after', ''))
+    usernames = [user.username for user in page]
+    item_id = request.GET.get('item', '')
+    item = Item.objects.visible_to(request.user).filter(
+        id=item_id).first() if item_id.isdigit() else None
+    visible = visible_usernames(item, usernames) if item else set()
+    return api_response({"users": [dict({"username": username},
+                                        **({"visible": username in visible} if item else {}))
+                                   for username in usernames],
+                         "next": page.next_cursor if page.has_next else None})
+
+
+@api_login_required
+@require_POST
+def visibility(request: HttpRequest, item_id: int) -> JsonResponse:
+    """Shares an item with, and hides it from, users.
+
+    Takes {"add": [usernames], "remove": [usernames]}; only those users are
+    touched. Only the item's owner may change who sees it.
+
+    Args:
+        request (HttpRequest): HTTP request.
+        item_id (int): Item ID number.
+
+    Returns:
+        JsonResponse: the usernames the change was applied to.
+    """
+    item = Item.objects.visible_to(request.user).select_related('owner').filter(id=item_id).first()
+    if item is None:
+        return api_error("not found", 404)
+    if item.owner_id != request.user.id:
+        return api_error("only the owner can change who sees an item", 403)
+    try:
+        body = read_json(request)
+    except RowError as error:
+        return api_error(str(error))
+    if not isinstance(body, dict):
+        return api_error("expected an object with add and remove lists")
+    add, remove = usernames_in(body.get('add')), usernames_in(body.get('remove'))
+    unknown = (add | remove) - set(User.objects.filter(
+        username__in=add | remove).values_list('username', flat=True))
+    if unknown:
+        return api_error(f"unknown users: {', '.join(sorted(unknown))}")
+    item.update_visibility(add, remove)
+    return api_response({"added": sorted(add - remove), "removed": sorted(remove)})
@@ -0,0 +1,240 @@
+'''
+Moves old ItemHistory out of the live table into per item, per month
+ItemHistoryArchive rows of gzip compressed JSON Lines.
+
+Only whole months older than settings.HISTORY_ARCHIVE_DAYS are archived.
+Rollups are left alone, so insights over long ranges still come from them,
+and the history readers (charts, exports, the item page) merge archived
+changes back in when their range reaches an archived month.
+'''
+
+import gzip
+import heapq
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .caching import invalidate_items
+from .models import ItemHistory, ItemHistoryArchive
+
+# History older than this many days, rounded back to a month start, is archived.
+DEFAULT_ARCHIVE_DAYS = 365
+# Items whose history is archived per transaction.
+ARCHIVE_BATCH_SIZE = 200
+# Ids per DELETE statement, under SQLite's bound parameter limit.
+DELETE_BATCH_SIZE = 500
+# Columns of an archived change; the history import and export format.
+ARCHIVE_COLUMNS = ('item_id', 'date_of_change', 'quantity_before', 'quantity_after',
+                   'price_before', 'price_after')
+
+
+def archive_days() -> int:
+    return getattr(settings, 'HISTORY_ARCHIVE_DAYS', DEFAULT_ARCHIVE_DAYS)
+
+
+def month_start(moment: datetime) -> datetime:
+    """Start of the month containing a moment, in the current time zone."""
+    return timezone.localtime(moment).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def encode(changes: List[Dict[str, Any]]) -> bytes:
+    lines = [json.dumps([change[column].isoformat() if column == 'date_of_change' else change[column]
+                         for column in ARCHIVE_COLUMNS], separators=(',', ':'))
+             for change in changes]
+    return gzip.compress('\n'.join(lines).encode())
+
+
+def decode(data: bytes) -> List[Dict[str, Any]]:
+    """Changes of an archive, as dicts keyed by ARCHIVE_COLUMNS."""
+    changes = []
+    for line in gzip.decompress(bytes(data)).decode().splitlines():
+        change = dict(zip(ARCHIVE_COLUMNS, json.loads(line)))
+        change['date_of_change'] = parse_datetime(change['date_of_change'])
+        changes.append(change)
+    return changes
+
+
+def archives_in(item_ids: Iterable[int], start: Optional[datetime] = None,
+                end: Optional[datetime] = None):
+    """Archives of items holding changes between start and end, either of
+    which may be left open."""
+    archives = ItemHistoryArchive.objects.filter(item_id__in=list(item_ids))
+    if start:
+        archives = archives.filter(last_change__gte=start)
+    if end:
+        archives = archives.filter(first_change__lte=end)
+    return archives
+
+
+def in_range(moment: datetime, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    return (not start or start <= moment) and (not end or moment <= end)
+
+
+def archived_changes(item_id: int, start: Optional[datetime] = None,
+                     end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """An item's archived changes between start and end, oldest first."""
+    changes = [change for archive in archives_in([item_id], start, end).order_by('month')
+               for change in decode(archive.data) if in_range(change['date_of_change'], start, end)]
+    changes.sort(key=lambda change: change['date_of_change'])
+    return changes
+
+
+def archive_stats(item_id: int, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None) -> Dict[str, Any]:
+    """Count, first and last change of the archived months overlapping a range.
+
+    The count covers whole months, so at a range's ends it may include a
+    few changes just outside it.
+    """
+    return archives_in([item_id], start, end).aggregate(
+        count=Sum('row_count'), first=Min('first_change'), last=Max('last_change'))
+
+
+def merge_archived(item_id: int, live: Iterable[Tuple], start: Optional[datetime] = None,
+                   end: Optional[datetime] = None, columns: Tuple[str, ...] = ARCHIVE_COLUMNS,
+                   date_index: int = 1) -> Iterator[Tuple]:
+    """Live history rows with the item's archived changes merged in by date.
+
+    Args:
+        item_id (int): item id.
+        live (Iterable[Tuple]): live rows in date order, with the columns
+            of archived rows.
+        start (datetime, optional): range start.
+        end (datetime, optional): range end.
+        columns (Tuple[str, ...], optional): ARCHIVE_COLUMNS to give archived rows.
+        date_index (int, optional): position of date_of_change in a row.
+
+    Returns:
+        Iterator[Tuple]: all rows, in date order.
+    """
+    archived = [tuple(change[column] for column in columns)
+                for change in archived_changes(item_id, start, end)]
+    if not archived:
+        return iter(live)
+    return heapq.merge(archived, live, key=lambda row: row[date_index])
+
+
+def as_history(change: Dict[str, Any]) -> ItemHistory:
+    """An archived change as an unsaved ItemHistory."""
+    return ItemHistory(item_id_id=change['item_id'],
+                       **{column: change[column] for column in ARCHIVE_COLUMNS[1:]})
+
+
+def latest_archived(item_id: int, limit: int) -> List[ItemHistory]:
+    """An item's newest archived changes, newest first, as unsaved ItemHistory."""
+    changes: List[Dict[str, Any]] = []
+    for archive in ItemHistoryArchive.objects.filter(item_id=item_id).order_by('-month'):
+        changes += decode(archive.data)
+        if len(changes) >= limit:
+            break
+    changes.sort(key=lambda change: change['date_of_change'], reverse=True)
+    return [as_history(change) for change in changes[:limit]]
+
+
+def archived_histories(item_ids: Optional[Iterable[int]] = None) -> Iterator[ItemHistory]:
+    """Archived changes as unsaved ItemHistory in item and date order,
+    decoding one archive at a time."""
+    archives = ItemHistoryArchive.objects.order_by('item_id', 'month')
+    if item_ids is not None:
+        archives = archives.filter(item_id__in=list(item_ids))
+    for archive in archives.iterator():
+        for change in sorted(decode(archive.data), key=lambda change: change['date_of_change']):
+            yield as_history(change)
+
+
+def archive_history(before: Optional[datetime] = None,
+                    item_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+    """Moves ItemHistory of whole months before a cutoff into archives.
+
+    Each batch of items is moved in one transaction: their old changes are
+    read in item and date order, folded into the (item, month) archives,
+    merging with an archive already holding that month, and then deleted by
+    id, so changes written meanwhile are never lost.
+
+    Args:
+        before (datetime, optional): archive months ending by this moment.
+            Defaults to settings.HISTORY_ARCHIVE_DAYS, or 365, days ago.
+        item_ids (Iterable[int], optional): only these items. Defaults to all.
+
+    Returns:
+        Dict[str, int]: rows archived, archives written and items touched.
+    """
+    cutoff = month_start(before or timezone.now() - timedelta(days=archive_days()))
+    old = ItemHistory.objects.filter(item_id__isnull=False, date_of_change__lt=cutoff)
+    if item_ids is not None:
+        old = old.filter(item_id__in=list(item_ids))
+    candidates = sorted(set(old.values_list('item_id', flat=True)))
+    report = {"rows": 0, "archives": 0, "items": 0}
+    for start in range(0, len(candidates), ARCHIVE_BATCH_SIZE):
+        batch = candidates[start:start + ARCHIVE_BATCH_SIZE]
+        with transaction.atomic():
+            rows = list(old.filter(item_id__in=batch).order_by('item_id', 'date_of_change', 'id').values_list(
+                'id', 'item_id', *ARCHIVE_COLUMNS[1:]))
+            months: Dict[Tuple[int, datetime], List[Dict[str, Any]]] = {}
+            for row in rows:
+                change = dict(zip(ARCHIVE_COLUMNS, row[1:]))
+                months.setdefault((change['item_id'], month_start(change['date_of_change'])), []).append(change)
+            report["archives"] += store_months(months)
+            for offset in range(0, len(rows), DELETE_BATCH_SIZE):
+                ItemHistory.objects.filter(id__in=[row[0] for row in rows[offset:offset + DELETE_BATCH_SIZE]]).delete()
+            # Chart versions count live rows, so cached charts and pages are redrawn.
+            invalidate_items(batch)
+        report["rows"] += len(rows)
+        report["items"] += len(batch)
+    return report
+
+
+def store_months(months: Dict[Tuple[int, datetime], List[Dict[str, Any]]]) -> int:
+    """Writes (item, month) changes into their archives, merging with existing ones."""
+    existing = {(archive.item_id, timezone.localtime(archive.month)): archive
+                for archive in ItemHistoryArchive.objects.select_for_update().filter(
+                    item_id__in={item_id for item_id, _ in months},
+                    month__in={month for _, month in months})}
+    created, updated = [], []
+    for (item_id, month), changes in months.items():
+        archive = existing.get((item_id, month))
+        if archive is None:
+            archive = ItemHistoryArchive(item_id=item_id, month=month)
+            created.append(archive)
+        else:
+            changes = sorted(decode(archive.data) + changes, key=lambda change: change['date_of_change'])
+            updated.append(archive)
+        archive.data = encode(changes)
+        archive.row_count = len(changes)
+        archive.first_change = changes[0]['date_of_change']
+        archive.last_change = changes[-1]['date_of_change']
+    ItemHistoryArchive.objects.bulk_create(created, batch_size=100)
+    ItemHistoryArchive.objects.bulk_update(updated, ['data', 'row_count', 'first_change', 'last_change'],
+                                           batch_size=100)
+    return len(created) + len(updated)
+
+
+def restore_history(item_ids: Optional[Iterable[int]] = None) -> int:
+    """Moves archived changes back into ItemHistory, the reverse of archive_history.
+
+    Args:
+        item_ids (Iterable[int], optional): only these items. Defaults to all.
+
+    Returns:
+        int: rows restored.
+    """
+    archives = ItemHistoryArchive.objects.all()
+    if item_ids is not None:
+        archives = archives.filter(item_id__in=list(item_ids))
+    restored = 0
+    touched: Set[int] = set()
+    with transaction.atomic():
+        for archive in archives.select_for_update().iterator():
+            changes = decode(archive.data)
+            ItemHistory.objects.bulk_create([as_history(change) for change in changes], batch_size=1000)
+            restored += len(changes)
+            touched.add(archive.item_id)
+        archives.delete()
+    invalidate_items(touched)
+    return restored
@@ -0,0 +1,164 @@
+'''
+Async versions of the inventory, insights and chart views, routed instead
+of the sync ones when settings.ASYNC_VIEWS is on, for serving through
+webventory/asgi.py.
+
+On a cache miss a page's independent queries run at once, each in a worker
+thread with its own database connection, so the page waits for its slowest
+query rather than for all of them in turn. The event loop never blocks:
+loading the session user, the cache and template rendering run in worker
+threads too, and a chart request awaits the chart worker pool instead of
+holding a thread while the chart is drawn.
+'''
+
+import asyncio
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from functools import wraps
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections
+from django.http import HttpRequest, HttpResponse
+
+from .caching import UserCache
+from .chartpool import ChartCancelled, chart_wait
+from .charts import CHART_FORMATS, chart_urls
+from .decorators import replica_reads
+from .models import InventoryValuation, User
+from .pagination import paginate
+from .views import (chart_job, chart_not_drawn, chart_response, insights_context, insights_item,
+                    insights_range, inventory_context, inventory_item, inventory_page,
+                    recent_history, render_insights, render_inventory, table_items)
+
+
+def in_thread(function: Callable[..., Any], *args: Any) -> Awaitable[Any]:
+    """Runs function(*args) in a worker thread of the event loop's executor.
+
+    Unlike sync_to_async's default, calls are not funnelled through one
+    shared thread, so several can query the database at the same time.
+    Afterwards the thread's connection is closed if it has outlived
+    CONN_MAX_AGE, as a request's connection would be.
+    """
+    def call() -> Any:
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+def async_login_required(view_function: Callable[..., Awaitable[HttpResponse]]) -> Callable[..., Awaitable[HttpResponse]]:
+    """
+    async_login_required login_required for async views, loading the session user in a worker thread
+    """
+    @wraps(view_function)
+    async def wrapper(request, *args, **kwargs):
+        if not await in_thread(lambda: request.user.is_authenticated):
+            return redirect_to_login(request.get_full_path(), '/login')
+        return await view_function(request, *args, **kwargs)
+    return wrapper
+
+
+def cached_entry(user: User, name: str, parts: tuple) -> Tuple[UserCache, Optional[dict]]:
+    """The user's cache and its entry for a page, None on a miss."""
+    user_cache = UserCache(user)
+    return user_cache, user_cache.get(name, parts)
+
+
+def store_and_render(user_cache: UserCache, name: str, parts: tuple, context: dict,
+                     render_page: Callable[..., HttpResponse], *args: Any) -> HttpResponse:
+    """Caches a page's data and renders the page, in one trip to a worker thread."""
+    user_cache.set(name, parts, context)
+    return render_page(*args)
+
+
+@replica_reads
+@async_login_required
+async def user_inventory(request: HttpRequest, item_id=0, item_range=0, delError=0) -> HttpResponse:
+    """Inventory page, reading the item list, the item, its history and the
+    user's total assets at once.
+
+    Args:
+        request (HttpRequest): HTTP request.
+        item_id (int, optional): item detailed on the page, 0 for none.
+        item_range (int, optional): keyset cursor, the item id the page starts after.
+        delError (int, optional): 1 after a refused delete.
+
+    Returns:
+        HttpResponse: userHomeInventory.html.
+    """
+    query = request.POST.get('search') or request.GET.get('q', '')
+    parts = (item_id, item_range, query, request.GET.urlencode())
+    user_cache, context = await in_thread(cached_entry, request.user, 'inventory', parts)
+    if context is None:
+        # The history is read alongside the item, and dropped if the user may not see it.
+        item, page, histories, total_assets = await asyncio.gather(
+            in_thread(inventory_item, request.user, item_id),
+            in_thread(inventory_page, request, item_range, query),
+            in_thread(recent_history, item_id) if item_id else in_thread(list),
+            in_thread(InventoryValuation.total_assets_for, request.user))
+        context = inventory_context(page, item, histories, total_assets, item_range, query)
+        return await in_thread(store_and_render, user_cache, 'inventory', parts, context, render_inventory,
+                               request, context, user_cache, parts, item_id, delError, query)
+    return await in_thread(render_inventory, request, context, user_cache, parts, item_id,
+                           delError, query)
+
+
+@replica_reads
+@async_login_required
+async def user_insights(request: HttpRequest, item_id=0, item_range=0) -> HttpResponse:
+    """Insights page, reading the item list, the item and its chart URLs at once.
+
+    Args:
+        request (HttpRequest): request, may post startDate and endDate.
+        item_id (int, optional): item charted, 0 for none.
+        item_range (int, optional): keyset cursor, the item id the page starts after.
+
+    Returns:
+        HttpResponse: userHomeInsights.html.
+    """
+    start_date, end_date = insights_range(request)
+    parts = (item_id, item_range, request.GET.urlencode(), start_date, end_date)
+    user_cache, context = await in_thread(cached_entry, request.user, 'insights', parts)
+    if context is None:
+        # The chart URLs are worked out alongside the item, and dropped if the user may not see it.
+        items, item, graphs = await asyncio.gather(
+            in_thread(paginate, request, table_items(request.user), item_range),
+            in_thread(insights_item, request.user, item_id),
+            in_thread(chart_urls, item_id, start_date, end_date) if item_id else in_thread(dict))
+        context = insights_context(items, item, graphs if item is not None else {})
+        return await in_thread(store_and_render, user_cache, 'insights', parts, context, render_insights,
+                               request, context, user_cache, parts, item_id)
+    return await in_thread(render_insights, request, context, user_cache, parts, item_id)
+
+
+@replica_reads
+@async_login_required
+async def item_chart(request: HttpRequest, item_id: int, metric: str, digest: str,
+                     fmt: str) -> HttpResponse:
+    """Insights chart image, awaiting the chart workers without holding a thread.
+
+    Args:
+        request (HttpRequest): request, may carry ?start= and ?end= dates.
+        item_id (int): item id number.
+        metric (str): "price" or "quantity".
+        digest (str): content hash of the chart the URL was issued for.
+        fmt (str): "png" or "svg".
+
+    Returns:
+        HttpResponse: as views.item_chart.
+    """
+    outcome = await in_thread(chart_job, request, item_id, metric, digest, fmt)
+    if isinstance(outcome, HttpResponse):
+        return outcome
+    current_digest, job = outcome
+    try:
+        # Shielded, as other requests may be waiting on the same job.
+        image = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job)), chart_wait())
+    except asyncio.TimeoutError:
+        return chart_not_drawn(futures.TimeoutError())
+    except (MemoryError, BrokenProcessPool, ChartCancelled) as error:
+        return chart_not_drawn(error)
+    return chart_response(HttpResponse(image, content_type=CHART_FORMATS[fmt]), current_digest)
@@ -0,0 +1,46 @@
+from typing import Any, Dict, Optional, Tuple
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .caching import cache_timeout
+
+
+def user_key(user_id: Any) -> str:
+    return f'auth-user:{user_id}'
+
+
+def forget_user(user_id: Any) -> None:
+    cache.delete(user_key(user_id))
+
+
+def cached_fields(user: Any) -> Tuple[str, Dict[str, Any]]:
+    """What the cache keeps of a User: its session auth hash and every
+    field but the password hash, which never leaves the database."""
+    return user.get_session_auth_hash(), {field.attname: getattr(user, field.attname)
+                                          for field in user._meta.concrete_fields
+                                          if field.attname != 'password'}
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that loads the logged in user of each request from the cache.
+
+    With cached sessions this lets a request for a cached page be served
+    without touching the database. The cached copy is dropped whenever the
+    User is saved or deleted. It lacks the password, which is loaded from
+    the database if something reads it.
+    """
+
+    def get_user(self, user_id: Any) -> Optional[Any]:
+        cached = cache.get(user_key(user_id))
+        if cached is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(user_key(user_id), cached_fields(user), cache_timeout())
+            return user
+        session_auth_hash, values = cached
+        user = get_user_model().from_db(DEFAULT_DB_ALIAS, list(values), list(values.values()))
+        user._session_auth_hash = session_auth_hash
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,745 @@
+'''
+Benchmark suites for Webventory.
+run with "python webventory/manage.py benchmark <suite>"
+
+Suites create their data inside a transaction that is rolled back, so
+they can be run against any database without leaving rows behind. The
+concurrent writer suite has to commit, and deletes its rows afterwards.
+'''
+
+import asyncio
+import io
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .backends import forget_user
+from .caching import bump_versions
+from .charts import chart_cache, chart_urls, point_budget
+from .deletion import delete_items, purge_pending
+from .figures import graph
+from .gen_mock_data import generate_mock_data
+from .importer import insert_items
+from .models import Item, ItemHistory, ItemVisibility, User
+from .search import search_items
+from .series import extract_series, lttb
+
+# Suite name to benchmark function, filled by the @suite decorator.
+SUITES: Dict[str, Callable[..., Dict[str, Any]]] = {}
+# Routes that change data on GET or only answer POST, which the views suite skips.
+SKIPPED_ROUTES = {'logout', 'userInventory/delete', 'userInventory/<int:item_id>/delete',
+                  'userInventory/<int:item_id>/<int:item_range>/delete',
+                  'api/items/adjust', 'api/items/<int:item_id>/visibility'}
+# Values for the URL parameters of the routes the views suite requests.
+ROUTE_ARGUMENTS = {'item_range': 0, 'delError': 1, 'fmt': 'csv'}
+ROUTE_PARAMETER = re.compile(r'<(?:\w+:)?(\w+)>')
+# Wraps settings.TEMPLATE_LOADERS, compiling each template once per process.
+CACHED_LOADER = 'django.template.loaders.cached.Loader'
+# SQLite database profiles the profiles suite compares, from settings.DATABASE_PROFILES.
+SQLITE_PROFILES = ('sqlite-basic', 'sqlite')
+# Packages only charts and analytics need, which must not load at startup.
+HEAVY_MODULES = ('numpy', 'matplotlib', 'openpyxl')
+# What the startup suite starts, each in a fresh interpreter: a management
+# command, and a web worker importing the WSGI app and every view.
+STARTUP_PROBES = {
+    'check': "from django.core.management import call_command; call_command('check', verbosity=0)",
+    'wsgi': "from webventory.wsgi import application; from django.urls import get_resolver; "
+            "get_resolver().url_patterns",
+}
+STARTUP_SCRIPT = """
+import json, os, resource, sys
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webventory.settings')
+import django
+django.setup()
+{probe}
+print(json.dumps({{"peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "heavy_modules": sorted(name for name in {heavy!r} if name in sys.modules)}}))
+"""
+
+
+def suite(name: str) -> Callable:
+    """Registers a benchmark function under a suite name."""
+    def register(function: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+        SUITES[name] = function
+        return function
+    return register
+
+
+def measure(function: Callable[[], Any], repeat: int,
+            before: Callable[[], Any] = lambda: None) -> Dict[str, float]:
+    """Runs function repeat times and summarizes its wall time in milliseconds.
+
+    Args:
+        function (Callable[[], Any]): code to time.
+        repeat (int): runs.
+        before (Callable[[], Any], optional): untimed setup before each run.
+    """
+    timings: List[float] = []
+    for _ in range(repeat):
+        before()
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return summarize(timings)
+
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    """Minimum, median, tail percentiles and maximum of timings in milliseconds."""
+    timings = sorted(timings)
+
+    def percentile(quantile: float) -> float:
+        return timings[min(len(timings) - 1, int(len(timings) * quantile))]
+
+    return {"min_ms": timings[0],
+            "median_ms": statistics.median(timings),
+            "p90_ms": percentile(0.9),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": timings[-1]}
+
+
+@contextmanager
+def rolled_back():
+    """Runs the block in a transaction that is always rolled back."""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def create_history_rows(item: Item, rows: int) -> None:
+    start = timezone.now() - timedelta(minutes=rows)
+    ItemHistory.objects.bulk_create([
+        ItemHistory(item_id=item, date_of_change=start + timedelta(minutes=row),
+                    quantity_before=row, quantity_after=row % 500,
+                    price_before=row, price_after=(row % 97) / 4)
+        for row in range(rows)], batch_size=1000)
+
+
+def legacy_history_loop(item: Item) -> tuple:
+    """The per-row np.append loop user_insights used to build its chart series."""
+    date_change = np.array([], dtype=str)
+    price_change = np.array([], dtype=np.float32)
+    quantity_change = np.array([], dtype=np.int32)
+    for item_iter in ItemHistory.objects.filter(item_id=item).select_related():
+        if item_iter.date_of_change:
+            date_change = np.append(date_change,
+                                    item_iter.date_of_change.strftime('%m-%d %I:%M %p'))
+        if item_iter.price_after:
+            price_change = np.append(price_change, item_iter.price_after)
+        if item_iter.quantity_after:
+            quantity_change = np.append(quantity_change, item_iter.quantity_after)
+    return date_change, price_change, quantity_change
+
+
+def vectorized_history_series(item: Item) -> tuple:
+    series = extract_series(ItemHistory.objects.filter(item_id=item).order_by(
+        'date_of_change', 'id'), ['price_after', 'quantity_after'])
+    return series.points('price_after'), series.points('quantity_after')
+
+
+@suite('series')
+def series_benchmark(rows: int = 10000, repeat: int = 3) -> Dict[str, Any]:
+    """Compares the legacy np.append history loop with extract_series.
+
+    Args:
+        rows (int, optional): history rows of the charted item. Defaults to 10000.
+        repeat (int, optional): runs per implementation. Defaults to 3.
+
+    Returns:
+        Dict[str, Any]: timings of each implementation.
+    """
+    with rolled_back():
+        owner = User.objects.create_user(username='benchmark-series')
+        item = Item.objects.create(name='benchmark', description='benchmark',
+                                   quantity=0, price=0, owner=owner)
+        ItemVisibility.objects.create(item=item, user=owner)
+        create_history_rows(item, rows)
+        legacy = measure(lambda: legacy_history_loop(item), repeat)
+        vectorized = measure(lambda: vectorized_history_series(item), repeat)
+    return {"rows": rows, "legacy": legacy, "vectorized": vectorized,
+            "speedup": legacy["median_ms"] / vectorized["median_ms"]}
+
+
+@suite('chart')
+def chart_benchmark(rows: int = 50000, repeat: int = 3) -> Dict[str, Any]:
+    """Compares rendering a full history chart with rendering a downsampled one.
+
+    Args:
+        rows (int, optional): points in the synthetic history. Defaults to 50000.
+        repeat (int, optional): renders per variant. Defaults to 3.
+
+    Returns:
+        Dict[str, Any]: timings and image sizes of each variant.
+    """
+    dates = (np.arange(rows, dtype=np.int64) * 60_000_000).view('datetime64[us]')
+    prices = 10 + np.cumsum(np.random.default_rng(0).normal(0, 0.1, rows))
+    sampled_dates, sampled_prices = lttb(dates, prices, point_budget())
+    full = measure(lambda: graph(dates, prices, True), repeat)
+    downsampled = measure(lambda: graph(sampled_dates, sampled_prices, True), repeat)
+    return {"rows": rows, "points": len(sampled_dates),
+            "full": dict(full, bytes=len(graph(dates, prices, True))),
+            "downsampled": dict(downsampled, bytes=len(graph(sampled_dates, sampled_prices, True)))}
+
+
+@suite('search')
+def search_benchmark(items: int = 100000, repeat: int = 20, query: str = 'gear 12') -> Dict[str, Any]:
+    """Compares indexed item search with the substring scan it replaced.
+
+    Args:
+        items (int, optional): items visible to the searching user. Defaults to 100000.
+        repeat (int, optional): searches per implementation. Defaults to 20.
+        query (str, optional): search text. Defaults to 'gear 12'.
+
+    Returns:
+        Dict[str, Any]: timings of each implementation.
+    """
+    words = ('gear', 'bolt', 'valve', 'spring', 'bracket', 'hinge', 'pulley', 'rivet')
+    with rolled_back():
+        owner = User.objects.create_user(username='benchmark-search')
+        for start in range(0, items, 10000):
+            chunk = [Item(name=f"{words[row % len(words)]} {row}",
+                          description=f"{words[row // len(words) % len(words)]} part number {row}",
+                          quantity=row % 100, price=row % 1000, owner=owner)
+                     for row in range(start, min(start + 10000, items))]
+            insert_items(chunk, 1000)
+            ItemVisibility.objects.bulk_create(
+                [ItemVisibility(item_id=item.id, user=owner) for item in chunk], batch_size=1000)
+        indexed = measure(lambda: list(search_items(owner, query)), repeat)
+        substring = measure(lambda: list(Item.objects.visible_to(owner).filter(
+            name__contains=query).order_by('id')[:10]), repeat)
+    return {"items": items, "query": query, "indexed": indexed, "substring": substring}
+
+
+def view_urls(item_id: int) -> Dict[str, str]:
+    """A URL for each route in home.urls that is safe to GET, about item_id."""
+    from .urls import urlpatterns
+
+    arguments = dict(ROUTE_ARGUMENTS, item_id=item_id)
+    urls: Dict[str, str] = {}
+    for pattern in urlpatterns:
+        route = str(pattern.pattern)
+        if route in SKIPPED_ROUTES or route in urls:
+            continue
+        if 'digest' in pattern.pattern.converters:
+            # Chart URLs carry a content hash, so take a real one.
+            chart = chart_urls(item_id).get('price')
+            if chart:
+                urls[route] = chart
+            continue
+        urls[route] = '/' + ROUTE_PARAMETER.sub(lambda match: str(arguments[match.group(1)]), route)
+    return urls
+
+
+def profile_view(client: Client, url: str, user_id: int, repeat: int) -> Dict[str, Any]:
+    """Latency, queries and peak memory of GET url, with cold and warm caches."""
+
+    def get() -> None:
+        client.get(url)
+
+    def expire() -> None:
+        bump_versions([user_id])
+        forget_user(user_id)
+        chart_cache.clear()
+
+    # CaptureQueriesContext counts by the growth of a bounded log, which
+    # generating the data has filled.
+    connection.queries_log.clear()
+    expire()
+    with CaptureQueriesContext(connection) as cold_queries:
+        status = client.get(url).status_code
+    with CaptureQueriesContext(connection) as warm_queries:
+        client.get(url)
+    expire()
+    tracemalloc.start()
+    try:
+        get()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"url": url, "status": status,
+            "cold": dict(measure(get, repeat, expire), queries=len(cold_queries)),
+            "warm": dict(measure(get, repeat), queries=len(warm_queries)),
+            "peak_kib": round(peak / 1024, 1)}
+
+
+@suite('views')
+def views_benchmark(users: int = 10, items: int = 100, history: int = 25, shares: int = 1,
+                    repeat: int = 20) -> Dict[str, Any]:
+    """Requests every page and API endpoint with the test client.
+
+    Each URL is timed with the user's cached pages expired before every
+    request (cold) and reused (warm); the query counts and the peak memory
+    traced by tracemalloc come from single requests.
+
+    Args:
+        users (int, optional): generated users. Defaults to 10.
+        items (int, optional): items owned by each user. Defaults to 100.
+        history (int, optional): history rows per item. Defaults to 25.
+        shares (int, optional): other users each item is shared with. Defaults to 1.
+        repeat (int, optional): requests per URL and cache state. Defaults to 20.
+
+    Returns:
+        Dict[str, Any]: data sizes, and the measurements of each route.
+    """
+    with rolled_back():
+        created = generate_mock_data(users, items, history, shares, prefix='benchmark-views')
+        user = User.objects.get(id=created['user_ids'][0])
+        # Staff, so the metrics page is measured too.
+        user.is_staff = True
+        user.save()
+        item_id = Item.objects.owned_by(user).order_by('id').values_list('id', flat=True).first()
+        client = Client()
+        client.force_login(user)
+        routes = {route: profile_view(client, url, user.id, repeat)
+                  for route, url in view_urls(item_id).items()}
+    return {"users": users, "items": items, "history": history, "shares": shares, "routes": routes}
+
+
+def delete_users(user_ids: List[int]) -> None:
+    """Deletes committed benchmark users and their items, long histories included."""
+    for user in User.objects.filter(id__in=user_ids):
+        delete_items(user, Item.objects.owned_by(user).values_list('id', flat=True))
+    # Finishes the background purges now, as the users cannot go before their items.
+    purge_pending()
+    for user in User.objects.filter(id__in=user_ids):
+        user.delete()
+
+
+@contextmanager
+def captured_contexts():
+    """Collects the flattened context of every template rendered in the block, by name.
+
+    Rendering is instrumented the way the test runner does it, so included
+    templates are captured with the context they were rendered with.
+    """
+    from django.template import Template
+    from django.test.signals import template_rendered
+    from django.test.utils import instrumented_test_render
+
+    contexts: Dict[str, Dict[str, Any]] = {}
+
+    def store(sender: Any, template: Any, context: Any, **kwargs: Any) -> None:
+        if template.origin.template_name:
+            contexts[template.origin.template_name] = context.flatten()
+
+    original = Template._render
+    Template._render = instrumented_test_render
+    template_rendered.connect(store)
+    try:
+        yield contexts
+    finally:
+        Template._render = original
+        template_rendered.disconnect(store)
+
+
+def template_engines() -> Dict[str, Any]:
+    """The configured template engine, built once with and once without the cached loader."""
+    from django.template.backends.django import DjangoTemplates
+
+    configured = settings.TEMPLATES[0]
+    engines = {}
+    loaders = settings.TEMPLATE_LOADERS
+    for name, loaders in (('uncached', loaders), ('cached', [(CACHED_LOADER, loaders)])):
+        engines[name] = DjangoTemplates({
+            'NAME': f'benchmark-{name}', 'DIRS': configured['DIRS'], 'APP_DIRS': False,
+            'OPTIONS': dict(configured['OPTIONS'], loaders=loaders)})
+    return engines
+
+
+@suite('templates')
+def templates_benchmark(items: int = 100, history: int = 25, repeat: int = 50) -> Dict[str, Any]:
+    """Render time of each template, with and without the cached template loader.
+
+    Every page is requested once, logged in and anonymous, to capture the
+    context each template, included ones too, was rendered with. Each
+    template is then rendered alone from that context: its time includes
+    loading it and its includes, which the cached loader does once per
+    process, and the queries counted are those run while rendering, which
+    should be none.
+
+    Args:
+        items (int, optional): items owned by each of the 3 users. Defaults to 100.
+        history (int, optional): history rows per item. Defaults to 25.
+        repeat (int, optional): renders per template and loader. Defaults to 50.
+
+    Returns:
+        Dict[str, Any]: per template, render time with each loader and the
+        queries run while rendering.
+    """
+    with rolled_back():
+        created = generate_mock_data(3, items, history, 1, prefix='benchmark-templates')
+        user = User.objects.get(id=created['user_ids'][0])
+        user.is_staff = True
+        user.save()
+        item_id = Item.objects.owned_by(user).order_by('id').values_list('id', flat=True).first()
+        client = Client()
+        client.force_login(user)
+        with captured_contexts() as contexts:
+            for url in view_urls(item_id).values():
+                client.get(url)
+                Client().get(url)
+        engines = template_engines()
+        results = {}
+        for name, context in sorted(contexts.items()):
+            request = context.pop('request', None)
+            # Fresh tokens and perms are added again by the context processors.
+            for processed in ('csrf_token', 'perms', 'user', 'messages', 'DEFAULT_MESSAGE_LEVELS'):
+                context.pop(processed, None)
+
+            def render(engine: Any) -> None:
+                engine.get_template(name).render(context, request)
+
+            with CaptureQueriesContext(connection) as queries:
+                render(engines['uncached'])
+            results[name] = {engine: measure(lambda: render(engines[engine]), repeat) for engine in engines}
+            results[name]["queries"] = len(queries)
+    return results
+
+
+def write_concurrently(user_ids: List[int], writes: int) -> Dict[str, Any]:
+    """Each user creates and edits items through the views, in a thread per user.
+
+    Every request starts and ends like one served by a real server, so the
+    database profile's persistent connections are reused or not.
+
+    Returns:
+        Dict[str, Any]: the latency of each write, writes that failed with
+        an OperationalError such as "database is locked", and wall time.
+    """
+    timings: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+
+    def writer(user_id: int) -> None:
+        client = Client()
+        client.force_login(User.objects.get(id=user_id))
+        item_id = None
+        try:
+            for write in range(writes):
+                close_old_connections()
+                started = time.perf_counter()
+                try:
+                    if item_id is None or write % 2 == 0:
+                        client.post('/create', {"name": f"writer {write}", "description": "benchmark",
+                                                "price": "1.00", "quantity": write})
+                        item_id = Item.objects.owned_by(user_id).order_by('-id').values_list(
+                            'id', flat=True).first()
+                    else:
+                        version = Item.objects.filter(id=item_id).values_list('version', flat=True).get()
+                        client.post(f'/userInventory/{item_id}/edit', {
+                            "name": f"writer {write}", "description": "benchmark", "price": "2.00",
+                            "quantity": write, "version": version})
+                except OperationalError as error:
+                    with lock:
+                        errors.append(str(error))
+                    continue
+                finally:
+                    close_old_connections()
+                with lock:
+                    timings.append((time.perf_counter() - started) * 1000)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=writer, args=(user_id,)) for user_id in user_ids]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"seconds": time.perf_counter() - started, "timings": timings, "errors": errors}
+
+
+@suite('writes')
+def writes_benchmark(writers: int = 8, writes: int = 50) -> Dict[str, Any]:
+    """Concurrent item creates and edits against the configured database.
+
+    The writes are committed, as other connections must see them, and the
+    users and items are deleted afterwards.
+
+    Args:
+        writers (int, optional): concurrent users, a thread each. Defaults to 8.
+        writes (int, optional): writes per user, alternately a create and an edit. Defaults to 50.
+
+    Returns:
+        Dict[str, Any]: throughput, failed writes and write latency.
+    """
+    user_ids = [User.objects.create_user(username=f'benchmark-writer{number}', password='x').id
+                for number in range(writers)]
+    try:
+        run = write_concurrently(user_ids, writes)
+    finally:
+        delete_users(user_ids)
+    return {"profile": getattr(settings, 'DATABASE_PROFILE', None), "writers": writers, "writes": writes,
+            "writes_per_second": len(run["timings"]) / run["seconds"],
+            "errors": len(run["errors"]), "error_messages": sorted(set(run["errors"])),
+            "latency": summarize(run["timings"]) if run["timings"] else None}
+
+
+@suite('profiles')
+def profiles_benchmark(writers: int = 8, writes: int = 50) -> Dict[str, Any]:
+    """Runs the writes suite under each SQLite database profile.
+
+    Each profile gets a fresh, migrated database file in a child process, so
+    the configured database is not touched.
+
+    Args:
+        writers (int, optional): concurrent users. Defaults to 8.
+        writes (int, optional): writes per user. Defaults to 50.
+
+    Returns:
+        Dict[str, Any]: the writes suite's results per profile.
+    """
+    manage = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py')]
+    results = {}
+    for profile in SQLITE_PROFILES:
+        with tempfile.TemporaryDirectory() as directory:
+            environ = dict(os.environ, DATABASE_PROFILE=profile,
+                           DATABASE_NAME=os.path.join(directory, 'writers.sqlite3'))
+            subprocess.run([*manage, 'migrate', '-v', '0'], env=environ, check=True)
+            output = subprocess.run([*manage, 'benchmark', 'writes', '-o', f'writers={writers}',
+                                     '-o', f'writes={writes}'], env=environ, check=True,
+                                    capture_output=True, text=True).stdout
+            results[profile] = json.loads(output)['writes']
+    return results
+
+
+def request_environ(path: str, cookie: str) -> Dict[str, Any]:
+    """WSGI environ of a GET request for path carrying cookie."""
+    return {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'testserver', 'HTTP_COOKIE': cookie, 'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False}
+
+
+def request_scope(path: str, cookie: str) -> Dict[str, Any]:
+    """ASGI scope of a GET request for path carrying cookie."""
+    return {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'root_path': '', 'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 0), 'server': ('testserver', 80)}
+
+
+def serve_wsgi(clients: List[Tuple[str, List[str]]], before: Callable[[str], Any]) -> Dict[str, Any]:
+    """Serves each client's requests through Django's WSGI handler, a thread per client."""
+    handler = WSGIHandler()
+    timings: List[float] = []
+    statuses: List[str] = []
+    lock = threading.Lock()
+
+    def client(cookie: str, paths: List[str]) -> None:
+        try:
+            for path in paths:
+                before(cookie)
+                started = time.perf_counter()
+                status: List[str] = []
+                body = handler(request_environ(path, cookie), lambda code, headers: status.append(code))
+                b''.join(body)
+                body.close()
+                with lock:
+                    timings.append((time.perf_counter() - started) * 1000)
+                    statuses.append(status[0])
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=client, args=arguments) for arguments in clients]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {"seconds": time.perf_counter() - started, "timings": timings,
+            "errors": [status for status in statuses if not status.startswith('200')]}
+
+
+def serve_asgi(clients: List[Tuple[str, List[str]]], before: Callable[[str], Any]) -> Dict[str, Any]:
+    """Serves each client's requests through Django's ASGI handler, on one event loop."""
+    handler = ASGIHandler()
+    timings: List[float] = []
+    statuses: List[int] = []
+
+    async def receive() -> Dict[str, Any]:
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def client(cookie: str, paths: List[str]) -> None:
+        for path in paths:
+            before(cookie)
+            started = time.perf_counter()
+            messages: List[Dict[str, Any]] = []
+
+            async def send(message: Dict[str, Any]) -> None:
+                messages.append(message)
+
+            await handler(request_scope(path, cookie), receive, send)
+            timings.append((time.perf_counter() - started) * 1000)
+            statuses.append(messages[0]['status'])
+
+    async def serve() -> None:
+        await asyncio.gather(*(client(*arguments) for arguments in clients))
+
+    started = time.perf_counter()
+    asyncio.run(serve())
+    return {"seconds": time.perf_counter() - started, "timings": timings,
+            "errors": [status for status in statuses if status != 200]}
+
+
+@suite('serving')
+def serving_benchmark(clients: int = 8, requests: int = 40, items: int = 100,
+                      history: int = 25) -> Dict[str, Any]:
+    """Concurrent inventory and insights page requests in this process.
+
+    With settings.ASYNC_VIEWS the requests go through the ASGI handler on
+    one event loop, otherwise through the WSGI handler from a thread per
+    client, as a single worker of either kind of server would serve them.
+    Each user's cached pages are expired before every request, so all of
+    them read the database. The data is committed, as the handlers' own
+    connections must see it, and deleted afterwards.
+
+    Args:
+        clients (int, optional): concurrent clients, each a user. Defaults to 8.
+        requests (int, optional): requests per client. Defaults to 40.
+        items (int, optional): items owned by each user. Defaults to 100.
+        history (int, optional): history rows per item. Defaults to 25.
+
+    Returns:
+        Dict[str, Any]: throughput, failed requests and latency.
+    """
+    created = generate_mock_data(clients, items, history, 1, prefix='benchmark-serving')
+    try:
+        users = {}
+        for user in User.objects.filter(id__in=created['user_ids']):
+            client = Client()
+            client.force_login(user)
+            cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+            item_ids = list(Item.objects.owned_by(user).order_by('id').values_list('id', flat=True))
+            users[cookie] = (user.id, [f'/userInventory/{item_ids[number % len(item_ids)]}/'
+                                       if number % 2 == 0 else
+                                       f'/userInsights/{item_ids[number % len(item_ids)]}/'
+                                       for number in range(requests)])
+        serve = serve_asgi if getattr(settings, 'ASYNC_VIEWS', False) else serve_wsgi
+        run = serve([(cookie, paths) for cookie, (_, paths) in users.items()],
+                    lambda cookie: bump_versions([users[cookie][0]]))
+    finally:
+        delete_users(created['user_ids'])
+    return {"server": "asgi" if serve is serve_asgi else "wsgi", "clients": clients,
+            "requests": requests, "requests_per_second": len(run["timings"]) / run["seconds"],
+            "errors": len(run["errors"]), "latency": summarize(run["timings"])}
+
+
+@suite('asgi')
+def asgi_benchmark(clients: int = 8, requests: int = 40) -> Dict[str, Any]:
+    """Runs the serving suite under WSGI with the sync views and under ASGI
+    with the async views, each in a child process.
+
+    Args:
+        clients (int, optional): concurrent clients. Defaults to 8.
+        requests (int, optional): requests per client. Defaults to 40.
+
+    Returns:
+        Dict[str, Any]: the serving suite's results per server.
+    """
+    manage = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py')]
+    results = {}
+    for server, async_views in (('wsgi', 'False'), ('asgi', 'True')):
+        output = subprocess.run([*manage, 'benchmark', 'serving', '-o', f'clients={clients}',
+                                 '-o', f'requests={requests}'], env=dict(os.environ, ASYNC_VIEWS=async_views),
+                                check=True, capture_output=True, text=True).stdout
+        results[server] = json.loads(output)['serving']
+    return results
+
+
+def start(probe: str) -> Dict[str, Any]:
+    """Wall time, peak RSS and heavy modules loaded of one fresh interpreter running a startup probe."""
+    # Importing the WSGI app needs a secret key, which nothing here signs with.
+    environ = dict(os.environ, SECRET_KEY=os.environ.get('SECRET_KEY') or 'startup-benchmark')
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT.format(
+        probe=STARTUP_PROBES[probe], heavy=HEAVY_MODULES)], cwd=settings.BASE_DIR, env=environ,
+        check=True, capture_output=True, text=True).stdout
+    return dict(json.loads(output.splitlines()[-1]), ms=(time.perf_counter() - started) * 1000)
+
+
+@suite('startup')
+def startup_benchmark(repeat: int = 5) -> Dict[str, Any]:
+    """Startup time and memory of a management command and of a web worker.
+
+    Each probe runs in a fresh Python process, interpreter start included.
+    With --compare, a slower median, a peak RSS grown by more than the
+    tolerance, or any heavy module loaded at startup is a regression.
+
+    Args:
+        repeat (int, optional): processes started per probe. Defaults to 5.
+
+    Returns:
+        Dict[str, Any]: per probe, wall time, the highest peak RSS and the
+        heavy modules loaded.
+    """
+    results = {}
+    for probe in STARTUP_PROBES:
+        runs = [start(probe) for _ in range(repeat)]
+        results[probe] = dict(summarize([run["ms"] for run in runs]),
+                              peak_rss_mib=max(run["peak_rss_mib"] for run in runs),
+                              heavy_modules=len(runs[-1]["heavy_modules"]),
+                              heavy_module_names=runs[-1]["heavy_modules"])
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    """What a result was measured on, so runs can be told apart."""
+    import platform
+
+    import django
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "measured_at": timezone.now().isoformat(),
+            "python": platform.python_version(), "django": django.get_version(),
+            "database": connection.vendor, "database_profile": getattr(settings, 'DATABASE_PROFILE', None),
+            "async_views": getattr(settings, 'ASYNC_VIEWS', False)}
+
+
+def regressions(baseline: Any, current: Any, tolerance: float, path: str = '') -> List[str]:
+    """Measurements in current that are worse than in baseline.
+
+    A median timing or peak memory regresses when it grows by more than
+    tolerance, a fraction; a query or heavy module count regresses when it
+    grows at all. Tail percentiles of a few runs are too noisy to compare.
+
+    Returns:
+        List[str]: one line per regression, e.g.
+        "views.routes.userInventory/.cold.queries: 7 -> 9".
+    """
+    found: List[str] = []
+    if isinstance(baseline, dict) and isinstance(current, dict):
+        for key in baseline.keys() & current.keys():
+            found += regressions(baseline[key], current[key], tolerance, f'{path}.{key}' if path else key)
+        return sorted(found)
+    if not isinstance(baseline, (int, float)) or not isinstance(current, (int, float)):
+        return found
+    key = path.rsplit('.', 1)[-1]
+    if (key in ('median_ms', 'peak_rss_mib') and current > baseline * (1 + tolerance)
+            or key in ('queries', 'heavy_modules') and current > baseline):
+        found.append(f"{path}: {baseline:g} -> {current:g}")
+    return sorted(found)
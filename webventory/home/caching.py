@@ -0,0 +1,109 @@
+import hashlib
+import uuid
+from typing import Any, Callable, Hashable, Iterable, Optional, Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import ItemVisibility
+from .routers import current_routing
+
+# Seconds cached page data and fragments live, unless invalidated first.
+DEFAULT_TIMEOUT = 600
+
+
+def cache_timeout() -> int:
+    return getattr(settings, 'INVENTORY_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def version_key(user_id: int) -> str:
+    return f'inventory-version:{user_id}'
+
+
+def bump_versions(user_ids: Iterable[Optional[int]]) -> None:
+    """Gives each user a new inventory version, orphaning everything cached for them.
+
+    Versions are bumped at once and again when the surrounding transaction
+    commits, since a request running in between may have cached the old
+    rows under the first new version.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return
+
+    def bump() -> None:
+        cache.set_many({version_key(user_id): uuid.uuid4().hex for user_id in user_ids},
+                       timeout=None)
+
+    bump()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def invalidate_items(item_ids: Iterable[int]) -> None:
+    """Bumps the inventory version of every user who can see one of the items."""
+    item_ids = list(item_ids)
+    if item_ids:
+        bump_versions(ItemVisibility.objects.filter(item_id__in=item_ids).values_list(
+            'user_id', flat=True).distinct())
+
+
+class UserCache:
+    """Cached data for one user, keyed by the user's current inventory version.
+
+    The version changes whenever an item the user can see changes, so
+    entries never need deleting; stale ones are simply no longer looked up.
+    Nothing is stored while the request reads from a replica: the version
+    was bumped when the change was written, and rows read from a replica
+    that has not caught up yet would be cached under it until they expire.
+
+    Args:
+        user (User): user the data belongs to.
+    """
+
+    def __init__(self, user: Any) -> None:
+        self.user_id = user.id
+        self.version = cache.get(version_key(self.user_id))
+        if self.version is None:
+            self.version = uuid.uuid4().hex
+            if not cache.add(version_key(self.user_id), self.version, timeout=None):
+                self.version = cache.get(version_key(self.user_id), self.version)
+
+    def key(self, name: str, parts: Sequence[Hashable] = ()) -> str:
+        """Cache key of a named entry; also used for template fragments."""
+        digest = hashlib.md5(repr(tuple(parts)).encode()).hexdigest()
+        return f'inventory:{self.user_id}:{self.version}:{name}:{digest}'
+
+    def get_or_set(self, name: str, parts: Sequence[Hashable], compute: Callable[[], Any]) -> Any:
+        """Cached value of compute(), computing and storing it on a miss.
+
+        Args:
+            name (str): what is cached, such as the view name.
+            parts (Sequence[Hashable]): everything else the value depends on.
+            compute (Callable[[], Any]): builds the value; must return
+                evaluated data, not lazy querysets.
+
+        Returns:
+            Any: the cached or computed value.
+        """
+        value = self.get(name, parts)
+        if value is None:
+            value = compute()
+            self.set(name, parts, value)
+        return value
+
+    def get(self, name: str, parts: Sequence[Hashable] = ()) -> Any:
+        """Cached value of a named entry, None on a miss."""
+        return cache.get(self.key(name, parts))
+
+    def timeout(self) -> int:
+        """Seconds to store entries and fragments for, 0 while reading from a replica."""
+        routing = current_routing.get()
+        return 0 if routing and routing.database else cache_timeout()
+
+    def set(self, name: str, parts: Sequence[Hashable], value: Any) -> None:
+        """Stores a named entry for timeout() seconds."""
+        timeout = self.timeout()
+        if timeout:
+            cache.set(self.key(name, parts), value, timeout)
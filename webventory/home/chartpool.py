@@ -0,0 +1,159 @@
+'''
+Renders charts in a bounded pool of worker processes, off the request threads.
+
+Workers are spawned rather than forked, so they inherit no database
+connections, and they draw with the non-interactive Agg backend. Each job
+takes the points to plot, not a query, so workers never touch the database.
+Identical charts requested while one is being drawn share its job.
+'''
+
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+
+from .figures import graph, load_matplotlib
+
+# Worker processes; 0 draws charts in the requesting thread.
+DEFAULT_WORKERS = 2
+# Charts a worker draws before it is replaced, returning any leaked memory.
+DEFAULT_JOBS_PER_WORKER = 100
+# Address space a worker may use, in megabytes; 0 for no limit.
+DEFAULT_MEMORY_MB = 512
+# Seconds a chart request waits for its chart before answering 202.
+DEFAULT_WAIT_SECONDS = 1.0
+
+
+def chart_workers() -> int:
+    return getattr(settings, 'CHART_WORKERS', DEFAULT_WORKERS)
+
+
+def chart_wait() -> float:
+    return getattr(settings, 'CHART_WAIT_SECONDS', DEFAULT_WAIT_SECONDS)
+
+
+def start_worker(memory_mb: int) -> None:
+    """Initializes a worker process: Agg backend and a memory ceiling.
+
+    A chart that would exceed the ceiling fails with MemoryError instead of
+    growing the worker without bound.
+    """
+    # Loaded before the ceiling is set, which mapping it could exceed.
+    load_matplotlib()
+    if memory_mb:
+        try:
+            import resource
+        except ImportError:
+            return
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class ChartCancelled(Exception):
+    """A chart's drawing was cancelled, e.g. by its pool shutting down."""
+
+
+class ChartPool:
+    """Process pool drawing charts, with identical jobs merged.
+
+    The pool is created on first use. Once its workers have been given
+    jobs_per_worker jobs each, later jobs go to a fresh pool and the old one
+    exits when its jobs finish, which recycles the workers.
+
+    Args:
+        cache (Any): object with set(key, image), where finished charts are put.
+    """
+
+    def __init__(self, cache: Any) -> None:
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.pending: Dict[str, Future] = {}
+        self.executor: Optional[Executor] = None
+        self.submitted = 0
+
+    def submit(self, key: str, points: Callable[[], Tuple]) -> Future:
+        """The job drawing chart key, started if no identical job is running.
+
+        Args:
+            key (str): chart digest; equal keys are the same chart.
+            points (Callable[[], Tuple]): returns graph's arguments (dates,
+                values, is_price_graph, fmt); only called for a new job.
+
+        Returns:
+            Future: resolves to the encoded image, which is also cached.
+        """
+        with self.lock:
+            job = self.pending.get(key)
+            if job is not None:
+                return job
+            job = Future()
+            self.pending[key] = job
+        try:
+            arguments = points()
+            if chart_workers() == 0:
+                self.finish(key, job, graph(*arguments))
+                return job
+            drawing = self.run(arguments)
+        except BaseException as error:
+            self.fail(key, job, error)
+            raise
+        drawing.add_done_callback(lambda done: self.settle(key, job, done))
+        return job
+
+    def run(self, arguments: Tuple) -> Future:
+        with self.lock:
+            workers = chart_workers()
+            jobs_per_worker = getattr(settings, 'CHART_WORKER_JOBS', DEFAULT_JOBS_PER_WORKER)
+            if self.executor is None or self.submitted >= workers * jobs_per_worker:
+                self.replace_executor(workers)
+            self.submitted += 1
+            executor = self.executor
+        try:
+            return executor.submit(graph, *arguments)
+        except BrokenProcessPool:
+            # A worker died, e.g. killed by the OS; start over with new ones.
+            with self.lock:
+                if self.executor is executor:
+                    self.replace_executor(workers)
+                executor = self.executor
+            return executor.submit(graph, *arguments)
+
+    def replace_executor(self, workers: int) -> None:
+        """Starts a new pool; call with the lock held."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context('spawn'), initializer=start_worker,
+            initargs=(getattr(settings, 'CHART_WORKER_MEMORY_MB', DEFAULT_MEMORY_MB),))
+        self.submitted = 0
+
+    def finish(self, key: str, job: Future, image: bytes) -> None:
+        self.cache.set(key, image)
+        with self.lock:
+            self.pending.pop(key, None)
+        job.set_result(image)
+
+    def settle(self, key: str, job: Future, drawing: Future) -> None:
+        """Resolves job from its finished drawing. A cancelled drawing fails the
+        job too, as exception() would raise and leave it pending forever."""
+        if drawing.cancelled():
+            self.fail(key, job, ChartCancelled(key))
+        elif drawing.exception() is not None:
+            self.fail(key, job, drawing.exception())
+        else:
+            self.finish(key, job, drawing.result())
+
+    def fail(self, key: str, job: Future, error: BaseException) -> None:
+        with self.lock:
+            self.pending.pop(key, None)
+        if not job.done():
+            job.set_exception(error)
+
+    def shutdown(self) -> None:
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+            self.executor = None
@@ -0,0 +1,259 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+
+from .archive import archive_stats, merge_archived
+from .chartpool import ChartPool, chart_wait
+from .instrumentation import timed
+from .models import ItemHistory, ItemHistoryRollup
+from .rollups import period_start
+
+# Chart metric name to the ItemHistory column it plots.
+CHART_METRICS = {'price': 'price_after', 'quantity': 'quantity_after'}
+# Chart metric name to the ItemHistoryRollup column it plots.
+ROLLUP_METRICS = {'price': 'price_close', 'quantity': 'quantity_close'}
+# Rollup periods from coarsest to finest, with their length in days.
+ROLLUP_PERIODS = ((ItemHistoryRollup.WEEK, 7), (ItemHistoryRollup.DAY, 1))
+CHART_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+DATE_FORMAT = '%Y-%m-%d'
+# Charts are 640 pixels wide, so more points than this cannot be told apart.
+DEFAULT_MAX_POINTS = 640
+
+
+class LRUCache:
+    """Thread-safe, size bounded, least recently used cache.
+
+    Args:
+        maxsize (int): most entries kept before the oldest is evicted.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+chart_cache = LRUCache(getattr(settings, 'CHART_CACHE_SIZE', 128))
+chart_pool = ChartPool(chart_cache)
+
+
+def history_queryset(item_id: int, start: Optional[datetime], end: Optional[datetime]):
+    """ItemHistory of an item, limited to a date range when one is given;
+    either end of the range may be left open."""
+    history = ItemHistory.objects.filter(item_id=item_id)
+    if start:
+        history = history.filter(date_of_change__gte=start)
+    if end:
+        history = history.filter(date_of_change__lte=end)
+    return history
+
+
+class HistoryVersion(NamedTuple):
+    """Version, size and extent of an item's history in a date range."""
+    version: str
+    count: int
+    first: Optional[datetime]
+    last: Optional[datetime]
+    # Of count, the changes in archived months overlapping the range.
+    archived: int = 0
+
+
+def history_version(item_id: int, start: Optional[datetime] = None,
+                    end: Optional[datetime] = None) -> HistoryVersion:
+    """Version of an item's history in a date range.
+
+    History rows are only ever appended, so the row count and the latest
+    id change whenever the charted data does. Archived months overlapping
+    the range count too, so archiving or restoring changes the version.
+
+    Args:
+        item_id (int): item id.
+        start (datetime, optional): range start.
+        end (datetime, optional): range end.
+
+    Returns:
+        HistoryVersion: version string, number of history rows, first and
+        last change, and how many of the rows are archived.
+    """
+    stats = history_queryset(item_id, start, end).aggregate(
+        count=Count('id'), latest=Max('id'), first=Min('date_of_change'),
+        last=Max('date_of_change'))
+    archived = archive_stats(item_id, start, end)
+    if not archived['count']:
+        return HistoryVersion(f"{stats['count']}-{stats['latest']}", stats['count'],
+                              stats['first'], stats['last'])
+    return HistoryVersion(f"{stats['count']}-{stats['latest']}-{archived['count']}",
+                          stats['count'] + archived['count'],
+                          min(filter(None, (stats['first'], archived['first']))),
+                          max(filter(None, (stats['last'], archived['last']))),
+                          archived['count'])
+
+
+def chart_resolution(history: HistoryVersion) -> Optional[str]:
+    """Rollup period to chart a history from, None to chart the raw changes.
+
+    Raw history is used while it fits the point budget. Beyond that, the
+    coarsest rollup that still gives a quarter of the budget in buckets is
+    read instead, so long ranges never scan every change.
+
+    Args:
+        history (HistoryVersion): the charted history.
+
+    Returns:
+        Optional[str]: ItemHistoryRollup period, or None.
+    """
+    if history.count <= point_budget() or history.first is None:
+        return None
+    span_days = (history.last - history.first).days + 1
+    for period, days in ROLLUP_PERIODS:
+        if span_days / days >= point_budget() // 4:
+            return period
+    return None
+
+
+def chart_points(item_id: int, metric: str, start: Optional[datetime],
+                 end: Optional[datetime], history: HistoryVersion) -> Tuple:
+    """Dates and values to plot for a metric, from rollups when the range is coarse enough.
+
+    Args:
+        item_id (int): item id.
+        metric (str): chart metric.
+        start (datetime, optional): range start.
+        end (datetime, optional): range end.
+        history (HistoryVersion): the charted history.
+
+    Returns:
+        Tuple: dates and values, downsampled to the point budget.
+    """
+    # Imported here, so NumPy is loaded by the first chart rather than at startup.
+    from .series import extract_series, series_from_rows
+
+    resolution = chart_resolution(history)
+    if resolution is not None:
+        column = ROLLUP_METRICS[metric]
+        rows = ItemHistoryRollup.objects.filter(item_id=item_id, period=resolution)
+        if start:
+            rows = rows.filter(period_start__gte=period_start(start, resolution))
+        if end:
+            rows = rows.filter(period_start__lte=end)
+        series = extract_series(rows.order_by('period_start'), [column],
+                                date_column='period_start')
+        # Rollups not built yet (see "manage.py rebuild_rollups"); use the raw history.
+        if len(series):
+            return series.points(column, max_points=point_budget())
+    column = CHART_METRICS[metric]
+    rows = history_queryset(item_id, start, end).order_by('date_of_change', 'id').values_list(
+        'date_of_change', column)
+    if history.archived:
+        rows = merge_archived(item_id, rows, start, end, columns=('date_of_change', column), date_index=0)
+    return series_from_rows(rows, [column]).points(column, max_points=point_budget())
+
+
+def graph_arguments(item_id: int, metric: str, start: Optional[datetime],
+                    end: Optional[datetime], history: HistoryVersion, fmt: str) -> Tuple:
+    """Arguments of figures.graph drawing a metric's chart for an item's history."""
+    dates, values = chart_points(item_id, metric, start, end, history)
+    return dates, values, metric == 'price', fmt
+
+
+def submit_chart(digest: str, item_id: int, metric: str, start: Optional[datetime],
+                 end: Optional[datetime], history: HistoryVersion, fmt: str) -> Future:
+    """Queues a chart on the worker pool, joining the job already drawing it if any.
+
+    Returns:
+        Future: resolves to the encoded image, which is also put in chart_cache.
+    """
+    return chart_pool.submit(digest, lambda: graph_arguments(item_id, metric, start, end, history, fmt))
+
+
+@timed('graph')
+def wait_for_chart(job: Future) -> bytes:
+    """The image of a chart job, waiting at most settings.CHART_WAIT_SECONDS.
+
+    Raises:
+        concurrent.futures.TimeoutError: if the chart is not drawn in time.
+    """
+    return job.result(timeout=chart_wait())
+
+
+def chart_digest(item_id: int, version: str, metric: str, start: Optional[datetime],
+                 end: Optional[datetime], fmt: str) -> str:
+    """Content hash identifying a rendered chart."""
+    key = "|".join([str(item_id), version, metric, format_date(start),
+                    format_date(end), fmt])
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def chart_url(item_id: int, version: str, metric: str, start: Optional[datetime] = None,
+              end: Optional[datetime] = None, fmt: str = 'png') -> str:
+    """URL of a chart, which changes whenever the chart's content would."""
+    url = (f"/chart/{item_id}/{metric}/"
+           f"{chart_digest(item_id, version, metric, start, end, fmt)}.{fmt}")
+    bounds = [f"{name}={format_date(bound)}" for name, bound in (('start', start), ('end', end)) if bound]
+    if bounds:
+        url += "?" + "&".join(bounds)
+    return url
+
+
+def chart_urls(item_id: int, start: Optional[datetime] = None,
+               end: Optional[datetime] = None) -> Dict[str, str]:
+    """URLs of every metric's chart for an item, empty if there is too little history.
+
+    Args:
+        item_id (int): item id.
+        start (datetime, optional): range start.
+        end (datetime, optional): range end.
+
+    Returns:
+        Dict[str, str]: metric name to chart URL.
+    """
+    history = history_version(item_id, start, end)
+    if history.count < 2:
+        return {}
+    return {metric: chart_url(item_id, history.version, metric, start, end)
+            for metric in CHART_METRICS}
+
+
+def point_budget() -> int:
+    """Most points plotted on a chart, history beyond it is downsampled."""
+    return getattr(settings, 'CHART_MAX_POINTS', DEFAULT_MAX_POINTS)
+
+
+def format_date(value: Optional[datetime]) -> str:
+    return value.strftime(DATE_FORMAT) if value else ''
+
+
+def parse_date(value: Optional[str]) -> Optional[datetime]:
+    """Parses a Year-Month-Day string, None if it is missing or invalid."""
+    try:
+        return timezone.make_aware(datetime.strptime(value, DATE_FORMAT)) if value else None
+    except ValueError:
+        return None
@@ -0,0 +1,36 @@
+'''
+Database backends used by the database profiles in settings.DATABASE_PROFILES.
+
+They add to Django's own backends what this Django version lacks:
+connection health checks, SQLite pragmas and immediate transactions, and
+a PostgreSQL connection pool.
+'''
+
+
+class HealthCheckMixin:
+    """Checks a persistent connection is alive before a request first uses it.
+
+    With "CONN_HEALTH_CHECKS": True in the database settings, a connection
+    kept open by CONN_MAX_AGE is pinged once per request, before its first
+    query, and replaced if the server has dropped it, rather than the
+    request failing.
+    """
+
+    health_check_done = False
+
+    def close_if_unusable_or_obsolete(self) -> None:
+        # Runs as every request starts and finishes.
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def connect(self) -> None:
+        super().connect()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        if (self.connection is not None and not self.health_check_done and not self.in_atomic_block
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.close()
+        return super()._cursor(name)
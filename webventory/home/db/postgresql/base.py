@@ -0,0 +1,90 @@
+'''
+PostgreSQL backend drawing its connections from a pool kept by each process.
+
+Django closes a connection when a request ends, or once CONN_MAX_AGE has
+passed; here closing returns the connection to the pool, so threads share
+a bounded set of open connections instead of each opening its own.
+OPTIONS["pool"] = {"min_size": 1, "max_size": 10, "timeout": 10}: a
+request waits up to timeout seconds for a free connection.
+'''
+
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+import psycopg2
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from psycopg2.pool import ThreadedConnectionPool
+
+from .. import HealthCheckMixin
+
+pools: Dict[Tuple, 'ConnectionPool'] = {}
+pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """ThreadedConnectionPool whose checkouts wait for a free connection
+    rather than failing when all are in use."""
+
+    def __init__(self, min_size: int, max_size: int, timeout: float, params: Dict[str, Any]) -> None:
+        self.pool = ThreadedConnectionPool(min_size, max_size, **params)
+        self.available = threading.BoundedSemaphore(max_size)
+        self.timeout = timeout
+
+    def getconn(self) -> Any:
+        if not self.available.acquire(timeout=self.timeout):
+            raise psycopg2.OperationalError(f"no pooled connection free within {self.timeout}s")
+        try:
+            return self.pool.getconn()
+        except BaseException:
+            self.available.release()
+            raise
+
+    def putconn(self, connection: Any, close: bool = False) -> None:
+        try:
+            self.pool.putconn(connection, close=close)
+        finally:
+            self.available.release()
+
+
+class DatabaseWrapper(HealthCheckMixin, base.DatabaseWrapper):
+    def get_connection_params(self) -> Dict[str, Any]:
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def connection_pool(self, conn_params: Dict[str, Any]) -> ConnectionPool:
+        # Keyed by process too, so a forked worker never shares its parent's sockets.
+        key = (os.getpid(), tuple(sorted((name, str(value)) for name, value in conn_params.items())))
+        with pools_lock:
+            if key not in pools:
+                options = self.settings_dict['OPTIONS'].get('pool', {})
+                pools[key] = ConnectionPool(options.get('min_size', 1), options.get('max_size', 10),
+                                            options.get('timeout', 10), conn_params)
+            return pools[key]
+
+    def get_new_connection(self, conn_params: Dict[str, Any]) -> Any:
+        self.pool = self.connection_pool(conn_params)
+        connection = self.pool.getconn()
+        if self.settings_dict.get('CONN_HEALTH_CHECKS'):
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                connection.rollback()
+            except psycopg2.Error:
+                # Dropped by the server while idle in the pool.
+                self.pool.putconn(connection, close=True)
+                connection = self.pool.getconn()
+        # As Django's own backend does for a new connection.
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level', connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self) -> None:
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection, close=bool(self.connection.closed))
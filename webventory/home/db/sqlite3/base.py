@@ -0,0 +1,35 @@
+'''
+SQLite backend applying connection pragmas and taking the write lock up front.
+
+OPTIONS may hold, besides sqlite3.connect's own arguments:
+    "pragmas": {"journal_mode": "WAL", ...}, run on every new connection.
+    "transaction_mode": "IMMEDIATE", to start transactions with BEGIN
+        IMMEDIATE, so a transaction that will write waits for the write lock
+        (up to "timeout" seconds) when it begins. A deferred transaction
+        that reads first fails at once with "database is locked" if another
+        connection wrote in the meantime.
+'''
+
+from typing import Any, Dict
+
+from django.db.backends.sqlite3 import base
+
+from .. import HealthCheckMixin
+
+
+class DatabaseWrapper(HealthCheckMixin, base.DatabaseWrapper):
+    def get_connection_params(self) -> Dict[str, Any]:
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params: Dict[str, Any]) -> Any:
+        connection = super().get_new_connection(conn_params)
+        for pragma, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            connection.execute(f'PRAGMA {pragma} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self) -> None:
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
@@ -1,5 +1,6 @@
+from functools import wraps
 from typing import Union, Callable, Any
-from django.http import HttpResponseRedirect, HttpRequest
+from django.http import HttpResponse, HttpResponseRedirect, HttpRequest, JsonResponse
 from django.shortcuts import render
 
 
@@ -13,3 +14,35 @@ def is_logged_in(view_function: Callable[[HttpRequest, Any], Union[render, HttpR
         else:
             return view_function(request, *args, **kwargs)
     return wrapper
+
+
+def api_login_required(view_function: Callable[..., HttpResponse]) -> Callable[..., HttpResponse]:
+    """
+    api_login_required Answers 401 with a JSON error instead of redirecting anonymous API clients to the login page
+    """
+    @wraps(view_function)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "authentication required"}, status=401)
+        return view_function(request, *args, **kwargs)
+    return wrapper
+
+
+def staff_required(view_function: Callable[..., HttpResponse]) -> Callable[..., HttpResponse]:
+    """
+    staff_required Answers 403 to anyone but logged in staff users
+    """
+    @wraps(view_function)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_staff:
+            return JsonResponse({"error": "staff only"}, status=403)
+        return view_function(request, *args, **kwargs)
+    return wrapper
+
+
+def replica_reads(view_function: Callable[..., HttpResponse]) -> Callable[..., HttpResponse]:
+    """
+    replica_reads Lets home.routers.ReplicaMiddleware serve the view's GET requests from a database replica
+    """
+    view_function.replica_reads = True
+    return view_function
@@ -0,0 +1,145 @@
+'''
+Deletes an owner's items in batches.
+
+Ownership of the whole batch is checked in one query and the items go in
+one transaction. Long histories are not deleted by the request: those
+items are hidden at once, by dropping their visibility rows and queueing an
+ItemPurge, and a background thread then deletes their history in short
+chunked transactions, so no request holds SQLite's write lock for a whole
+history. The Item row is deleted last, once nothing references it.
+'''
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, QuerySet
+
+from .caching import bump_versions
+from .models import (InventoryValuation, Item, ItemHistory, ItemHistoryArchive, ItemHistoryRollup,
+                     ItemPurge, ItemVisibility)
+from .signals import valuations_enabled
+
+logger = logging.getLogger(__name__)
+
+# History rows a delete request removes itself; items beyond it are purged in the background.
+DEFAULT_INLINE_ROWS = 2000
+# History rows deleted per background transaction.
+DEFAULT_PURGE_CHUNK_SIZE = 500
+
+# One thread, so purges never compete with each other for the write lock.
+purger = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history-purge')
+
+
+class DeletionRefused(PermissionError):
+    """Items that do not exist or are not owned by the deleting user.
+
+    Args:
+        item_ids (List[int]): the refused item ids.
+    """
+
+    def __init__(self, item_ids: List[int]) -> None:
+        super().__init__(f"{len(item_ids)} items cannot be deleted")
+        self.item_ids = item_ids
+
+
+def raw_delete(rows: QuerySet) -> int:
+    """Deletes rows in one statement, without loading them or sending signals.
+
+    Callers refresh caches and valuations themselves, as for bulk inserts.
+    """
+    return rows._raw_delete(rows.db)
+
+
+def delete_items(user, item_ids: Iterable[int]) -> Dict[str, int]:
+    """Deletes items owned by user, all or none.
+
+    Items whose history fits, together, in settings.DELETE_INLINE_ROWS are
+    deleted with their history now; the others are hidden now and purged
+    by purge_pending once the transaction commits.
+
+    Args:
+        user (User): the deleting user.
+        item_ids (Iterable[int]): items to delete.
+
+    Raises:
+        DeletionRefused: if any item is missing or owned by someone else.
+
+    Returns:
+        Dict[str, int]: items deleted now and items left to purge.
+    """
+    item_ids = set(item_ids)
+    owned = set(Item.objects.owned_by(user).filter(id__in=item_ids).values_list('id', flat=True))
+    if owned != item_ids:
+        raise DeletionRefused(sorted(item_ids - owned))
+    history = dict(ItemHistory.objects.filter(item_id__in=owned).values('item_id').annotate(
+        rows=Count('id')).values_list('item_id', 'rows'))
+    budget = getattr(settings, 'DELETE_INLINE_ROWS', DEFAULT_INLINE_ROWS)
+    inline, deferred = [], []
+    for item_id in sorted(owned, key=lambda item_id: history.get(item_id, 0)):
+        rows = history.get(item_id, 0)
+        if rows <= budget:
+            inline.append(item_id)
+            budget -= rows
+        else:
+            deferred.append(item_id)
+    with transaction.atomic():
+        viewer_ids = list(ItemVisibility.objects.filter(item_id__in=owned).values_list(
+            'user_id', flat=True).distinct())
+        if valuations_enabled():
+            # Read before the visibility rows go.
+            InventoryValuation.shift_items({item_id: (-worth, -1) for item_id, worth in Item.objects.filter(
+                id__in=owned).with_worth().values_list('id', 'worth')})
+        remove_items(inline)
+        raw_delete(ItemVisibility.objects.filter(item_id__in=deferred))
+        ItemPurge.objects.bulk_create([ItemPurge(item_id=item_id) for item_id in deferred])
+        bump_versions(viewer_ids)
+        if deferred:
+            transaction.on_commit(lambda: purger.submit(purge_in_background))
+    return {"deleted": len(inline), "purging": len(deferred)}
+
+
+def remove_items(item_ids: List[int]) -> None:
+    """Deletes items, their history, which should be short, and the rows that depend on them."""
+    if not item_ids:
+        return
+    raw_delete(ItemHistory.objects.filter(item_id__in=item_ids))
+    for dependants in (ItemVisibility, ItemHistoryRollup, ItemHistoryArchive, ItemPurge):
+        raw_delete(dependants.objects.filter(item_id__in=item_ids))
+    raw_delete(Item.objects.filter(id__in=item_ids))
+
+
+def purge_pending() -> int:
+    """Deletes the history, then the Item, of every queued ItemPurge.
+
+    Each chunk of history rows is deleted in its own transaction, so other
+    writers wait at most one chunk. Safe to rerun after an interruption, and
+    "manage.py purge_deleted_items" does so.
+
+    Returns:
+        int: history rows deleted.
+    """
+    chunk_size = getattr(settings, 'DELETE_PURGE_CHUNK_SIZE', DEFAULT_PURGE_CHUNK_SIZE)
+    purged = 0
+    for item_id in list(ItemPurge.objects.order_by('requested').values_list('item_id', flat=True)):
+        while True:
+            with transaction.atomic():
+                ids = list(ItemHistory.objects.filter(item_id=item_id).values_list('id', flat=True)[:chunk_size])
+                purged += raw_delete(ItemHistory.objects.filter(id__in=ids))
+            if len(ids) < chunk_size:
+                break
+        with transaction.atomic():
+            remove_items([item_id])
+    return purged
+
+
+def purge_in_background() -> None:
+    try:
+        purge_pending()
+    except Exception:
+        # Left queued; the next delete or "manage.py purge_deleted_items" resumes it.
+        logger.exception("history purge failed")
+    finally:
+        connection.close()
@@ -0,0 +1,37 @@
+from typing import Any, Iterable, Set
+
+from .models import User
+from .pagination import KeysetPage, KeysetPaginator
+
+# Users listed per page of the user picker.
+USER_PAGE_SIZE = 20
+# Sorts after any character a username can contain, closing a prefix range.
+PREFIX_END = '\U0010ffff'
+
+
+def lookup_users(prefix: str = '', after: str = '',
+                 per_page: int = USER_PAGE_SIZE) -> KeysetPage:
+    """One page of users, by username, whose username starts with prefix.
+
+    The prefix becomes a range on the unique username index and pages are
+    keyset paginated by username, so the cost does not depend on how many
+    accounts exist. Matching is case sensitive.
+
+    Args:
+        prefix (str, optional): username prefix. Defaults to every user.
+        after (str, optional): username the page starts after.
+        per_page (int, optional): users per page. Defaults to 20.
+
+    Returns:
+        KeysetPage: the matching users, with only id and username loaded.
+    """
+    users = User.objects.only('id', 'username')
+    if prefix:
+        users = users.filter(username__gte=prefix, username__lt=prefix + PREFIX_END)
+    return KeysetPaginator(users, per_page, key='username').page(after=after)
+
+
+def visible_usernames(item: Any, usernames: Iterable[str]) -> Set[str]:
+    """Which of usernames can see item, in one query."""
+    return set(item.visibility.filter(user__username__in=list(usernames)).values_list(
+        'user__username', flat=True))
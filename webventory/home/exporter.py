@@ -0,0 +1,103 @@
+import csv
+import re
+import tempfile
+from datetime import datetime
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+from django.http import FileResponse, StreamingHttpResponse
+
+from .archive import merge_archived
+from .charts import history_queryset
+from .models import Item
+
+# Rows fetched from the database per round trip while streaming.
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = ('csv', 'xlsx')
+ITEM_COLUMNS = ('id', 'name', 'description', 'quantity', 'price', 'owner')
+# Matches the columns "manage.py import_inventory --kind history" reads.
+HISTORY_COLUMNS = ('item_id', 'date_of_change', 'quantity_before', 'quantity_after',
+                   'price_before', 'price_after')
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Excel refuses sheet names longer than this, or containing these characters.
+SHEET_TITLE_LENGTH = 31
+SHEET_TITLE_FORBIDDEN = re.compile(r'[\\/*?:\[\]]')
+
+
+class Echo:
+    """File-like object whose write returns the value, for csv.writer."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def item_rows(user: Any) -> Iterator[tuple]:
+    """Items visible to user, in id order, streamed from the database."""
+    return Item.objects.visible_to(user).order_by('id').values_list(
+        'id', 'name', 'description', 'quantity', 'price', 'owner__username'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def history_rows(item_id: int, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None) -> Iterator[tuple]:
+    """An item's history in a date range, in date order, streamed from the
+    database with any archived changes merged in."""
+    live = history_queryset(item_id, start, end).order_by('date_of_change', 'id').values_list(
+        *(f'{column}_id' if column == 'item_id' else column for column in HISTORY_COLUMNS)
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return merge_archived(item_id, live, start, end, columns=HISTORY_COLUMNS)
+
+
+def csv_lines(columns: Sequence[str], rows: Iterable[tuple]) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_response(filename: str, fmt: str, columns: Sequence[str],
+                    rows: Iterable[tuple]) -> Any:
+    """Response downloading rows as CSV or XLSX.
+
+    CSV is streamed as rows are fetched, so the first bytes leave before the
+    query finishes. XLSX is written by openpyxl in write-only mode and spooled
+    to a temporary file, which also keeps memory flat.
+
+    Args:
+        filename (str): download name, without extension.
+        fmt (str): "csv" or "xlsx".
+        columns (Sequence[str]): header row.
+        rows (Iterable[tuple]): data rows.
+
+    Returns:
+        StreamingHttpResponse or FileResponse: the download.
+    """
+    if fmt == 'xlsx':
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(sheet_title(filename))
+        sheet.append(columns)
+        for row in rows:
+            sheet.append([value.replace(tzinfo=None) if isinstance(value, datetime) else value
+                          for value in row])
+        spool = tempfile.TemporaryFile()
+        workbook.save(spool)
+        spool.seek(0)
+        return FileResponse(spool, as_attachment=True, filename=f'{filename}.xlsx',
+                            content_type=XLSX_CONTENT_TYPE)
+    response = StreamingHttpResponse(csv_lines(columns, rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def sheet_title(name: str) -> str:
+    """name made into a valid Excel sheet name."""
+    return SHEET_TITLE_FORBIDDEN.sub('-', name)[:SHEET_TITLE_LENGTH]
+
+
+def xlsx_available() -> bool:
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
@@ -1,27 +1,46 @@
-import random
-import sys
-import matplotlib.pyplot as plt
-from matplotlib.ticker import FormatStrFormatter, StrMethodFormatter
+from io import BytesIO
 from typing import List, Union
 from datetime import date
-import numpy
-import os
 
+from .instrumentation import timed
 
-def graph(x: List[date], y: List[Union[float, int]], username: str, is_price_graph: bool) -> str:
+
+def load_matplotlib() -> None:
+    """Imports matplotlib, set to the non-interactive Agg backend.
+
+    matplotlib is only imported when the first chart is drawn, not when
+    a worker or management command starts. No GUI backend is ever probed,
+    as pyplot is never imported.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.backends.backend_agg  # noqa: F401
+
+
+@timed('graph')
+def graph(x: List[date], y: List[Union[float, int]], is_price_graph: bool, fmt: str = 'png') -> bytes:
     """
     graph returns insights graphs for inventory management software
 
+    The figure is built without pyplot, so no global figure state is kept
+    and no file or working directory is touched; it is safe to call from
+    concurrent request threads.
+
     Args:
         x (list): x-axis (ususally date)
         y (list): y-axis (price,quantity)
-        username (str): username of user trying to access insights.
         is_price_graph (bool): true if graph being passed is price graph
+        fmt (str, optional): image format, "png" or "svg". Defaults to "png".
 
     Returns:
-        str: filename
+        bytes: encoded image.
     """
-    fig, ax = plt.subplots()
+    load_matplotlib()
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import StrMethodFormatter
+
+    fig = Figure()
+    ax = fig.subplots()
     ax.plot(x, y)
     ax.set(xlabel="Date")
     if is_price_graph:
@@ -30,11 +49,6 @@ def graph(x: List[date], y: List[Union[float, int]], username: str, is_price_gra
     else:
         ax.set(ylabel="Quantity")
     fig.autofmt_xdate()
-    user_path = os.path.join(os.path.dirname(
-        __file__), "static", "home", "temp", f'{username}')
-    if not os.path.exists(user_path):
-        os.makedirs(user_path)
-    os.chdir(user_path)
-    filename: str = f'graph_{random.randint(0,sys.maxsize)}.png'
-    fig.savefig(filename, format="png")
-    return filename
+    buffer = BytesIO()
+    fig.savefig(buffer, format=fmt)
+    return buffer.getvalue()
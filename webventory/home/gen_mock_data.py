@@ -1,24 +1,88 @@
 '''
 Generates Mock Data for testing purposes.
-run in django shell
-"python webventory/manage.py shell webventory/home/gen_mock_data.py"
+run with "python webventory/manage.py gen_mock_data --users 10 --items 100 --history 25"
+
+Rows are written with bulk inserts, about a million history rows a
+minute and a half on SQLite, and a seed makes every run produce the same data.
 '''
 
 import random
-from datetime import datetime
-
-from models import Item, ItemHistory
-
-items = []
-# Generates Random Items
-for _ in range(100):
-    new_item = Item(name="test", description="this is a description", quantity=f'{random.randint(0, 1000)}',
-                    price=f'{random.random() * random.randint(0, 10):.2f}', user_visability='true')
-    new_item.save()
-    items.append(new_item)
-# Generates Random Changes
-for _ in range(25):
-    for item in items:
-        ItemHistory(item_id=item, date_of_change=datetime.now(), price_before=item.price,
-                    price_after=f'{random.random() * random.randint(0, 10):.2f}',
-                    quantity_before=item.quantity, quantity_after=f'{random.randint(0, 1000)}').save()
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .caching import bump_versions
+from .importer import insert_items
+from .models import InventoryValuation, Item, ItemHistory, ItemVisibility, User
+from .rollups import rebuild
+
+# Password of every generated user.
+MOCK_PASSWORD = 'mock-password'
+# Rows per bulk insert.
+BATCH_SIZE = 1000
+WORDS = ('gear', 'bolt', 'valve', 'spring', 'bracket', 'hinge', 'pulley', 'rivet',
+         'washer', 'gasket', 'bearing', 'sprocket')
+
+
+def generate_mock_data(users: int = 10, items_per_user: int = 100, history_per_item: int = 25,
+                       shares_per_item: int = 1, prefix: str = 'mock', seed: int = 0) -> Dict[str, Any]:
+    """Creates users, the items each owns, who else sees them, and item history.
+
+    Args:
+        users (int, optional): users to create. Defaults to 10.
+        items_per_user (int, optional): items owned by each user. Defaults to 100.
+        history_per_item (int, optional): history rows per item, one a
+            minute up to now. Defaults to 25.
+        shares_per_item (int, optional): other users each item is also
+            visible to, picked at random. Defaults to 1.
+        prefix (str, optional): usernames are prefix0, prefix1, ... Defaults to 'mock'.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        Dict[str, Any]: the created user and item ids and the row counts.
+    """
+    rng = random.Random(seed)
+    password = make_password(MOCK_PASSWORD)
+    with transaction.atomic():
+        User.objects.bulk_create([User(username=f'{prefix}{number}', password=password)
+                                  for number in range(users)], batch_size=BATCH_SIZE)
+        user_ids = list(User.objects.filter(username__in=[f'{prefix}{number}' for number in range(users)])
+                        .order_by('id').values_list('id', flat=True))
+        items: List[Item] = []
+        for owner_id in user_ids:
+            for _ in range(items_per_user):
+                items.append(Item(name=f'{rng.choice(WORDS)} {rng.randint(1, 9999)}',
+                                  description=f'{rng.choice(WORDS)} part for the {rng.choice(WORDS)}',
+                                  quantity=rng.randint(0, 1000), price=f'{rng.uniform(0, 100):.2f}',
+                                  owner_id=owner_id))
+        insert_items(items, BATCH_SIZE)
+        visibilities = []
+        for item in items:
+            others = [user_id for user_id in user_ids if user_id != item.owner_id]
+            for user_id in [item.owner_id, *rng.sample(others, min(shares_per_item, len(others)))]:
+                visibilities.append(ItemVisibility(item_id=item.id, user_id=user_id))
+        ItemVisibility.objects.bulk_create(visibilities, batch_size=BATCH_SIZE)
+        start = timezone.now() - timedelta(minutes=history_per_item)
+        histories = []
+        for item in items:
+            quantity, price = item.quantity, float(item.price)
+            for minute in range(history_per_item):
+                new_quantity, new_price = rng.randint(0, 1000), round(rng.uniform(0, 100), 2)
+                histories.append(ItemHistory(item_id=item, date_of_change=start + timedelta(minutes=minute),
+                                             quantity_before=quantity, quantity_after=new_quantity,
+                                             price_before=price, price_after=new_price))
+                quantity, price = new_quantity, new_price
+            if len(histories) >= BATCH_SIZE:
+                ItemHistory.objects.bulk_create(histories, batch_size=BATCH_SIZE)
+                histories = []
+        ItemHistory.objects.bulk_create(histories, batch_size=BATCH_SIZE)
+        # Bulk inserts skip the signals that maintain these.
+        rebuild([item.id for item in items])
+        InventoryValuation.refresh(user_ids)
+    bump_versions(user_ids)
+    return {"user_ids": user_ids, "item_ids": [item.id for item in items],
+            "users": users, "items": len(items), "visibility": len(visibilities),
+            "history": len(items) * history_per_item}
@@ -0,0 +1,316 @@
+import csv
+import json
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .caching import bump_versions, invalidate_items
+from .models import InventoryValuation, Item, ItemHistory, ItemVisibility, User
+from .rollups import record_changes
+
+ITEMS = 'items'
+HISTORY = 'history'
+FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 1000
+# Rejected rows kept in the report; the rest are only counted.
+MAX_REPORTED_REJECTIONS = 100
+
+
+class RowError(ValueError):
+    """A row that cannot be imported."""
+
+
+class ImportReport:
+    """Outcome of an import.
+
+    Args:
+        kind (str): ITEMS or HISTORY.
+    """
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self.created = 0
+        self.updated = 0
+        self.rejected = 0
+        self.rejections: List[Tuple[int, str]] = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def reject(self, line: int, reason: Any) -> None:
+        self.rejected += 1
+        if len(self.rejections) < MAX_REPORTED_REJECTIONS:
+            self.rejections.append((line, str(reason)))
+
+    def finish(self) -> 'ImportReport':
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    @property
+    def rows(self) -> int:
+        return self.created + self.updated + self.rejected
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        return (f"Imported {self.kind}: {self.created} created, {self.updated} updated, "
+                f"{self.rejected} rejected in {self.seconds:.2f}s "
+                f"({self.rows_per_second:.0f} rows/s).")
+
+
+def read_rows(stream: Iterable[str], fmt: str) -> Iterator[Tuple[int, Any]]:
+    """Yields (line number, raw row) from CSV with a header row, or JSON Lines.
+
+    JSON lines are decoded during validation, so a malformed line only
+    rejects that row.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line, text in enumerate(stream, 1):
+            if text.strip():
+                yield line, text
+
+
+def chunked(rows: Iterator, size: int) -> Iterator[List]:
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def decode(raw: Any) -> Dict[str, Any]:
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as error:
+            raise RowError(f"invalid JSON: {error.msg}")
+    if not isinstance(raw, dict):
+        raise RowError("row is not an object")
+    return raw
+
+
+def required(row: Dict[str, Any], field: str) -> Any:
+    value = row.get(field)
+    if value is None or value == '':
+        raise RowError(f"missing {field}")
+    return value
+
+
+def to_int(row: Dict[str, Any], field: str) -> int:
+    try:
+        return int(str(required(row, field)))
+    except ValueError:
+        raise RowError(f"{field} is not an integer")
+
+
+def to_price(row: Dict[str, Any], field: str) -> Decimal:
+    try:
+        price = Decimal(str(required(row, field))).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RowError(f"{field} is not a number")
+    if abs(price) >= Decimal('10000000'):
+        raise RowError(f"{field} is too large")
+    return price
+
+
+def to_text(row: Dict[str, Any], field: str, max_length: int) -> str:
+    value = str(required(row, field))
+    if len(value) > max_length:
+        raise RowError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def usernames(value: Any) -> List[str]:
+    """Usernames from a JSON list or a comma separated CSV cell."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(username).strip() for username in value if str(username).strip()]
+
+
+def clean_item(raw: Any) -> Tuple[Optional[int], Dict[str, Any], List[str]]:
+    """Validates an item row.
+
+    Returns:
+        Tuple: existing item id or None, Item field values, and the
+        usernames the item is shared with.
+    """
+    row = decode(raw)
+    item_id = to_int(row, 'id') if row.get('id') not in (None, '') else None
+    fields = {"name": to_text(row, 'name', 30),
+              "description": to_text(row, 'description', 100),
+              "quantity": to_int(row, 'quantity'),
+              "price": to_price(row, 'price')}
+    return item_id, fields, usernames(row.get('visible_to'))
+
+
+def clean_history(raw: Any) -> Dict[str, Any]:
+    """Validates an item history row.
+
+    Returns:
+        Dict[str, Any]: ItemHistory field values.
+    """
+    row = decode(raw)
+    changed = required(row, 'date_of_change')
+    changed = parse_datetime(str(changed)) if not isinstance(changed, datetime) else changed
+    if changed is None:
+        raise RowError("date_of_change is not an ISO 8601 date and time")
+    if timezone.is_naive(changed):
+        changed = timezone.make_aware(changed)
+    return {"item_id_id": to_int(row, 'item_id'),
+            "date_of_change": changed,
+            "quantity_before": to_int(row, 'quantity_before'),
+            "quantity_after": to_int(row, 'quantity_after'),
+            "price_before": float(to_price(row, 'price_before')),
+            "price_after": float(to_price(row, 'price_after'))}
+
+
+def insert_items(items: List[Item], batch_size: int) -> None:
+    """Bulk inserts items and sets their ids.
+
+    Backends that return ids from bulk inserts get them for free. SQLite
+    cannot under Django 3.2, so the items are inserted under the write lock
+    of the transaction, which leaves their AUTOINCREMENT ids consecutive,
+    and the last one is read back from sqlite_sequence. Ids of deleted
+    items are never handed out again.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        Item.objects.bulk_create(items, batch_size=batch_size)
+        return
+    if not items:
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        Item.objects.bulk_create(items, batch_size=batch_size)
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [Item._meta.db_table])
+        first_id = cursor.fetchone()[0] - len(items) + 1
+    for offset, item in enumerate(items):
+        item.id = first_id + offset
+
+
+def import_items(stream: Iterable[str], owner: User, fmt: str = 'csv',
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> ImportReport:
+    """Imports items owned by owner.
+
+    Rows with an id update that item, if owner owns it; other rows create
+    items. Each chunk is validated, then written in one transaction with
+    bulk_create and bulk_update, and shared with the users in visible_to.
+
+    Args:
+        stream (Iterable[str]): lines of CSV or JSON Lines.
+        owner (User): owner of the imported items.
+        fmt (str, optional): "csv" or "jsonl". Defaults to "csv".
+        chunk_size (int, optional): rows per transaction. Defaults to 1000.
+
+    Returns:
+        ImportReport: counts, rejected rows and throughput.
+    """
+    report = ImportReport(ITEMS)
+    viewer_ids: Set[int] = {owner.id}
+    for chunk in chunked(read_rows(stream, fmt), chunk_size):
+        cleaned = []
+        for line, raw in chunk:
+            try:
+                cleaned.append((line, *clean_item(raw)))
+            except RowError as error:
+                report.reject(line, error)
+        user_ids = dict(User.objects.filter(username__in={
+            username for *_, shared in cleaned for username in shared}).values_list('username', 'id'))
+        owned_ids = set(Item.objects.owned_by(owner).filter(id__in={
+            item_id for _, item_id, *_ in cleaned if item_id is not None}).values_list('id', flat=True))
+        new_items, updated_items, shares = [], [], []
+        for line, item_id, fields, shared in cleaned:
+            unknown = [username for username in shared if username not in user_ids]
+            if unknown:
+                report.reject(line, f"unknown users: {', '.join(unknown)}")
+                continue
+            if item_id is not None and item_id not in owned_ids:
+                report.reject(line, f"item {item_id} does not exist or is not yours")
+                continue
+            item = Item(id=item_id, owner=owner, **fields)
+            if item_id is not None:
+                # Lets adjustments in flight see that the item changed under them.
+                item.version = F('version') + 1
+            (new_items if item_id is None else updated_items).append(item)
+            shares.append((item, {owner.id, *(user_ids[username] for username in shared)}))
+        with transaction.atomic():
+            insert_items(new_items, chunk_size)
+            Item.objects.bulk_update(updated_items, ['name', 'description', 'quantity', 'price', 'version'],
+                                     batch_size=chunk_size)
+            ItemVisibility.objects.bulk_create(
+                [ItemVisibility(item_id=item.id, user_id=user_id)
+                 for item, users in shares for user_id in users],
+                batch_size=chunk_size, ignore_conflicts=True)
+        report.created += len(new_items)
+        report.updated += len(updated_items)
+        for _, users in shares:
+            viewer_ids.update(users)
+        # Users an updated item was already shared with see the change too.
+        if updated_items:
+            viewer_ids.update(ItemVisibility.objects.filter(
+                item_id__in=[item.id for item in updated_items]).values_list('user_id', flat=True))
+    # Bulk writes skip the model signals that keep valuations and cached pages current.
+    InventoryValuation.refresh(viewer_ids)
+    bump_versions(viewer_ids)
+    return report.finish()
+
+
+def import_history(stream: Iterable[str], owner: User, fmt: str = 'csv',
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> ImportReport:
+    """Imports ItemHistory rows for items owned by owner.
+
+    Each chunk is validated, then written, folded into its items' rollups
+    and expired from cached pages in one transaction, so memory stays flat
+    however many items the history covers.
+
+    Args:
+        stream (Iterable[str]): lines of CSV or JSON Lines.
+        owner (User): owner of the items the history belongs to.
+        fmt (str, optional): "csv" or "jsonl". Defaults to "csv".
+        chunk_size (int, optional): rows per transaction. Defaults to 1000.
+
+    Returns:
+        ImportReport: counts, rejected rows and throughput.
+    """
+    report = ImportReport(HISTORY)
+    for chunk in chunked(read_rows(stream, fmt), chunk_size):
+        cleaned = []
+        for line, raw in chunk:
+            try:
+                cleaned.append((line, clean_history(raw)))
+            except RowError as error:
+                report.reject(line, error)
+        owned_ids = set(Item.objects.owned_by(owner).filter(id__in={
+            fields['item_id_id'] for _, fields in cleaned}).values_list('id', flat=True))
+        histories = []
+        for line, fields in cleaned:
+            if fields['item_id_id'] not in owned_ids:
+                report.reject(line, f"item {fields['item_id_id']} does not exist or is not yours")
+                continue
+            histories.append(ItemHistory(**fields))
+        with transaction.atomic():
+            ItemHistory.objects.bulk_create(histories, batch_size=chunk_size)
+            # Bulk inserts skip the signals that fold history into rollups and expire cached pages.
+            record_changes(histories)
+            invalidate_items({history.item_id_id for history in histories})
+        report.created += len(histories)
+    return report.finish()
+
+
+def import_inventory(stream: Iterable[str], owner: User, kind: str = ITEMS, fmt: str = 'csv',
+                     chunk_size: int = DEFAULT_CHUNK_SIZE) -> ImportReport:
+    """Imports items or item history, see import_items and import_history."""
+    importer = import_history if kind == HISTORY else import_items
+    return importer(stream, owner, fmt, chunk_size)
@@ -0,0 +1,294 @@
+'''
+Per-request profiling: wall time, SQL queries, duplicate queries, template
+rendering and chart drawing time, aggregated into percentiles per URL route.
+
+Enabled with settings.INSTRUMENTATION. When it is off the middleware removes
+itself at startup and the timed sections only check a context variable.
+The profile travels with the request's context, so the queries and
+templates of the async views' worker threads count towards it too.
+'''
+
+import asyncio
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest, HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+# Requests kept per route for the percentiles.
+DEFAULT_WINDOW = 1000
+# Seconds between rewrites of the Prometheus metrics file.
+DEFAULT_FLUSH_SECONDS = 15
+QUANTILES = (0.5, 0.9, 0.99)
+# Recorded for every request: name, Prometheus help text.
+METRICS = {
+    'seconds': "Wall time of the request.",
+    'queries': "SQL queries run.",
+    'query_seconds': "Time spent in SQL queries.",
+    'duplicate_queries': "Queries repeating an earlier query of the same request.",
+    'template_seconds': "Time spent rendering templates.",
+    'graph_seconds': "Time spent drawing charts.",
+}
+
+current_profile: ContextVar[Optional['RequestProfile']] = ContextVar('current_profile', default=None)
+
+
+def instrumentation_enabled() -> bool:
+    return getattr(settings, 'INSTRUMENTATION', False)
+
+
+class RequestProfile:
+    """What one request spent its time on."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.duplicate_queries = 0
+        self.template_seconds = 0.0
+        self.graph_seconds = 0.0
+        self.statements: Dict[str, int] = defaultdict(int)
+        # Worker threads of one async request record into it at the same time.
+        self.lock = threading.Lock()
+
+    def record_query(self, execute: Callable, sql: str, params: Any, many: bool, context: Dict) -> Any:
+        """connection.execute_wrapper hook timing each query.
+
+        Queries are compared by SQL text, parameters aside, so a query run
+        once per row of a loop counts as duplicates.
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.query_seconds += time.perf_counter() - started
+                self.queries += 1
+                self.statements[sql] += 1
+                if self.statements[sql] > 1:
+                    self.duplicate_queries += 1
+
+    def add_seconds(self, section: str, seconds: float) -> None:
+        """Adds time spent to <section>_seconds."""
+        attribute = f'{section}_seconds'
+        with self.lock:
+            setattr(self, attribute, getattr(self, attribute) + seconds)
+
+    def finish(self) -> 'RequestProfile':
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    def values(self) -> Dict[str, float]:
+        return {metric: getattr(self, metric) for metric in METRICS}
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, shown in browser developer tools."""
+        return (f"db;desc=\"{self.queries} queries\";dur={self.query_seconds * 1000:.1f}, "
+                f"tpl;dur={self.template_seconds * 1000:.1f}, "
+                f"graph;dur={self.graph_seconds * 1000:.1f}, "
+                f"total;dur={self.seconds * 1000:.1f}")
+
+
+def timed(section: str) -> Callable:
+    """Adds the time spent in the decorated function to the current
+    request's <section>_seconds, when the request is being profiled."""
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = current_profile.get()
+            if profile is None:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.add_seconds(section, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class TimedTemplate(Template):
+    """Template whose rendering, included templates and all, is timed."""
+
+    @timed('template')
+    def render(self, context: Any = None, request: Any = None) -> str:
+        return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, with rendering time profiled."""
+
+    def from_string(self, template_code: str) -> TimedTemplate:
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name: str) -> TimedTemplate:
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+def percentile(ordered: List[float], quantile: float) -> float:
+    """Nearest rank percentile of an ascending list."""
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+class ProfileStore:
+    """The latest profiles of each route, shared by a worker's threads.
+
+    Args:
+        window (int): requests kept per route.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW) -> None:
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples: Dict[str, Deque[Dict[str, float]]] = {}
+        self.totals: Dict[str, Tuple[int, Dict[str, float]]] = {}
+
+    def add(self, route: str, profile: RequestProfile) -> None:
+        values = profile.values()
+        with self.lock:
+            self.samples.setdefault(route, deque(maxlen=self.window)).append(values)
+            count, sums = self.totals.get(route, (0, dict.fromkeys(METRICS, 0.0)))
+            self.totals[route] = (count + 1, {metric: sums[metric] + values[metric] for metric in METRICS})
+
+    def clear(self) -> None:
+        with self.lock:
+            self.samples.clear()
+            self.totals.clear()
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """Per route: requests seen, metric sums, and percentiles of the window.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: e.g. {"userInventory/": {"count": 12,
+            "sum": {"seconds": 0.4, ...}, "seconds": {"p50": 0.02, ...}, ...}}.
+        """
+        with self.lock:
+            snapshot = {route: (list(samples), self.totals[route]) for route, samples in self.samples.items()}
+        report = {}
+        for route, (samples, (count, sums)) in sorted(snapshot.items()):
+            report[route] = {"count": count, "sum": sums}
+            for metric in METRICS:
+                ordered = sorted(sample[metric] for sample in samples)
+                report[route][metric] = {f"p{round(quantile * 100)}": percentile(ordered, quantile)
+                                         for quantile in QUANTILES}
+        return report
+
+    def prometheus(self) -> str:
+        """The report in the Prometheus text exposition format, one summary per metric."""
+        report = self.report()
+        lines = []
+        for metric, description in METRICS.items():
+            name = f'webventory_request_{metric}'
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} summary']
+            for route, stats in report.items():
+                label = route.replace('\\', '\\\\').replace('"', '\\"')
+                for quantile in QUANTILES:
+                    value = stats[metric][f"p{round(quantile * 100)}"]
+                    lines.append(f'{name}{{route="{label}",quantile="{quantile}"}} {value:.6g}')
+                lines.append(f'{name}_sum{{route="{label}"}} {stats["sum"][metric]:.6g}')
+                lines.append(f'{name}_count{{route="{label}"}} {stats["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> None:
+        """Atomically replaces the Prometheus file at path, for node_exporter's
+        textfile collector to pick up."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as stream:
+            stream.write(self.prometheus())
+        os.replace(temporary, path)
+
+
+store = ProfileStore(getattr(settings, 'INSTRUMENTATION_WINDOW', DEFAULT_WINDOW))
+
+
+def metrics_file() -> str:
+    """settings.INSTRUMENTATION_FILE, with {pid} replaced so each worker
+    writes its own file; empty when no file is written."""
+    return getattr(settings, 'INSTRUMENTATION_FILE', '').format(pid=os.getpid())
+
+
+def record_query(execute: Callable, sql: str, params: Any, many: bool, context: Dict) -> Any:
+    """connection.execute_wrapper hook recording into the current request's profile, if any."""
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.record_query(execute, sql, params, many, context)
+
+
+def install_query_hook(connection: Any, **kwargs: Any) -> None:
+    """Adds record_query to a connection, once; connections are per thread,
+    so this runs as each thread opens its own."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class InstrumentationMiddleware:
+    """Profiles every request and adds it to the store.
+
+    Place it first in MIDDLEWARE so the queries of the other middleware,
+    such as loading the session user, are counted too. Under ASGI it runs
+    on the event loop, so the async views stay async.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        if not instrumentation_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks the instance async, as Django's MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        self.flush_seconds = getattr(settings, 'INSTRUMENTATION_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)
+        self.flushed = time.monotonic()
+        connection_created.connect(install_query_hook)
+        for connection in connections.all():
+            install_query_hook(connection)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.record(request, response, profile)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        return self.record(request, response, profile)
+
+    def record(self, request: HttpRequest, response: HttpResponse, profile: RequestProfile) -> HttpResponse:
+        """Stores a finished request's profile and adds its Server-Timing header."""
+        profile.finish()
+        match = request.resolver_match
+        store.add(match.route if match else 'unmatched', profile)
+        response['Server-Timing'] = profile.server_timing()
+        self.flush()
+        return response
+
+    def flush(self) -> None:
+        path = metrics_file()
+        if path and time.monotonic() - self.flushed >= self.flush_seconds:
+            self.flushed = time.monotonic()
+            store.write(path)
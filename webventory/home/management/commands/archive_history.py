@@ -0,0 +1,34 @@
+import time
+from datetime import timedelta
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from home.archive import archive_days, archive_history, restore_history
+
+
+class Command(BaseCommand):
+    help = ("Moves ItemHistory older than settings.HISTORY_ARCHIVE_DAYS, in whole months, "
+            "into compressed per-month archives.")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--days', type=int,
+                            help="Archive history older than this many days instead.")
+        parser.add_argument('--item', type=int, action='append', dest='items',
+                            help="Only archive this item id; may be repeated.")
+        parser.add_argument('--restore', action='store_true',
+                            help="Move archived history back into ItemHistory.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        started = time.perf_counter()
+        if options['restore']:
+            restored = restore_history(options['items'])
+            self.stdout.write(f"Restored {restored} history rows in "
+                              f"{time.perf_counter() - started:.2f}s.")
+            return
+        days = archive_days() if options['days'] is None else options['days']
+        report = archive_history(timezone.now() - timedelta(days=days), options['items'])
+        self.stdout.write(f"Archived {report['rows']} history rows of {report['items']} items "
+                          f"into {report['archives']} monthly archives in "
+                          f"{time.perf_counter() - started:.2f}s.")
@@ -0,0 +1,53 @@
+import inspect
+import json
+from typing import Any, Dict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home.benchmarks import SUITES, environment, regressions
+
+
+class Command(BaseCommand):
+    help = "Runs Webventory benchmark suites and prints their results as JSON."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('suites', nargs='+', choices=sorted(SUITES),
+                            help="Benchmark suites to run.")
+        parser.add_argument('-o', '--option', action='append', default=[],
+                            metavar='NAME=VALUE',
+                            help="Integer parameter for the suites that take it, e.g. rows=50000.")
+        parser.add_argument('--output', help="Also write the results to this JSON file.")
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help="Fail if the results regress from this earlier --output file.")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Fraction a timing may grow by before --compare reports it.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        parameters: Dict[str, int] = {}
+        for option in options['option']:
+            name, _, value = option.partition('=')
+            if not value.isdigit():
+                raise CommandError(f"Option {option!r} is not NAME=INTEGER.")
+            parameters[name] = int(value)
+        accepted = {name: inspect.signature(SUITES[name]).parameters
+                    for name in options['suites']}
+        unknown = set(parameters).difference(*accepted.values())
+        if unknown:
+            raise CommandError(f"No selected suite takes {', '.join(sorted(unknown))}.")
+        results: Dict[str, Any] = {"environment": environment()}
+        for name in options['suites']:
+            results[name] = SUITES[name](**{parameter: value for parameter, value in
+                                            parameters.items() if parameter in accepted[name]})
+        output = json.dumps(results, indent=2, default=str)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        self.stdout.write(output)
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+            baseline.pop('environment', None)
+            found = regressions(baseline, results, options['tolerance'])
+            if found:
+                raise CommandError("Regressions from {}:\n{}".format(options['compare'], '\n'.join(found)))
+            self.stderr.write(f"No regressions from {options['compare']}.")
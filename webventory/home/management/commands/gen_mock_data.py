@@ -0,0 +1,28 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from home.gen_mock_data import MOCK_PASSWORD, generate_mock_data
+
+
+class Command(BaseCommand):
+    help = "Creates mock users, items, item visibility and item history."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--users', type=int, default=10, help="Users to create.")
+        parser.add_argument('--items', type=int, default=100, help="Items owned by each user.")
+        parser.add_argument('--history', type=int, default=25, help="History rows per item.")
+        parser.add_argument('--shares', type=int, default=1,
+                            help="Other users each item is shared with.")
+        parser.add_argument('--prefix', default='mock', help="Username prefix.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        started = time.perf_counter()
+        created = generate_mock_data(options['users'], options['items'], options['history'],
+                                     options['shares'], options['prefix'], options['seed'])
+        self.stdout.write(f"Created {created['users']} users, {created['items']} items, "
+                          f"{created['visibility']} visibility rows and {created['history']} "
+                          f"history rows in {time.perf_counter() - started:.2f}s. "
+                          f"Users log in with the password {MOCK_PASSWORD!r}.")
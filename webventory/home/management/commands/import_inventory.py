@@ -0,0 +1,37 @@
+import os
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home.importer import DEFAULT_CHUNK_SIZE, FORMATS, HISTORY, ITEMS, import_inventory
+from home.models import User
+
+
+class Command(BaseCommand):
+    help = ("Streams items, or item history, from a CSV or JSON Lines file into an "
+            "owner's inventory.")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('path', help="CSV file with a header row, or JSON Lines file.")
+        parser.add_argument('--owner', required=True, help="Username owning the items.")
+        parser.add_argument('--kind', choices=[ITEMS, HISTORY], default=ITEMS,
+                            help="Rows are items (default) or item history.")
+        parser.add_argument('--format', choices=FORMATS,
+                            help="Input format. Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Rows validated and written per transaction.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        owner = User.objects.filter(username=options['owner']).first()
+        if owner is None:
+            raise CommandError(f"No user named {options['owner']!r}.")
+        fmt = options['format'] or (
+            'jsonl' if os.path.splitext(options['path'])[1] in ('.jsonl', '.json') else 'csv')
+        with open(options['path'], newline='', encoding='utf-8') as stream:
+            report = import_inventory(stream, owner, options['kind'], fmt,
+                                      options['chunk_size'])
+        for line, reason in report.rejections:
+            self.stderr.write(f"line {line}: {reason}")
+        if report.rejected > len(report.rejections):
+            self.stderr.write(f"... and {report.rejected - len(report.rejections)} more rejected rows")
+        self.stdout.write(report.summary())
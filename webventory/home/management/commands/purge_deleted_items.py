@@ -0,0 +1,17 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from home.deletion import purge_pending
+
+
+class Command(BaseCommand):
+    help = ("Finishes deleting items whose history was left to purge in the background, "
+            "e.g. after a restart interrupted the purge.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        started = time.perf_counter()
+        purged = purge_pending()
+        self.stdout.write(f"Purged {purged} history rows in "
+                          f"{time.perf_counter() - started:.2f}s.")
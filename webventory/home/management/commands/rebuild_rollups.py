@@ -0,0 +1,20 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from home.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the daily and weekly ItemHistory rollups from ItemHistory."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--item', type=int, action='append', dest='items',
+                            help="Only rebuild this item id; may be repeated.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        started = time.perf_counter()
+        written = rebuild(options['items'])
+        self.stdout.write(f"Wrote {written} rollup rows in "
+                          f"{time.perf_counter() - started:.2f}s.")
@@ -0,0 +1,17 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from home.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Recreates and refills the item search index."
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        started = time.perf_counter()
+        backend = get_backend()
+        backend.rebuild()
+        self.stdout.write(f"Rebuilt the {type(backend).__name__} index in "
+                          f"{time.perf_counter() - started:.2f}s.")
@@ -0,0 +1,24 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from home.models import InventoryValuation, User
+
+
+class Command(BaseCommand):
+    help = "Recomputes the materialized InventoryValuation of users from their visible Items."
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--user', action='append', dest='usernames',
+                            help="Only rebuild this username; may be repeated.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        started = time.perf_counter()
+        users = User.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        user_ids = list(users.values_list('id', flat=True))
+        InventoryValuation.refresh(user_ids)
+        self.stdout.write(f"Rebuilt {len(user_ids)} valuations in "
+                          f"{time.perf_counter() - started:.2f}s.")
@@ -0,0 +1,37 @@
+import sqlite3
+import time
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ("Copies the SQLite primary database into each SQLite replica in "
+            "settings.DATABASE_REPLICAS, for running with replicas locally.")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Keep copying every this many seconds until interrupted.")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite' or not settings.DATABASE_REPLICAS:
+            raise CommandError("Only SQLite replicas are copied; configure DATABASE_REPLICAS, "
+                               "or use the server's own replication.")
+        while True:
+            started = time.perf_counter()
+            primary.ensure_connection()
+            for alias in settings.DATABASE_REPLICAS:
+                # A plain connection, since the replica's own are read only.
+                replica = sqlite3.connect(str(connections[alias].settings_dict['NAME']))
+                try:
+                    primary.connection.backup(replica)
+                finally:
+                    replica.close()
+            self.stdout.write(f"Copied the primary to {len(settings.DATABASE_REPLICAS)} replicas in "
+                              f"{time.perf_counter() - started:.2f}s.")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
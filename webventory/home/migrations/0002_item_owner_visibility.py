@@ -0,0 +1,88 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def split_user_visibility(apps, schema_editor):
+    """Parses the legacy "owner,user,user," strings into owner and visibility rows."""
+    Item = apps.get_model('home', 'Item')
+    User = apps.get_model('home', 'User')
+    ItemVisibility = apps.get_model('home', 'ItemVisibility')
+    user_ids = dict(User.objects.values_list('username', 'id'))
+    visibility_rows = []
+    for item in Item.objects.only('id', 'user_visibility').iterator():
+        usernames = [username.strip() for username in item.user_visibility.split(',')
+                     if username.strip()]
+        owner_id = user_ids.get(usernames[0]) if usernames else None
+        if owner_id is not None:
+            Item.objects.filter(id=item.id).update(owner_id=owner_id)
+        seen = set()
+        for username in usernames:
+            user_id = user_ids.get(username)
+            if user_id is not None and user_id not in seen:
+                seen.add(user_id)
+                visibility_rows.append(
+                    ItemVisibility(item_id=item.id, user_id=user_id))
+    ItemVisibility.objects.bulk_create(visibility_rows, batch_size=1000)
+
+
+def join_user_visibility(apps, schema_editor):
+    """Rebuilds the legacy visibility strings, owner first."""
+    Item = apps.get_model('home', 'Item')
+    ItemVisibility = apps.get_model('home', 'ItemVisibility')
+    for item in Item.objects.select_related('owner').iterator():
+        usernames = [item.owner.username] if item.owner else []
+        usernames += [username for username in ItemVisibility.objects.filter(
+            item_id=item.id).values_list('user__username', flat=True)
+            if username not in usernames]
+        item.user_visibility = ''.join(f'{username},' for username in usernames)
+        item.save(update_fields=['user_visibility'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='owned_items', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.CreateModel(
+            name='ItemVisibility',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visibility', to='home.item')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_visibility', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='visible_to',
+            field=models.ManyToManyField(blank=True, related_name='visible_items', through='home.ItemVisibility', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='itemvisibility',
+            index=models.Index(fields=['user', 'item'], name='itemvisibility_user_item'),
+        ),
+        migrations.AddConstraint(
+            model_name='itemvisibility',
+            constraint=models.UniqueConstraint(fields=('item', 'user'), name='unique_item_visibility'),
+        ),
+        # A default lets the legacy column be restored when migrating backwards.
+        migrations.AlterField(
+            model_name='item',
+            name='user_visibility',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunPython(split_user_visibility, join_user_visibility),
+        migrations.RemoveField(
+            model_name='item',
+            name='user_visibility',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0002_item_owner_visibility'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryValuation',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='valuation', serialize=False, to='home.user')),
+                ('total_assets', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('item_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0003_inventoryvaluation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemHistoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('week', 'Week')], max_length=4)),
+                ('period_start', models.DateTimeField()),
+                ('first_change', models.DateTimeField()),
+                ('last_change', models.DateTimeField()),
+                ('change_count', models.IntegerField(default=0)),
+                ('price_open', models.FloatField()),
+                ('price_close', models.FloatField()),
+                ('price_min', models.FloatField()),
+                ('price_max', models.FloatField()),
+                ('quantity_open', models.IntegerField()),
+                ('quantity_close', models.IntegerField()),
+                ('quantity_min', models.IntegerField()),
+                ('quantity_max', models.IntegerField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='home.item')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='itemhistoryrollup',
+            constraint=models.UniqueConstraint(fields=('item', 'period', 'period_start'), name='unique_item_rollup_period'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+# The search index as this migration first created it. Later changes to
+# home.search reach existing databases through its post_migrate install.
+FTS_TABLE = 'home_item_fts'
+SQLITE_STATEMENTS = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, description, content='home_item', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON home_item BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON home_item BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF name, description ON home_item BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    f"INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_REVERSE = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+POSTGRES_STATEMENTS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS home_item_name_trgm ON home_item USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS home_item_description_trgm "
+    "ON home_item USING gin (description gin_trgm_ops)",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS home_item_name_trgm",
+    "DROP INDEX IF EXISTS home_item_description_trgm",
+]
+
+
+def statements_for(connection, forwards: bool):
+    if connection.vendor == 'postgresql':
+        return POSTGRES_STATEMENTS if forwards else POSTGRES_REVERSE
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA compile_options")
+            if any(option == 'ENABLE_FTS5' for option, in cursor.fetchall()):
+                return SQLITE_STATEMENTS if forwards else SQLITE_REVERSE
+    return []
+
+
+def install_search_index(apps, schema_editor) -> None:
+    for statement in statements_for(schema_editor.connection, True):
+        schema_editor.execute(statement)
+
+
+def uninstall_search_index(apps, schema_editor) -> None:
+    for statement in statements_for(schema_editor.connection, False):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0004_itemhistoryrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
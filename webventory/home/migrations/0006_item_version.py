@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0005_item_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
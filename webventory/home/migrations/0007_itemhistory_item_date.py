@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0006_item_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itemhistory',
+            index=models.Index(fields=['item_id', 'date_of_change'], name='itemhistory_item_date'),
+        ),
+        migrations.AlterField(
+            model_name='itemhistory',
+            name='item_id',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='home.item'),
+        ),
+    ]
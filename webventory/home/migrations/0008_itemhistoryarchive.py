@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0007_itemhistory_item_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemHistoryArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateTimeField()),
+                ('row_count', models.IntegerField()),
+                ('first_change', models.DateTimeField()),
+                ('last_change', models.DateTimeField()),
+                ('data', models.BinaryField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history_archives', to='home.item')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='itemhistoryarchive',
+            constraint=models.UniqueConstraint(fields=('item', 'month'), name='unique_item_archive_month'),
+        ),
+    ]
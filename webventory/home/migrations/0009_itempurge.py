@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0008_itemhistoryarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemPurge',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='purge', serialize=False, to='home.item')),
+                ('requested', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -1,10 +1,59 @@
-from django.db import models
+from decimal import Decimal
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
 from django.contrib.auth.models import AbstractUser
-from typing import List
+from typing import Dict, Iterable, List, Tuple
 from datetime import date
 # Create your models here.
 
 
+ITEM_WORTH = ExpressionWrapper(F('price') * F('quantity'),
+                               output_field=DecimalField(max_digits=18, decimal_places=2))
+
+
+class ItemQuerySet(models.QuerySet):
+    """QuerySet for Items."""
+
+    def visible_to(self, user) -> 'ItemQuerySet':
+        """Items a user may see, resolved through the indexed visibility table.
+
+        Args:
+            user (User): user to filter by.
+
+        Returns:
+            ItemQuerySet: items visible to user.
+        """
+        return self.filter(visibility__user=user)
+
+    def owned_by(self, user) -> 'ItemQuerySet':
+        """Items owned by a user, less those deleted but still being purged.
+
+        Args:
+            user (User): owner to filter by.
+
+        Returns:
+            ItemQuerySet: items owned by user.
+        """
+        return self.filter(owner=user, purge__isnull=True)
+
+    def with_worth(self) -> 'ItemQuerySet':
+        """Annotates each Item with worth (price * quantity), computed in SQL.
+
+        Returns:
+            ItemQuerySet: items annotated with worth.
+        """
+        return self.annotate(worth=ITEM_WORTH)
+
+    def total_worth(self) -> Decimal:
+        """Sum of price * quantity over the queryset, computed in SQL.
+
+        Returns:
+            Decimal: total worth, 0 for an empty queryset.
+        """
+        return self.aggregate(total=Sum(ITEM_WORTH))['total'] or Decimal(0)
+
+
 class Item(models.Model):
     """Model for Items.
 
@@ -19,16 +68,54 @@ class Item(models.Model):
     description: str = models.CharField(max_length=100)
     quantity: int = models.IntegerField()
     price: float = models.DecimalField(max_digits=9, decimal_places=2)
-    user_visibility: str = models.TextField()
+    # Bumped by every change made through home/adjustments.py, so writers
+    # can detect that an Item changed since they read it.
+    version: int = models.PositiveIntegerField(default=0)
+    owner = models.ForeignKey(
+        'User',
+        models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='owned_items',
+    )
+    visible_to = models.ManyToManyField(
+        'User',
+        through='ItemVisibility',
+        related_name='visible_items',
+        blank=True,
+    )
+
+    objects = ItemQuerySet.as_manager()
 
     def __str__(self) -> str:
         return " ".join([str(self.name).title(), f"({str(self.id)})"])
 
     def get_user_visibility(self) -> List[str]:
-        return self.user_visibility.split(',')
+        return [str(username) for username in
+                self.visible_to.values_list('username', flat=True)]
+
+    def is_visible_to(self, user) -> bool:
+        return ItemVisibility.objects.filter(item=self, user=user).exists()
 
-    def owner(self) -> str:
-        return self.user_visibility.split(',')[0]
+    def update_visibility(self, add: Iterable[str] = (), remove: Iterable[str] = ()) -> None:
+        """Shares the Item with, and hides it from, users by username.
+
+        Only the named users are touched, so the cost depends on the size of
+        the change rather than on the number of accounts. The owner always
+        keeps access.
+
+        Args:
+            add (Iterable[str], optional): usernames to share with.
+            remove (Iterable[str], optional): usernames to hide from.
+        """
+        owner = self.owner.username if self.owner else None
+        remove = set(remove) - {owner}
+        add = set(add) - remove
+        with transaction.atomic():
+            if add:
+                self.visible_to.add(*User.objects.filter(username__in=add))
+            if remove:
+                self.visible_to.remove(*User.objects.filter(username__in=remove))
 
 
 class User(AbstractUser):
@@ -47,6 +134,148 @@ class User(AbstractUser):
     def __str__(self) -> str:
         return self.username
 
+    def get_session_auth_hash(self) -> str:
+        """Hash that logs the user's sessions out when the password changes.
+
+        A User loaded by home.backends.CachedModelBackend comes without its
+        password, and with the hash cached alongside instead; once the
+        password is loaded or set, the hash is computed from it.
+        """
+        if 'password' not in self.__dict__ and hasattr(self, '_session_auth_hash'):
+            return self._session_auth_hash
+        return super().get_session_auth_hash()
+
+
+class ItemVisibility(models.Model):
+    """Model for ItemVisibility, one row per user an Item is shared with.
+
+    Args:
+        models ([type]): Inherits from Django model's class.
+
+    Returns:
+        ItemVisibility: ItemVisibility object.
+    """
+    item = models.ForeignKey(Item, models.CASCADE, related_name='visibility')
+    user = models.ForeignKey(User, models.CASCADE,
+                             related_name='item_visibility')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'user'],
+                                    name='unique_item_visibility'),
+        ]
+        # (user, item) lets every per-user item listing be served from the index.
+        indexes = [
+            models.Index(fields=['user', 'item'],
+                         name='itemvisibility_user_item'),
+        ]
+
+    def __str__(self) -> str:
+        return " ".join([str(self.user), "can see", str(self.item)])
+
+
+class InventoryValuation(models.Model):
+    """Model for InventoryValuation, the materialized worth of a user's visible Items.
+
+    Kept up to date by the Item and ItemVisibility signal handlers in
+    home/signals.py when settings.MATERIALIZED_VALUATIONS is enabled, so
+    reading a user's total assets is a single primary key lookup. Writes
+    shift it by the worth they add or remove; only bulk loads and
+    "manage.py rebuild_valuations" recompute it from every visible Item.
+
+    Args:
+        models ([type]): Inherits from Django model's class.
+
+    Returns:
+        InventoryValuation: InventoryValuation object.
+    """
+    user = models.OneToOneField(User, models.CASCADE, primary_key=True,
+                                related_name='valuation')
+    total_assets: Decimal = models.DecimalField(
+        max_digits=18, decimal_places=2, default=0)
+    item_count: int = models.IntegerField(default=0)
+    updated_at: date = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return " ".join([str(self.user), "assets:", str(self.total_assets)])
+
+    @classmethod
+    def refresh(cls, user_ids: Iterable[int]) -> None:
+        """Recomputes the valuation of each given user from their visible Items.
+
+        Args:
+            user_ids (Iterable[int]): ids of the users to refresh.
+        """
+        for user_id in set(user_ids):
+            totals = Item.objects.filter(visibility__user_id=user_id).aggregate(
+                total=Sum(ITEM_WORTH), count=models.Count('id'))
+            cls.objects.update_or_create(
+                user_id=user_id,
+                defaults={"total_assets": totals['total'] or Decimal(0),
+                          "item_count": totals['count']})
+
+    @classmethod
+    def shift(cls, user_ids: Iterable[int], worth: Decimal, count: int = 0) -> None:
+        """Adds worth to the total assets, and count to the item count, of users.
+
+        Users without a valuation are skipped; theirs is computed in full
+        when first read.
+
+        Args:
+            user_ids (Iterable[int]): ids of the users to shift.
+            worth (Decimal): worth gained, negative if lost.
+            count (int, optional): items gained, negative if lost.
+        """
+        user_ids = list(user_ids)
+        if user_ids and (worth or count):
+            cls.objects.filter(user_id__in=user_ids).update(
+                total_assets=F('total_assets') + worth, item_count=F('item_count') + count)
+
+    @classmethod
+    def shift_items(cls, changes: Dict[int, Tuple[Decimal, int]]) -> None:
+        """Shifts the valuation of every user who can see a changed Item.
+
+        Users sharing the same total change are updated together, so the
+        cost grows with the number of distinct changes, not with viewers
+        times visible Items.
+
+        Args:
+            changes (Dict[int, Tuple[Decimal, int]]): (worth, count) gained
+                by each Item id.
+        """
+        totals: Dict[int, Tuple[Decimal, int]] = {}
+        for user_id, item_id in ItemVisibility.objects.filter(
+                item_id__in=list(changes)).values_list('user_id', 'item_id'):
+            worth, count = totals.get(user_id, (Decimal(0), 0))
+            totals[user_id] = (worth + changes[item_id][0], count + changes[item_id][1])
+        users: Dict[Tuple[Decimal, int], List[int]] = {}
+        for user_id, change in totals.items():
+            users.setdefault(change, []).append(user_id)
+        for (worth, count), user_ids in users.items():
+            cls.shift(user_ids, worth, count)
+
+    @classmethod
+    def total_assets_for(cls, user: User) -> Decimal:
+        """Total worth of the Items visible to user.
+
+        Reads the materialized valuation when enabled, otherwise aggregates
+        in SQL.
+
+        Args:
+            user (User): user to value.
+
+        Returns:
+            Decimal: total assets worth.
+        """
+        if not getattr(settings, 'MATERIALIZED_VALUATIONS', False):
+            return Item.objects.visible_to(user).total_worth()
+        valuation = cls.objects.filter(user=user).values_list(
+            'total_assets', flat=True).first()
+        if valuation is None:
+            cls.refresh([user.id])
+            valuation = cls.objects.get(user=user).total_assets
+        return valuation
+
 
 class ItemHistory(models.Model):
     """Model for ItemHistory
@@ -63,6 +292,8 @@ class ItemHistory(models.Model):
         models.SET_NULL,
         blank=True,
         null=True,
+        # Served by the (item, date_of_change) index below.
+        db_index=False,
     )
     quantity_before: int = models.IntegerField()
     quantity_after: int = models.IntegerField()
@@ -70,6 +301,135 @@ class ItemHistory(models.Model):
     price_after: float = models.FloatField()
     date_of_change: date = models.DateTimeField()
 
+    class Meta:
+        # An item's history in date order, or in a date range, is an index
+        # range scan with no sort.
+        indexes = [
+            models.Index(fields=['item_id', 'date_of_change'],
+                         name='itemhistory_item_date'),
+        ]
+
     def __str__(self) -> str:
         return " ".join([str(self.item_id.name), "Change:", "on",
                          str(self.date_of_change)])
+
+
+class ItemHistoryRollup(models.Model):
+    """Model for ItemHistoryRollup, open/close/min/max of an Item's price and
+    quantity over one day or one week of ItemHistory.
+
+    Maintained incrementally as ItemHistory rows are written (see
+    home/rollups.py) and rebuilt with "manage.py rebuild_rollups".
+
+    Args:
+        models ([type]): Inherits from Django model's class.
+
+    Returns:
+        ItemHistoryRollup: ItemHistoryRollup object.
+    """
+    DAY = 'day'
+    WEEK = 'week'
+    PERIOD_CHOICES = [(DAY, 'Day'), (WEEK, 'Week')]
+
+    item = models.ForeignKey(Item, models.CASCADE, related_name='rollups')
+    period: str = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    period_start: date = models.DateTimeField()
+    first_change: date = models.DateTimeField()
+    last_change: date = models.DateTimeField()
+    change_count: int = models.IntegerField(default=0)
+    price_open: float = models.FloatField()
+    price_close: float = models.FloatField()
+    price_min: float = models.FloatField()
+    price_max: float = models.FloatField()
+    quantity_open: int = models.IntegerField()
+    quantity_close: int = models.IntegerField()
+    quantity_min: int = models.IntegerField()
+    quantity_max: int = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'period', 'period_start'],
+                                    name='unique_item_rollup_period'),
+        ]
+
+    def __str__(self) -> str:
+        return " ".join([str(self.item), self.period, "of",
+                         str(self.period_start)])
+
+    def include(self, changed: date, price: float, quantity: int) -> None:
+        """Folds one change into the bucket.
+
+        Args:
+            changed (date): date_of_change of the change.
+            price (float): price after the change.
+            quantity (int): quantity after the change.
+        """
+        if not self.change_count:
+            self.first_change = self.last_change = changed
+            self.price_open = self.price_close = self.price_min = self.price_max = price
+            self.quantity_open = self.quantity_close = quantity
+            self.quantity_min = self.quantity_max = quantity
+        else:
+            if changed < self.first_change:
+                self.first_change = changed
+                self.price_open, self.quantity_open = price, quantity
+            if changed >= self.last_change:
+                self.last_change = changed
+                self.price_close, self.quantity_close = price, quantity
+            self.price_min = min(self.price_min, price)
+            self.price_max = max(self.price_max, price)
+            self.quantity_min = min(self.quantity_min, quantity)
+            self.quantity_max = max(self.quantity_max, quantity)
+        self.change_count += 1
+
+
+class ItemHistoryArchive(models.Model):
+    """Model for ItemHistoryArchive, one calendar month of an Item's
+    ItemHistory moved out of the live table, stored as gzip compressed JSON
+    Lines in the import and export history format.
+
+    Written by "manage.py archive_history" (see home/archive.py); rollups
+    are kept, and history reads include archived months.
+
+    Args:
+        models ([type]): Inherits from Django model's class.
+
+    Returns:
+        ItemHistoryArchive: ItemHistoryArchive object.
+    """
+    item = models.ForeignKey(Item, models.CASCADE, related_name='history_archives')
+    month: date = models.DateTimeField()
+    row_count: int = models.IntegerField()
+    first_change: date = models.DateTimeField()
+    last_change: date = models.DateTimeField()
+    data: bytes = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'month'],
+                                    name='unique_item_archive_month'),
+        ]
+
+    def __str__(self) -> str:
+        return " ".join([str(self.item), "history of", self.month.strftime('%Y-%m')])
+
+
+class ItemPurge(models.Model):
+    """Model for ItemPurge, an Item deleted by its owner whose long history
+    is still being deleted in the background (see home/deletion.py).
+
+    The Item has already lost its visibility rows, so nobody sees it, and
+    the Item row itself goes, taking this row with it, once its history
+    has been purged.
+
+    Args:
+        models ([type]): Inherits from Django model's class.
+
+    Returns:
+        ItemPurge: ItemPurge object.
+    """
+    item = models.OneToOneField(Item, models.CASCADE, primary_key=True, related_name='purge')
+    requested: date = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return " ".join([str(self.item), "purge requested", self.requested.strftime('%Y-%m-%d %H:%M')])
@@ -0,0 +1,117 @@
+from typing import List, Optional
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.http import HttpRequest
+
+# Page sizes a user may pick with ?per_page=.
+PAGE_SIZES = (10, 25, 50, 100)
+
+
+class KeysetPage:
+    """One page of a keyset paginated queryset.
+
+    Args:
+        items (List): objects on the page, in key order.
+        per_page (int): page size used.
+        after (int): key the page starts after, 0 for the first page.
+        has_next (bool): true if items follow the page.
+        has_previous (bool): true if items precede the page.
+        key (str): field the page is ordered by.
+    """
+
+    def __init__(self, items: List, per_page: int, after: int, has_next: bool,
+                 has_previous: bool, key: str = 'id') -> None:
+        self.items = items
+        self.per_page = per_page
+        self.after = after
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.key = key
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __bool__(self) -> bool:
+        return bool(self.items)
+
+    @property
+    def next_cursor(self) -> int:
+        """Cursor of the following page, the key of the last item on this page."""
+        return getattr(self.items[-1], self.key) if self.items else self.after
+
+    @property
+    def previous_cursor(self) -> int:
+        """Cursor for ?before=, the key of the first item on this page."""
+        return getattr(self.items[0], self.key) if self.items else self.after
+
+
+class KeysetPaginator:
+    """Paginates a queryset by a unique, indexed key instead of by offset.
+
+    Every page is a single "key > cursor ORDER BY key LIMIT n + 1" query,
+    so its cost does not depend on how deep the user pages. The extra row
+    tells whether another page follows without a COUNT.
+
+    Args:
+        queryset (QuerySet): queryset to paginate.
+        per_page (int, optional): page size. Defaults to settings.INVENTORY_PAGE_SIZE.
+        key (str, optional): unique field to order by. Defaults to 'id'.
+    """
+
+    def __init__(self, queryset: QuerySet, per_page: Optional[int] = None,
+                 key: str = 'id') -> None:
+        self.queryset = queryset
+        self.per_page = per_page or default_page_size()
+        self.key = key
+
+    def page(self, after: int = 0, before: Optional[int] = None) -> KeysetPage:
+        """Returns the page starting after a key, or ending before one.
+
+        Args:
+            after (int, optional): key to start after. Defaults to 0.
+            before (int, optional): key to end before, takes precedence over after.
+
+        Returns:
+            KeysetPage: the requested page.
+        """
+        if before is not None:
+            rows = list(self.queryset.filter(**{f'{self.key}__lt': before})
+                        .order_by(f'-{self.key}')[:self.per_page + 1])
+            if not rows:
+                return self.page()
+            has_previous = len(rows) > self.per_page
+            # The row preceding the page is the cursor the page starts after.
+            after = getattr(rows[self.per_page], self.key) if has_previous else 0
+            items = rows[:self.per_page][::-1]
+            return KeysetPage(items, self.per_page, after, True, has_previous, self.key)
+        rows = list(self.queryset.filter(**{f'{self.key}__gt': after})
+                    .order_by(self.key)[:self.per_page + 1])
+        return KeysetPage(rows[:self.per_page], self.per_page, after,
+                          len(rows) > self.per_page, bool(after), self.key)
+
+
+def default_page_size() -> int:
+    return getattr(settings, 'INVENTORY_PAGE_SIZE', PAGE_SIZES[0])
+
+
+def paginate(request: HttpRequest, queryset: QuerySet, cursor: int = 0) -> KeysetPage:
+    """Keyset paginates a queryset using the page size and direction in the request.
+
+    Args:
+        request (HttpRequest): request, may carry ?per_page= and ?before=.
+        queryset (QuerySet): queryset to paginate.
+        cursor (int, optional): key the page starts after. Defaults to 0.
+
+    Returns:
+        KeysetPage: the requested page.
+    """
+    per_page = request.GET.get('per_page', '')
+    per_page = int(per_page) if per_page.isdigit() and int(
+        per_page) in PAGE_SIZES else default_page_size()
+    before = request.GET.get('before', '')
+    before = int(before) if before.isdigit() else None
+    return KeysetPaginator(queryset, per_page).page(after=cursor, before=before)
@@ -0,0 +1,169 @@
+import heapq
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .archive import archived_histories
+from .models import ItemHistory, ItemHistoryRollup
+
+PERIODS = (ItemHistoryRollup.DAY, ItemHistoryRollup.WEEK)
+# Rows loaded per round trip when rebuilding.
+REBUILD_CHUNK_SIZE = 2000
+# Columns ItemHistoryRollup.include() changes.
+ROLLUP_FIELDS = ['first_change', 'last_change', 'change_count',
+                 'price_open', 'price_close', 'price_min', 'price_max',
+                 'quantity_open', 'quantity_close', 'quantity_min', 'quantity_max']
+
+
+def period_start(changed: datetime, period: str) -> datetime:
+    """Start of the day, or of the Monday-based week, containing a moment.
+
+    Args:
+        changed (datetime): aware moment.
+        period (str): ItemHistoryRollup.DAY or ItemHistoryRollup.WEEK.
+
+    Returns:
+        datetime: aware start of the period, in the current time zone.
+    """
+    local = timezone.localtime(changed)
+    start = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == ItemHistoryRollup.WEEK:
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def change_values(history: ItemHistory) -> Tuple[datetime, float, int]:
+    """Moment, price after and quantity after of a change.
+
+    The edit view saves posted strings, so the values are coerced here.
+    """
+    changed = history.date_of_change
+    if timezone.is_naive(changed):
+        changed = timezone.make_aware(changed)
+    return changed, float(history.price_after), int(float(history.quantity_after))
+
+
+def record_change(history: ItemHistory) -> None:
+    """Folds a newly written ItemHistory row into its day and week rollups.
+
+    Args:
+        history (ItemHistory): the saved change.
+    """
+    if history.item_id_id is None:
+        return
+    changed, price, quantity = change_values(history)
+    for period in PERIODS:
+        start = period_start(changed, period)
+        try:
+            fold_into_bucket(history.item_id_id, period, start, changed, price, quantity)
+        except IntegrityError:
+            # Another writer created the bucket first; fold into theirs.
+            fold_into_bucket(history.item_id_id, period, start, changed, price, quantity)
+
+
+def fold_into_bucket(item_id: int, period: str, start: datetime, changed: datetime,
+                     price: float, quantity: int) -> None:
+    """Adds one change to a rollup bucket under a row lock, creating the bucket if needed."""
+    with transaction.atomic():
+        rollup = ItemHistoryRollup.objects.select_for_update().filter(
+            item_id=item_id, period=period, period_start=start).first()
+        if rollup is None:
+            rollup = ItemHistoryRollup(item_id=item_id, period=period, period_start=start)
+        rollup.include(changed, price, quantity)
+        rollup.save()
+
+
+def record_changes(histories: Iterable[ItemHistory]) -> None:
+    """Folds many newly written ItemHistory rows into their rollups.
+
+    The affected buckets are locked and loaded in one query, updated in
+    memory, then written with one bulk_update and one bulk_create, so the
+    cost does not grow with a query per change.
+
+    Args:
+        histories (Iterable[ItemHistory]): the saved changes.
+    """
+    changes = [(history.item_id_id, *change_values(history))
+               for history in histories if history.item_id_id is not None]
+    if not changes:
+        return
+    try:
+        fold_into_buckets(changes)
+    except IntegrityError:
+        # Another writer created one of the buckets first; fold into theirs.
+        fold_into_buckets(changes)
+
+
+def fold_into_buckets(changes: List[Tuple[int, datetime, float, int]]) -> None:
+    """Adds (item id, moment, price, quantity) changes to their rollup buckets."""
+    keys = {(item_id, period, period_start(changed, period))
+            for item_id, changed, _, _ in changes for period in PERIODS}
+    with transaction.atomic():
+        existing = {(rollup.item_id, rollup.period, rollup.period_start): rollup
+                    for rollup in ItemHistoryRollup.objects.select_for_update().filter(
+                        item_id__in={key[0] for key in keys},
+                        period_start__in={key[2] for key in keys})}
+        created: Dict[Tuple[int, str, datetime], ItemHistoryRollup] = {}
+        for item_id, changed, price, quantity in changes:
+            for period in PERIODS:
+                key = (item_id, period, period_start(changed, period))
+                bucket = existing.get(key) or created.get(key)
+                if bucket is None:
+                    bucket = created[key] = ItemHistoryRollup(
+                        item_id=item_id, period=period, period_start=key[2])
+                bucket.include(changed, price, quantity)
+        touched = [existing[key] for key in keys if key in existing]
+        ItemHistoryRollup.objects.bulk_update(touched, ROLLUP_FIELDS, batch_size=500)
+        ItemHistoryRollup.objects.bulk_create(created.values(), batch_size=500)
+
+
+def rebuild(item_ids: Optional[Iterable[int]] = None) -> int:
+    """Recomputes rollups from ItemHistory, archived history included.
+
+    History is streamed in item and date order, so only the buckets of one
+    item are held in memory at a time.
+
+    Args:
+        item_ids (Iterable[int], optional): items to rebuild. Defaults to every item.
+
+    Returns:
+        int: number of rollup rows written.
+    """
+    history = ItemHistory.objects.filter(item_id__isnull=False)
+    rollups = ItemHistoryRollup.objects.all()
+    if item_ids is not None:
+        item_ids = list(item_ids)
+        history = history.filter(item_id__in=item_ids)
+        rollups = rollups.filter(item_id__in=item_ids)
+    written = 0
+    with transaction.atomic():
+        rollups.delete()
+        buckets: Dict[Tuple[str, datetime], ItemHistoryRollup] = {}
+        current_item = None
+        live = history.order_by('item_id', 'date_of_change', 'id').iterator(chunk_size=REBUILD_CHUNK_SIZE)
+        changes = heapq.merge(archived_histories(item_ids), live,
+                              key=lambda change: (change.item_id_id, change.date_of_change))
+        for change in changes:
+            if change.item_id_id != current_item:
+                written += flush(buckets)
+                current_item = change.item_id_id
+            changed, price, quantity = change_values(change)
+            for period in PERIODS:
+                start = period_start(changed, period)
+                bucket = buckets.get((period, start))
+                if bucket is None:
+                    bucket = buckets[period, start] = ItemHistoryRollup(
+                        item_id=current_item, period=period, period_start=start)
+                bucket.include(changed, price, quantity)
+        written += flush(buckets)
+    return written
+
+
+def flush(buckets: Dict) -> int:
+    """Writes and forgets the buckets collected for one item."""
+    count = len(buckets)
+    ItemHistoryRollup.objects.bulk_create(buckets.values(), batch_size=500)
+    buckets.clear()
+    return count
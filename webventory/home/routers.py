@@ -0,0 +1,120 @@
+'''
+Sends the reads of read-only views to replicas of the primary database.
+
+Only requests for views marked with @replica_reads, made with a safe
+method, read from a replica; everything else, background threads and
+management commands included, reads and writes the primary. Once a
+request writes, the user's requests are pinned to the primary for
+settings.READ_YOUR_WRITES_SECONDS by a cookie, so the page shown after a
+save always includes it even if the replicas lag behind.
+
+Enabled by settings.DATABASE_REPLICAS, the aliases of the replicas.
+'''
+
+import asyncio
+import random
+from contextvars import ContextVar
+from typing import Any, Callable, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpRequest, HttpResponse
+
+# Seconds a user's reads stay on the primary after one of their writes.
+DEFAULT_PIN_SECONDS = 5
+# Cookie whose presence pins a user's reads to the primary.
+PIN_COOKIE = 'primary_reads'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RequestRouting:
+    """Where the current request reads from, and whether it has written."""
+
+    def __init__(self, pinned: bool) -> None:
+        self.pinned = pinned
+        self.database: Optional[str] = None
+        self.wrote = False
+
+
+current_routing: ContextVar[Optional[RequestRouting]] = ContextVar('current_routing', default=None)
+
+
+def replica_aliases() -> List[str]:
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaRouter:
+    """Database router reading from the replica picked for the current request."""
+
+    def db_for_read(self, model: Any, **hints: Any) -> Optional[str]:
+        routing = current_routing.get()
+        return routing.database if routing else None
+
+    def db_for_write(self, model: Any, **hints: Any) -> str:
+        routing = current_routing.get()
+        if routing:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1: Any, obj2: Any, **hints: Any) -> bool:
+        # Every alias holds the same data.
+        return True
+
+    def allow_migrate(self, db: str, app_label: str, **hints: Any) -> bool:
+        # Replicas get their schema from the primary.
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Picks a replica for reads of @replica_reads views and sets the pin cookie after writes.
+
+    Place it before SessionMiddleware, so saving a changed session, such as
+    at login, counts as a write. Under ASGI it runs on the event loop, and
+    the routing reaches the views' worker threads with the request's context.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks the instance async, as Django's MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        routing = RequestRouting(pinned=PIN_COOKIE in request.COOKIES)
+        token = current_routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.pin(routing, response)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        routing = RequestRouting(pinned=PIN_COOKIE in request.COOKIES)
+        token = current_routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.pin(routing, response)
+
+    def pin(self, routing: RequestRouting, response: HttpResponse) -> HttpResponse:
+        """Sets the pin cookie if the request wrote."""
+        if routing.wrote:
+            response.set_cookie(PIN_COOKIE, '1', httponly=True, samesite='Lax',
+                                max_age=getattr(settings, 'READ_YOUR_WRITES_SECONDS', DEFAULT_PIN_SECONDS))
+        return response
+
+    def process_view(self, request: HttpRequest, view_func: Callable, view_args: Any,
+                     view_kwargs: Any) -> None:
+        routing = current_routing.get()
+        if (routing and not routing.pinned and request.method in SAFE_METHODS
+                and getattr(view_func, 'replica_reads', False)):
+            routing.database = random.choice(replica_aliases())
@@ -0,0 +1,215 @@
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, List, Optional
+
+from django.conf import settings
+from django.db import connection as default_connection, connections
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Item
+
+SEARCH_PAGE_SIZE = 10
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchPage:
+    """One page of ranked search results.
+
+    Args:
+        items (List[Item]): results on the page, best first.
+        query (str): search text.
+        number (int): page number, from 1.
+        has_next (bool): true if more results follow.
+    """
+
+    def __init__(self, items: List[Item], query: str, number: int, has_next: bool) -> None:
+        self.items = items
+        self.query = query
+        self.number = number
+        self.has_next = has_next
+        self.has_previous = number > 1
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __bool__(self) -> bool:
+        return bool(self.items)
+
+
+class SearchBackend(ABC):
+    """Searches Item name and description for the items a user can see.
+
+    Args:
+        connection: database connection the backend queries.
+    """
+
+    def __init__(self, connection: Any = default_connection) -> None:
+        self.connection = connection
+
+    def install(self) -> None:
+        """Creates whatever index the backend needs; safe to run repeatedly."""
+
+    def uninstall(self) -> None:
+        """Drops the backend's index."""
+
+    def rebuild(self) -> None:
+        """Reindexes every item."""
+
+    @abstractmethod
+    def search_ids(self, user: Any, words: List[str], limit: int, offset: int) -> List[int]:
+        """Ids of matching items visible to user, best match first."""
+
+    def search(self, user: Any, query: str, page: int = 1,
+               per_page: int = SEARCH_PAGE_SIZE) -> SearchPage:
+        """Ranked, prefix matching search over the items visible to user.
+
+        Args:
+            user (User): searching user.
+            query (str): search text; every word must match, as a word prefix.
+            page (int, optional): page number, from 1. Defaults to 1.
+            per_page (int, optional): results per page. Defaults to 10.
+
+        Returns:
+            SearchPage: the requested page of results.
+        """
+        page = max(page, 1)
+        words = WORD_PATTERN.findall(query)
+        if not words:
+            return SearchPage([], query, page, False)
+        ids = self.search_ids(user, words, per_page + 1, (page - 1) * per_page)
+        items = Item.objects.in_bulk(ids[:per_page])
+        return SearchPage([items[item_id] for item_id in ids[:per_page] if item_id in items],
+                          query, page, len(ids) > per_page)
+
+
+class SubstringSearchBackend(SearchBackend):
+    """Unindexed substring search, for databases without a better option."""
+
+    def search_ids(self, user: Any, words: List[str], limit: int, offset: int) -> List[int]:
+        matches = Item.objects.visible_to(user)
+        for word in words:
+            matches = matches.filter(Q(name__icontains=word) | Q(description__icontains=word))
+        return list(matches.order_by('id').values_list('id', flat=True)[offset:offset + limit])
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """SQLite FTS5 index over Item name and description.
+
+    The index is an external content table kept in step with home_item by
+    triggers, so every write path, bulk ones included, updates it. Results
+    are ranked with bm25, weighting name matches over description matches.
+    """
+    TABLE = 'home_item_fts'
+    STATEMENTS = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+        "name, description, content='home_item', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {TABLE}_insert AFTER INSERT ON home_item BEGIN "
+        f"INSERT INTO {TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+        f"CREATE TRIGGER IF NOT EXISTS {TABLE}_delete AFTER DELETE ON home_item BEGIN "
+        f"INSERT INTO {TABLE}({TABLE}, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); END",
+        f"CREATE TRIGGER IF NOT EXISTS {TABLE}_update AFTER UPDATE OF name, description ON home_item BEGIN "
+        f"INSERT INTO {TABLE}({TABLE}, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        f"INSERT INTO {TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    ]
+
+    def install(self) -> None:
+        with self.connection.cursor() as cursor:
+            for statement in self.STATEMENTS:
+                cursor.execute(statement)
+
+    def uninstall(self) -> None:
+        with self.connection.cursor() as cursor:
+            for suffix in ('_insert', '_delete', '_update'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {self.TABLE}{suffix}")
+            cursor.execute(f"DROP TABLE IF EXISTS {self.TABLE}")
+
+    def rebuild(self) -> None:
+        self.install()
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.TABLE}({self.TABLE}) VALUES ('rebuild')")
+
+    def search_ids(self, user: Any, words: List[str], limit: int, offset: int) -> List[int]:
+        # Quoting each word keeps FTS5 query syntax out of user input.
+        match = " ".join(f'"{word}"*' for word in words)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {self.TABLE}.rowid FROM {self.TABLE} "
+                f"JOIN home_itemvisibility ON home_itemvisibility.item_id = {self.TABLE}.rowid "
+                f"WHERE {self.TABLE} MATCH %s AND home_itemvisibility.user_id = %s "
+                f"ORDER BY bm25({self.TABLE}, 10.0, 1.0), {self.TABLE}.rowid LIMIT %s OFFSET %s",
+                [match, user.id, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresTrigramBackend(SearchBackend):
+    """pg_trgm backed search for PostgreSQL.
+
+    Trigram GIN indexes serve the ILIKE filters, and results are ranked by
+    trigram similarity, name first.
+    """
+    STATEMENTS = [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS home_item_name_trgm ON home_item USING gin (name gin_trgm_ops)",
+        "CREATE INDEX IF NOT EXISTS home_item_description_trgm "
+        "ON home_item USING gin (description gin_trgm_ops)",
+    ]
+
+    def install(self) -> None:
+        with self.connection.cursor() as cursor:
+            for statement in self.STATEMENTS:
+                cursor.execute(statement)
+
+    def uninstall(self) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute("DROP INDEX IF EXISTS home_item_name_trgm")
+            cursor.execute("DROP INDEX IF EXISTS home_item_description_trgm")
+
+    def search_ids(self, user: Any, words: List[str], limit: int, offset: int) -> List[int]:
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        query = " ".join(words)
+        matches = Item.objects.visible_to(user)
+        for word in words:
+            matches = matches.filter(Q(name__icontains=word) | Q(description__icontains=word))
+        matches = matches.annotate(rank=TrigramSimilarity('name', query) * 2
+                                   + TrigramSimilarity('description', query))
+        return list(matches.order_by('-rank', 'id').values_list('id', flat=True)[offset:offset + limit])
+
+
+@lru_cache(maxsize=None)
+def sqlite_has_fts5(alias: str) -> bool:
+    """Whether the SQLite behind a connection alias has FTS5, asked once per process."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any(option == 'ENABLE_FTS5' for option, in cursor.fetchall())
+
+
+def get_backend(connection: Any = default_connection) -> SearchBackend:
+    """Search backend for a connection.
+
+    settings.SEARCH_BACKEND may name a SearchBackend subclass by dotted path;
+    otherwise FTS5 is used on SQLite, pg_trgm on PostgreSQL and substring
+    matching elsewhere.
+    """
+    backend: Optional[str] = getattr(settings, 'SEARCH_BACKEND', None)
+    if backend:
+        return import_string(backend)(connection)
+    if connection.vendor == 'sqlite' and sqlite_has_fts5(connection.alias):
+        return SQLiteFTSBackend(connection)
+    if connection.vendor == 'postgresql':
+        return PostgresTrigramBackend(connection)
+    return SubstringSearchBackend(connection)
+
+
+def search_items(user: Any, query: str, page: int = 1,
+                 per_page: int = SEARCH_PAGE_SIZE) -> SearchPage:
+    """Searches the items visible to user with the configured backend."""
+    return get_backend().search(user, query, page, per_page)
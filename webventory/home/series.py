@@ -0,0 +1,122 @@
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+from django.db.models import QuerySet
+
+
+class Series:
+    """Time series of one or more numeric columns, held as NumPy arrays.
+
+    Args:
+        dates (np.ndarray): datetime64[us] timestamps, in UTC.
+        columns (Dict[str, np.ndarray]): column name to float64 values, NaN where null.
+    """
+
+    def __init__(self, dates: np.ndarray, columns: Dict[str, np.ndarray]) -> None:
+        self.dates = dates
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def points(self, column: str, drop_zeros: bool = True,
+               max_points: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Dates and values of a column with null, and optionally zero, values masked out.
+
+        Args:
+            column (str): column name.
+            drop_zeros (bool, optional): also drop zero values. Defaults to True.
+            max_points (int, optional): downsample to at most this many points.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: matching dates and values.
+        """
+        values = self.columns[column]
+        mask = ~np.isnan(values)
+        if drop_zeros:
+            mask &= values != 0
+        if max_points is not None:
+            return lttb(self.dates[mask], values[mask], max_points)
+        return self.dates[mask], values[mask]
+
+
+def extract_series(queryset: QuerySet, columns: Sequence[str],
+                   date_column: str = 'date_of_change') -> Series:
+    """Loads a date column and numeric columns of a queryset into a Series.
+
+    Only the requested columns are selected, in a single query, and copied
+    into arrays sized up front, so the cost is linear in the number of rows.
+
+    Args:
+        queryset (QuerySet): rows to extract, in the order to keep.
+        columns (Sequence[str]): numeric columns to extract.
+        date_column (str, optional): datetime column. Defaults to 'date_of_change'.
+
+    Returns:
+        Series: the extracted series.
+    """
+    return series_from_rows(queryset.values_list(date_column, *columns), columns)
+
+
+def series_from_rows(rows: Iterable[Tuple], columns: Sequence[str]) -> Series:
+    """Builds a Series from (date, *values) rows, such as merged live and archived history.
+
+    Args:
+        rows (Iterable[Tuple]): aware datetime followed by one value per column.
+        columns (Sequence[str]): names of the value columns.
+
+    Returns:
+        Series: the series.
+    """
+    rows = list(rows)
+    count = len(rows)
+    # Epoch microseconds are much cheaper to build than datetime64 from datetimes.
+    timestamps = np.fromiter((row[0].timestamp() for row in rows),
+                             dtype=np.float64, count=count)
+    dates = (timestamps * 1e6).astype(np.int64).view('datetime64[us]')
+    values = np.empty((count, len(columns)), dtype=np.float64)
+    if count:
+        # None becomes NaN on assignment.
+        values[:] = [row[1:] for row in rows]
+    return Series(dates, {column: values[:, index] for index, column in enumerate(columns)})
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Downsamples a series with Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last points and, from each of threshold - 2 equal
+    buckets in between, the point forming the largest triangle with the
+    point kept from the previous bucket and the mean of the next bucket.
+    Peaks and troughs survive, so the plotted line keeps its shape while
+    the work depends on threshold rather than on the length of the series.
+
+    Args:
+        x (np.ndarray): ascending x values, numeric or datetime64.
+        y (np.ndarray): y values.
+        threshold (int): number of points to keep.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the kept x and y values.
+    """
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return x, y
+    x_values = x.view(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+    x_values = x_values.astype(np.float64) - float(x_values[0])
+    y_values = y.astype(np.float64)
+    # Bucket i spans edges[i]:edges[i + 1]; the last edge is the final point.
+    edges = (np.arange(threshold - 1) * (count - 2) / (threshold - 2)).astype(np.int64) + 1
+    edges[-1] = count - 1
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_x = x_values[end:next_end].mean()
+        next_y = y_values[end:next_end].mean()
+        areas = np.abs((x_values[previous] - next_x) * (y_values[start:end] - y_values[previous])
+                       - (x_values[previous] - x_values[start:end]) * (next_y - y_values[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return x[kept], y[kept]
@@ -0,0 +1,120 @@
+from decimal import Decimal
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .backends import forget_user
+from .caching import bump_versions, invalidate_items
+from .models import InventoryValuation, Item, ItemHistory, ItemVisibility, User
+from .rollups import record_change
+from .search import get_backend
+
+# Migration that creates the search index.
+SEARCH_INDEX_MIGRATION = '0005_item_search_index'
+
+
+def valuations_enabled() -> bool:
+    return getattr(settings, 'MATERIALIZED_VALUATIONS', False)
+
+
+def item_worth(item_ids: Iterable[int]) -> Decimal:
+    """Current worth of some Items, together."""
+    return Item.objects.filter(id__in=list(item_ids)).total_worth()
+
+
+@receiver(pre_save, sender=Item)
+def remember_item_worth(sender: Any, instance: Item, **kwargs) -> None:
+    """Records an edited Item's worth before the save, to shift valuations by the difference."""
+    if valuations_enabled() and instance.pk is not None:
+        instance._saved_worth = item_worth([instance.pk])
+
+
+@receiver(post_save, sender=Item)
+def refresh_item_valuations(sender: Any, instance: Item, **kwargs) -> None:
+    """Shifts the valuation, and expires the cached pages, of every user who can see a created or edited Item."""
+    viewer_ids = list(ItemVisibility.objects.filter(item=instance).values_list('user_id', flat=True))
+    bump_versions(viewer_ids)
+    if valuations_enabled() and viewer_ids:
+        InventoryValuation.shift(viewer_ids, item_worth([instance.pk]) - getattr(
+            instance, '_saved_worth', Decimal(0)))
+
+
+@receiver(pre_delete, sender=Item)
+def remember_item_viewers(sender: Any, instance: Item, **kwargs) -> None:
+    """Records who could see an Item before its visibility rows cascade away."""
+    instance._viewer_ids = list(ItemVisibility.objects.filter(
+        item=instance).values_list('user_id', flat=True))
+
+
+@receiver(post_delete, sender=Item)
+def refresh_deleted_item_valuations(sender: Any, instance: Item, **kwargs) -> None:
+    """Expires the cached pages of every user who could see a deleted Item.
+
+    Their valuations were shifted as its visibility rows cascaded away.
+    """
+    bump_versions(getattr(instance, '_viewer_ids', []))
+
+
+@receiver(post_save, sender=ItemVisibility)
+@receiver(post_delete, sender=ItemVisibility)
+def refresh_visibility_valuation(sender: Any, instance: ItemVisibility, signal: Any, **kwargs) -> None:
+    """Shifts the valuation of a user gaining or losing sight of an Item.
+
+    The other viewers' cached pages go too, since they show who can see it.
+    A deleted Item's visibility rows go before the Item row, so its worth
+    can still be read.
+    """
+    bump_versions([instance.user_id])
+    invalidate_items([instance.item_id])
+    if not valuations_enabled():
+        return
+    if signal is post_delete:
+        InventoryValuation.shift([instance.user_id], -item_worth([instance.item_id]), -1)
+    elif kwargs.get('created'):
+        InventoryValuation.shift([instance.user_id], item_worth([instance.item_id]), 1)
+
+
+@receiver(m2m_changed, sender=Item.visible_to.through)
+def refresh_bulk_visibility_valuations(sender: Any, instance: Any, action: str,
+                                       reverse: bool, pk_set: Any, **kwargs) -> None:
+    """Shifts valuations after visible_to.add(), which bulk inserts without post_save."""
+    if action != 'post_add' or not pk_set:
+        return
+    invalidate_items(pk_set if reverse else [instance.pk])
+    if not valuations_enabled():
+        return
+    if reverse:
+        InventoryValuation.shift([instance.pk], item_worth(pk_set), len(pk_set))
+    else:
+        InventoryValuation.shift(pk_set, item_worth([instance.pk]), 1)
+
+
+@receiver(post_save, sender=ItemHistory)
+def roll_up_history(sender: Any, instance: ItemHistory, created: bool, **kwargs) -> None:
+    """Folds each new ItemHistory row into its item's day and week rollups."""
+    if created and not kwargs.get('raw'):
+        record_change(instance)
+        if instance.item_id_id is not None:
+            invalidate_items([instance.item_id_id])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender: Any, instance: User, **kwargs) -> None:
+    """Drops the cached copy of a changed User, and starts a new user on fresh cached pages."""
+    forget_user(instance.pk)
+    bump_versions([instance.pk])
+
+
+@receiver(post_migrate)
+def reinstall_search_index(sender: Any, app_config: Any, using: str = 'default', **kwargs) -> None:
+    """Restores the search index triggers, which SQLite drops when a migration rebuilds home_item."""
+    if app_config.name != 'home':
+        return
+    connection = connections[using]
+    if ('home', SEARCH_INDEX_MIGRATION) in MigrationRecorder(connection).applied_migrations():
+        get_backend(connection).install()
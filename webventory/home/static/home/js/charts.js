@@ -0,0 +1,27 @@
+// Swaps each chart placeholder for its chart once the chart workers have
+// drawn it; the chart URL answers 202 with Retry-After until then.
+(function () {
+  function load(img, url) {
+    fetch(url, { credentials: 'same-origin' }).then(function (response) {
+      if (response.status === 202) {
+        var seconds = parseFloat(response.headers.get('Retry-After')) || 1;
+        setTimeout(function () { load(img, url); }, seconds * 1000);
+      } else if (response.ok) {
+        return response.blob().then(function (image) {
+          img.src = URL.createObjectURL(image);
+        });
+      } else {
+        img.removeAttribute('src');
+      }
+    });
+  }
+
+  document.querySelectorAll('img.chart[data-src]').forEach(function (img) {
+    if (img.dataset.src) {
+      load(img, img.dataset.src);
+    } else {
+      // Too little history to chart; show the alt text.
+      img.removeAttribute('src');
+    }
+  });
+})();
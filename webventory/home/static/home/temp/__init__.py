@@ -1 +0,0 @@
-# file to hold temp folder in place.
\ No newline at end of file
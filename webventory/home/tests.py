@@ -1,3 +1,1075 @@
-from django.test import TestCase
+import asyncio
+import io
+import pickle
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from openpyxl import load_workbook
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import async_views, views
+from .adjustments import Adjustment, VersionConflict, apply_adjustments, update_versioned
+from .archive import archive_history, restore_history
+from .backends import user_key
+from .benchmarks import regressions, start
+from .caching import bump_versions
+from .deletion import delete_items, purge_pending
+from .chartpool import ChartCancelled, ChartPool
+from .charts import (HistoryVersion, LRUCache, chart_cache, chart_points, chart_pool, chart_resolution,
+                     chart_urls, history_queryset, history_version, parse_date)
+from .decorators import replica_reads
+from .directory import lookup_users
+from .exporter import ITEM_COLUMNS
+from .gen_mock_data import generate_mock_data
+from .models import (InventoryValuation, Item, ItemHistory, ItemHistoryArchive, ItemHistoryRollup,
+                     ItemPurge, ItemVisibility, User)
+from .importer import import_history, import_items
+from .instrumentation import InstrumentationMiddleware, RequestProfile, current_profile, store
+from .pagination import KeysetPaginator
+from .rollups import rebuild
+from .routers import PIN_COOKIE, ReplicaMiddleware, ReplicaRouter
+from .search import SearchBackend, search_items
+from .series import extract_series, lttb
+
+
+def create_item(owner: User, name: str = "widget", quantity: int = 1,
+                price: str = "1.00", shared_with=()) -> Item:
+    """Creates an item owned by, and visible to, owner."""
+    item = Item.objects.create(name=name, description="description",
+                               quantity=quantity, price=price, owner=owner)
+    ItemVisibility.objects.bulk_create(
+        [ItemVisibility(item=item, user=user) for user in (owner, *shared_with)])
+    return item
+
+
+def create_history(item: Item, count: int) -> None:
+    """Creates count daily price and quantity changes for item."""
+    start = timezone.now() - timedelta(days=count)
+    ItemHistory.objects.bulk_create([
+        ItemHistory(item_id=item, date_of_change=start + timedelta(days=day),
+                    quantity_before=day, quantity_after=day + 1,
+                    price_before=day, price_after=day + 1.5)
+        for day in range(count)])
+
+
+class ItemVisibilityTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.joann = User.objects.create_user(username="joann", password="pw")
+
+    def test_visible_to_matches_exact_user(self):
+        item = create_item(self.joann)
+        self.assertFalse(Item.objects.visible_to(self.ann).exists())
+        self.assertEqual(list(Item.objects.visible_to(self.joann)), [item])
+
+    def test_shared_item_is_visible_but_not_owned(self):
+        item = create_item(self.ann, shared_with=[self.joann])
+        self.assertEqual(list(Item.objects.visible_to(self.joann)), [item])
+        self.assertFalse(Item.objects.owned_by(self.joann).exists())
+        self.assertEqual(item.get_user_visibility(), ["ann", "joann"])
+
+    def test_inventory_hides_items_of_other_users(self):
+        create_item(self.ann, name="secret")
+        self.client.force_login(self.joann)
+        response = self.client.get('/userInventory/')
+        self.assertNotContains(response, "secret")
+
+
+@override_settings(MATERIALIZED_VALUATIONS=True)
+class InventoryValuationTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.bob = User.objects.create_user(username="bob", password="pw")
+
+    def test_total_worth_is_aggregated_in_sql(self):
+        create_item(self.ann, quantity=3, price="2.50")
+        create_item(self.ann, quantity=2, price="1.25")
+        self.assertEqual(Item.objects.visible_to(self.ann).total_worth(),
+                         Decimal("10.00"))
+
+    def test_valuation_follows_item_and_visibility_writes(self):
+        item = create_item(self.ann, quantity=3, price="2.00")
+        self.assertEqual(InventoryValuation.total_assets_for(self.ann), Decimal("6.00"))
+        item.quantity = 5
+        item.save()
+        self.assertEqual(InventoryValuation.total_assets_for(self.ann), Decimal("10.00"))
+        item.visible_to.add(self.bob)
+        self.assertEqual(InventoryValuation.total_assets_for(self.bob), Decimal("10.00"))
+        item.delete()
+        self.assertEqual(InventoryValuation.total_assets_for(self.ann), Decimal("0"))
+        self.assertEqual(InventoryValuation.total_assets_for(self.bob), Decimal("0"))
+
+    def test_writes_shift_valuations_without_recomputing_them(self):
+        other = create_item(self.ann, quantity=1, price="4.00")
+        self.assertEqual(InventoryValuation.total_assets_for(self.ann), Decimal("4.00"))
+        self.assertEqual(InventoryValuation.total_assets_for(self.bob), Decimal("0"))
+        with mock.patch.object(InventoryValuation, 'refresh') as refresh:
+            item = Item.objects.create(name="bolt", description="d", quantity=3, price="2.00", owner=self.ann)
+            ItemVisibility.objects.create(item=item, user=self.ann)
+            item.visible_to.add(self.bob)
+            item.quantity = 5
+            item.save()
+            apply_adjustments(self.ann, [Adjustment(item_id=other.id, quantity_delta=2)])
+            ItemVisibility.objects.filter(item=other, user=self.ann).delete()
+            delete_items(self.ann, [item.id])
+        refresh.assert_not_called()
+        valuations = InventoryValuation.objects.order_by('user__username').values_list('total_assets', 'item_count')
+        self.assertEqual(list(valuations), [(Decimal("0"), 0), (Decimal("0"), 0)])
+        other.visible_to.add(self.bob)
+        self.assertEqual(InventoryValuation.total_assets_for(self.bob), Decimal("12.00"))
+        call_command('rebuild_valuations', stdout=io.StringIO())
+        self.assertEqual(list(valuations.all()), [(Decimal("0"), 0), (Decimal("12.00"), 1)])
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.bob = User.objects.create_user(username="bob", password="pw")
+        # Interleave owners so ann's ids are spread across the id space.
+        self.ann_items = []
+        for index in range(7):
+            self.ann_items.append(create_item(self.ann, name=f"a{index}"))
+            for _ in range(5):
+                create_item(self.bob)
+        self.paginator = KeysetPaginator(Item.objects.visible_to(self.ann), per_page=3)
+
+    def test_pages_are_full_and_ordered(self):
+        first = self.paginator.page()
+        self.assertEqual(first.items, self.ann_items[:3])
+        self.assertTrue(first.has_next)
+        self.assertFalse(first.has_previous)
+        second = self.paginator.page(after=first.next_cursor)
+        self.assertEqual(second.items, self.ann_items[3:6])
+        last = self.paginator.page(after=second.next_cursor)
+        self.assertEqual(last.items, self.ann_items[6:])
+        self.assertFalse(last.has_next)
+
+    def test_previous_page_from_before_cursor(self):
+        last = self.paginator.page(after=self.ann_items[5].id)
+        previous = self.paginator.page(before=last.previous_cursor)
+        self.assertEqual(previous.items, self.ann_items[3:6])
+        self.assertEqual(previous.after, self.ann_items[2].id)
+        self.assertTrue(previous.has_previous)
+        first = self.paginator.page(before=previous.previous_cursor)
+        self.assertEqual(first.items, self.ann_items[:3])
+        self.assertFalse(first.has_previous)
+
+
+class ItemChartTests(TestCase):
+    def setUp(self):
+        chart_cache.clear()
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.item = create_item(self.ann)
+        create_history(self.item, 5)
+        self.client.force_login(self.ann)
+
+    def test_chart_is_served_and_revalidated_by_etag(self):
+        url = chart_urls(self.item.id)['price']
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        self.assertEqual(len(chart_cache), 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_stale_chart_url_redirects_to_current_chart(self):
+        url = chart_urls(self.item.id)['quantity']
+        create_history(self.item, 1)
+        response = self.client.get(url)
+        self.assertRedirects(response, chart_urls(self.item.id)['quantity'],
+                             fetch_redirect_response=False)
+
+    def test_chart_of_invisible_item_is_not_found(self):
+        url = chart_urls(self.item.id)['price']
+        self.client.force_login(User.objects.create_user(username="bob", password="pw"))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(CHART_WORKERS=1)
+class ChartPoolTests(TestCase):
+    def setUp(self):
+        self.pool = ChartPool(LRUCache(8))
+        self.dates = np.arange(50, dtype=np.int64).view('datetime64[D]')
+        self.values = np.arange(50, dtype=np.float64)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def draw(self, key):
+        return self.pool.submit(key, lambda: (self.dates, self.values, True, 'png'))
+
+    def test_identical_charts_share_one_job(self):
+        first, second = self.draw('a'), self.draw('a')
+        self.assertIs(first, second)
+        self.assertTrue(first.result(timeout=60).startswith(b'\x89PNG'))
+        self.assertIsNotNone(self.pool.cache.get('a'))
+        self.assertEqual(self.pool.pending, {})
+
+    def test_cancelled_drawing_fails_its_job(self):
+        drawing = Future()
+        with mock.patch.object(self.pool, 'run', return_value=drawing):
+            job = self.draw('a')
+        drawing.cancel()
+        with self.assertRaises(ChartCancelled):
+            job.result(timeout=1)
+        self.assertEqual(self.pool.pending, {})
+        self.assertEqual(views.chart_not_drawn(job.exception()).status_code, 503)
+
+    @override_settings(CHART_WORKER_JOBS=1)
+    def test_workers_are_recycled_after_their_jobs(self):
+        self.draw('a').result(timeout=60)
+        executor = self.pool.executor
+        self.draw('b').result(timeout=60)
+        self.assertIsNot(self.pool.executor, executor)
+
+    @override_settings(CHART_WORKER_MEMORY_MB=1)
+    def test_workers_cannot_outgrow_their_memory_limit(self):
+        with self.assertRaises((MemoryError, BrokenProcessPool)):
+            self.draw('a').result(timeout=60)
+
+    @override_settings(CHART_WAIT_SECONDS=0)
+    def test_chart_still_drawing_answers_202(self):
+        chart_cache.clear()
+        ann = User.objects.create_user(username="ann", password="pw")
+        item = create_item(ann)
+        create_history(item, 5)
+        self.client.force_login(ann)
+        url = chart_urls(item.id)['price']
+        response = self.client.get(url)
+        self.assertEqual((response.status_code, response['Retry-After']), (202, '1'))
+        digest = url.rsplit('/', 1)[1].split('.')[0]
+        job = chart_pool.pending.get(digest)
+        if job is not None:
+            job.result(timeout=60)
+        self.assertEqual(self.client.get(url)['Content-Type'], 'image/png')
+
+
+class ItemHistoryIndexTests(TestCase):
+    def test_insights_history_query_is_an_ordered_index_range_scan(self):
+        item = create_item(User.objects.create_user(username="ann", password="pw"))
+        create_history(item, 30)
+        end = timezone.now()
+        rows = history_queryset(item.id, end - timedelta(days=10), end).order_by('date_of_change', 'id')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # A table this small would otherwise be read sequentially.
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = rows.values_list('date_of_change', 'price_after').explain()
+        self.assertIn('itemhistory_item_date', plan)
+        # Neither SQLite's nor PostgreSQL's plan may sort the rows it read.
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotIn('Sort', plan)
+
+
+class ExtractSeriesTests(TestCase):
+    def test_columns_are_aligned_and_masked(self):
+        item = create_item(User.objects.create_user(username="ann", password="pw"))
+        create_history(item, 4)
+        ItemHistory.objects.filter(quantity_after=2).update(quantity_after=0)
+        series = extract_series(ItemHistory.objects.order_by('date_of_change'),
+                                ['price_after', 'quantity_after'])
+        self.assertEqual(len(series), 4)
+        dates, quantities = series.points('quantity_after')
+        self.assertEqual(quantities.tolist(), [1, 3, 4])
+        self.assertEqual(dates.tolist(), series.dates[[0, 2, 3]].tolist())
+        _, quantities = series.points('quantity_after', drop_zeros=False)
+        self.assertEqual(quantities.tolist(), [1, 0, 3, 4])
+
+
+class LttbTests(TestCase):
+    def test_keeps_endpoints_and_peaks(self):
+        x = np.arange(10000)
+        y = np.sin(x / 500)
+        y[4321] = 25
+        kept_x, kept_y = lttb(x, y, 200)
+        self.assertEqual(len(kept_x), 200)
+        self.assertEqual((kept_x[0], kept_x[-1]), (0, 9999))
+        self.assertIn(4321, kept_x)
+        self.assertTrue(np.all(np.diff(kept_x) > 0))
+
+    def test_short_series_is_unchanged(self):
+        x = np.arange(5)
+        kept_x, _ = lttb(x, x * 2.0, 10)
+        self.assertIs(kept_x, x)
+
+
+class ItemHistoryRollupTests(TestCase):
+    def setUp(self):
+        self.item = create_item(User.objects.create_user(username="ann", password="pw"))
+        start = timezone.now().replace(hour=12) - timedelta(days=3)
+        for hours, price, quantity in [(0, 5, 10), (1, 2, 12), (2, 7, 8), (26, 4, 3)]:
+            ItemHistory.objects.create(
+                item_id=self.item, date_of_change=start + timedelta(hours=hours),
+                quantity_before=0, quantity_after=quantity, price_before=0, price_after=price)
+
+    def rollups(self):
+        return list(ItemHistoryRollup.objects.filter(period=ItemHistoryRollup.DAY).order_by(
+            'period_start').values_list('price_open', 'price_close', 'price_min', 'price_max',
+                                        'quantity_min', 'quantity_max', 'change_count'))
+
+    def test_changes_are_rolled_up_as_they_are_written(self):
+        self.assertEqual(self.rollups(), [(5, 7, 2, 7, 8, 12, 3), (4, 4, 4, 4, 3, 3, 1)])
+        week_counts = ItemHistoryRollup.objects.filter(
+            period=ItemHistoryRollup.WEEK).values_list('change_count', flat=True)
+        self.assertEqual(sum(week_counts), 4)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        incremental = self.rollups()
+        ItemHistoryRollup.objects.all().delete()
+        rebuild()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_coarse_ranges_are_charted_from_rollups(self):
+        now = timezone.now()
+        self.assertIsNone(chart_resolution(HistoryVersion("", 100, now - timedelta(days=900), now)))
+        self.assertEqual(chart_resolution(HistoryVersion("", 5000, now - timedelta(days=30), now)), None)
+        self.assertEqual(chart_resolution(HistoryVersion("", 5000, now - timedelta(days=300), now)),
+                         ItemHistoryRollup.DAY)
+        self.assertEqual(chart_resolution(HistoryVersion("", 5000, now - timedelta(days=2000), now)),
+                         ItemHistoryRollup.WEEK)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.bob = User.objects.create_user(username="bob", password="pw")
+
+    def test_items_are_created_shared_and_rejected_by_row(self):
+        stream = io.StringIO(
+            "name,description,quantity,price,visible_to\n"
+            "bolt,steel bolt,10,0.25,bob\n"
+            "nut,steel nut,many,0.10,\n"
+            "washer,steel washer,5,0.05,carol\n"
+            "screw,wood screw,7,0.15,\n")
+        report = import_items(stream, self.ann, chunk_size=2)
+        self.assertEqual((report.created, report.updated, report.rejected), (2, 0, 2))
+        self.assertEqual([line for line, _ in report.rejections], [3, 4])
+        self.assertEqual(sorted(Item.objects.visible_to(self.ann).values_list('name', flat=True)),
+                         ["bolt", "screw"])
+        self.assertEqual(list(Item.objects.visible_to(self.bob).values_list('name', flat=True)),
+                         ["bolt"])
+
+    def test_items_are_updated_only_by_their_owner(self):
+        item = create_item(self.ann, name="old")
+        stream = io.StringIO(f'{{"id": {item.id}, "name": "new", "description": "d", '
+                             f'"quantity": 3, "price": "1.50"}}\nnot json\n')
+        report = import_items(stream, self.bob, fmt='jsonl')
+        self.assertEqual((report.updated, report.rejected), (0, 2))
+        report = import_items(io.StringIO(stream.getvalue().splitlines()[0]), self.ann, fmt='jsonl')
+        self.assertEqual(report.updated, 1)
+        item.refresh_from_db()
+        self.assertEqual((item.name, item.quantity), ("new", 3))
+
+    @override_settings(MATERIALIZED_VALUATIONS=True)
+    def test_updates_refresh_viewers_not_named_in_the_row(self):
+        carol = User.objects.create_user(username="carol", password="pw")
+        item = create_item(self.ann, quantity=1, price="1.00")
+        item.visible_to.add(carol)
+        self.assertEqual(InventoryValuation.total_assets_for(carol), Decimal("1.00"))
+        import_items(io.StringIO(f"id,name,description,quantity,price\n{item.id},bolt,b,5,2.00\n"), self.ann)
+        self.assertEqual(InventoryValuation.total_assets_for(carol), Decimal("10.00"))
+
+    def test_imported_items_never_reuse_deleted_ids(self):
+        deleted = create_item(self.ann)
+        deleted_id = deleted.id
+        deleted.delete()
+        import_items(io.StringIO("name,description,quantity,price\nbolt,b,1,1\nnut,n,2,2\n"), self.ann)
+        ids = sorted(Item.objects.owned_by(self.ann).values_list('id', flat=True))
+        self.assertEqual(ids, [deleted_id + 1, deleted_id + 2])
+        self.assertEqual(sorted(ItemVisibility.objects.filter(user=self.ann).values_list('item_id', flat=True)),
+                         ids)
+
+    def test_history_is_imported_and_rolled_up(self):
+        item = create_item(self.ann)
+        stream = io.StringIO(
+            "item_id,date_of_change,quantity_before,quantity_after,price_before,price_after\n"
+            f"{item.id},2021-11-01T10:00:00,1,5,1.00,2.00\n"
+            f"{item.id},2021-11-01T11:00:00,5,4,2.00,2.50\n"
+            f"{item.id},yesterday,4,3,2.50,2.75\n")
+        report = import_history(stream, self.ann, chunk_size=1)
+        self.assertEqual((report.created, report.rejected), (2, 1))
+        rollup = ItemHistoryRollup.objects.get(item=item, period=ItemHistoryRollup.DAY)
+        self.assertEqual((rollup.price_open, rollup.price_close, rollup.change_count), (2.0, 2.5, 2))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.client.force_login(self.ann)
+
+    def test_items_export_streams_visible_items(self):
+        create_item(self.ann, name="bolt", quantity=3, price="0.25")
+        create_item(User.objects.create_user(username="bob", password="pw"), name="secret")
+        response = self.client.get('/export/items.csv')
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ["id,name,description,quantity,price,owner",
+                                 f"{Item.objects.get(name='bolt').id},bolt,description,3,0.25,ann"])
+
+    def test_items_export_as_a_workbook(self):
+        self.ann.username = "a" * 30
+        self.ann.save()
+        create_item(self.ann, name="bolt", quantity=3, price="0.25")
+        response = self.client.get('/export/items.xlsx')
+        self.assertEqual(response.status_code, 200)
+        sheet = load_workbook(io.BytesIO(b"".join(response.streaming_content))).active
+        self.assertEqual(sheet.title, ("a" * 30 + "-inventory")[:31])
+        self.assertEqual([list(row) for row in sheet.iter_rows(values_only=True)],
+                         [list(ITEM_COLUMNS), [Item.objects.get().id, "bolt", "description", 3, 0.25, "a" * 30]])
+
+    def test_history_export_round_trips_through_import(self):
+        item = create_item(self.ann)
+        create_history(item, 3)
+        response = self.client.get(f'/export/{item.id}/history.csv')
+        exported = b"".join(response.streaming_content).decode()
+        self.assertEqual(len(exported.splitlines()), 4)
+        report = import_history(io.StringIO(exported), self.ann)
+        self.assertEqual((report.created, report.rejected), (3, 0))
+
+    def test_history_of_invisible_item_is_not_exported(self):
+        item = create_item(User.objects.create_user(username="bob", password="pw"))
+        self.assertEqual(self.client.get(f'/export/{item.id}/history.csv').status_code, 404)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.client.force_login(self.ann)
+        self.item = create_item(self.ann)
+        create_history(self.item, 400)
+        self.cutoff = timezone.now() - timedelta(days=365)
+
+    def export(self, **bounds):
+        response = self.client.get(f'/export/{self.item.id}/history.csv', bounds)
+        return b"".join(response.streaming_content).decode().splitlines()
+
+    def test_old_months_are_archived_and_restored_losslessly(self):
+        exported = self.export()
+        report = archive_history(self.cutoff)
+        self.assertGreater(report["rows"], 0)
+        self.assertEqual(ItemHistory.objects.count(), 400 - report["rows"])
+        self.assertFalse(ItemHistory.objects.filter(date_of_change__lt=self.cutoff - timedelta(days=31)).exists())
+        self.assertEqual(sum(ItemHistoryArchive.objects.values_list('row_count', flat=True)), report["rows"])
+        self.assertEqual(self.export(), exported)
+        # Archiving again merges into the existing months.
+        self.assertEqual(archive_history(self.cutoff)["rows"], 0)
+        self.assertEqual(restore_history(), report["rows"])
+        self.assertEqual(ItemHistory.objects.count(), 400)
+        self.assertFalse(ItemHistoryArchive.objects.exists())
+        self.assertEqual(self.export(), exported)
+
+    def test_half_open_ranges_are_limited_by_their_one_bound(self):
+        start = timezone.localtime(timezone.now() - timedelta(days=390)).strftime('%Y-%m-%d')
+        exported = self.export(start=start)
+        self.assertEqual(len(exported), 1 + 390)
+        archive_history(self.cutoff)
+        self.assertEqual(self.export(start=start), exported)
+        self.assertIn(f"?start={start}", chart_urls(self.item.id, *views.date_range(
+            parse_date(start), None))['price'])
+
+    def test_charts_and_rollups_read_through_the_archive(self):
+        before = history_version(self.item.id)
+        archive_history(self.cutoff)
+        after = history_version(self.item.id)
+        self.assertNotEqual(after.version, before.version)
+        self.assertEqual((after.count, after.first, after.last), (before.count, before.first, before.last))
+        dates, _ = chart_points(self.item.id, 'price', None, None, after)
+        self.assertEqual(len(dates), 400)
+        rebuild()
+        day_counts = ItemHistoryRollup.objects.filter(period=ItemHistoryRollup.DAY).values_list(
+            'change_count', flat=True)
+        self.assertEqual(sum(day_counts), 400)
+
+
+class DeletionTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.bob = User.objects.create_user(username="bob", password="pw")
+        self.client.force_login(self.ann)
+
+    def test_item_without_history_is_deleted(self):
+        item = create_item(self.ann)
+        self.assertRedirects(self.client.get(f'/userInventory/{item.id}/delete'), '/userInventory',
+                             fetch_redirect_response=False)
+        self.assertFalse(Item.objects.filter(id=item.id).exists())
+
+    def test_selection_is_deleted_all_or_nothing(self):
+        mine = [create_item(self.ann, shared_with=[self.bob]) for _ in range(3)]
+        theirs = create_item(self.bob)
+        response = self.client.post('/userInventory/delete', {"items": [item.id for item in mine + [theirs]]})
+        self.assertRedirects(response, '/userInventory/deleteError/1', fetch_redirect_response=False)
+        self.assertEqual(Item.objects.count(), 4)
+        self.client.post('/userInventory/delete', {"items": [item.id for item in mine]})
+        self.assertEqual(list(Item.objects.values_list('id', flat=True)), [theirs.id])
+
+    def test_query_count_does_not_grow_with_the_selection(self):
+        def queries(count):
+            items = [create_item(self.ann, shared_with=[self.bob]) for _ in range(count)]
+            for item in items:
+                create_history(item, 3)
+            with CaptureQueriesContext(connection) as captured:
+                delete_items(self.ann, [item.id for item in items])
+            return len(captured)
+
+        # The first delete creates the viewers' valuation rows; later ones update them.
+        queries(1)
+        self.assertEqual(queries(2), queries(8))
+
+    @override_settings(DELETE_INLINE_ROWS=5, DELETE_PURGE_CHUNK_SIZE=4)
+    def test_long_histories_are_hidden_then_purged_in_chunks(self):
+        short, long = create_item(self.ann), create_item(self.ann, shared_with=[self.bob])
+        create_history(short, 3)
+        create_history(long, 10)
+        rebuild()
+        self.assertEqual(delete_items(self.ann, [short.id, long.id]), {"deleted": 1, "purging": 1})
+        self.assertFalse(Item.objects.visible_to(self.bob).exists())
+        self.assertFalse(Item.objects.owned_by(self.ann).exists())
+        self.assertEqual(ItemHistory.objects.count(), 10)
+        self.assertEqual(purge_pending(), 10)
+        self.assertFalse(Item.objects.exists())
+        self.assertFalse(ItemHistory.objects.exists() or ItemPurge.objects.exists()
+                         or ItemHistoryRollup.objects.exists())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.bob = User.objects.create_user(username="bob", password="pw")
+
+    def test_prefix_matches_are_ranked_name_first(self):
+        described = create_item(self.ann, name="crate")
+        Item.objects.filter(id=described.id).update(description="holds hammers")
+        named = create_item(self.ann, name="hammer")
+        create_item(self.ann, name="wrench")
+        self.assertEqual(list(search_items(self.ann, "hamm")), [named, described])
+
+    def test_backend_is_detected_once_per_process(self):
+        create_item(self.ann, name="hammer")
+        search_items(self.ann, "hamm")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(search_items(self.ann, "hamm")), 1)
+        self.assertFalse([query for query in queries if 'compile_options' in query['sql']])
+
+    def test_backends_without_search_ids_cannot_be_built(self):
+        class Unfinished(SearchBackend):
+            pass
+
+        with self.assertRaises(TypeError):
+            Unfinished()
+
+    def test_index_follows_edits_and_deletes(self):
+        item = create_item(self.ann, name="bolt")
+        item.name = "rivet"
+        item.save()
+        self.assertFalse(search_items(self.ann, "bolt"))
+        self.assertEqual(list(search_items(self.ann, "riv")), [item])
+        item.delete()
+        self.assertFalse(search_items(self.ann, "rivet"))
+
+    def test_only_visible_items_are_found_and_paginated(self):
+        for number in range(3):
+            create_item(self.ann, name=f"gear {number}", shared_with=[self.bob])
+        create_item(self.ann, name="gear secret")
+        first = search_items(self.bob, "gear", per_page=2)
+        second = search_items(self.bob, "gear", page=2, per_page=2)
+        self.assertTrue(first.has_next)
+        self.assertEqual((len(second), second.has_next), (1, False))
+        self.assertNotIn("gear secret", [item.name for item in (*first, *second)])
+
+    def test_query_syntax_is_treated_as_text(self):
+        create_item(self.ann, name="bolt")
+        self.assertEqual(len(search_items(self.ann, 'bolt"* (')), 1)
+        self.assertFalse(search_items(self.ann, '"*'))
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.bob = User.objects.create_user(username="bob", password="pw")
+        self.client.force_login(self.ann)
+
+    def adjust(self, adjustments):
+        return self.client.post('/api/items/adjust', {"adjustments": adjustments},
+                                content_type='application/json')
+
+    def test_anonymous_clients_get_401(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/items').status_code, 401)
+
+    def test_create_list_and_delete(self):
+        response = self.client.post('/api/items', {"name": "bolt", "description": "steel", "quantity": 4,
+                                                   "price": "0.25", "visible_to": ["bob"]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        item_id = response.json()["id"]
+        self.client.force_login(self.bob)
+        self.assertEqual([item["id"] for item in self.client.get('/api/items').json()["items"]],
+                         [item_id])
+        self.assertEqual(self.client.delete(f'/api/items/{item_id}').status_code, 403)
+        self.client.force_login(self.ann)
+        self.assertEqual(self.client.delete(f'/api/items/{item_id}').status_code, 204)
+        self.assertFalse(Item.objects.filter(id=item_id).exists())
+
+    @override_settings(MATERIALIZED_VALUATIONS=True)
+    def test_created_items_count_towards_their_viewers_totals(self):
+        create_item(self.ann, quantity=1, price="1.00")
+        create_item(self.bob, quantity=1, price="3.00")
+        self.assertContains(self.client.get('/userInventory/'), "Worth: $1.00")
+        self.client.post('/api/items', {"name": "bolt", "description": "steel", "quantity": 4,
+                                        "price": "5.00", "visible_to": ["bob"]},
+                         content_type='application/json')
+        self.assertContains(self.client.get('/userInventory/'), "Worth: $21.00")
+        self.client.force_login(self.bob)
+        self.assertContains(self.client.get('/userInventory/'), "Worth: $23.00")
+
+    def test_batch_adjustments_take_a_constant_number_of_queries(self):
+        items = [create_item(self.ann, quantity=10, price="1.00") for _ in range(20)]
+        self.adjust([{"id": item.id, "quantity_delta": -1} for item in items])
+        with CaptureQueriesContext(connection) as small:
+            self.adjust([{"id": item.id, "quantity_delta": -1} for item in items[:2]])
+        with CaptureQueriesContext(connection) as large:
+            response = self.adjust([{"id": item.id, "quantity_delta": -1} for item in items[2:]])
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(response.status_code, 200)
+        self.adjust([{"id": item.id, "quantity_delta": -1} for item in items])
+        self.assertEqual(set(Item.objects.values_list('quantity', flat=True)), {7})
+        self.assertEqual(ItemHistory.objects.filter(quantity_before=8, quantity_after=7).count(), 20)
+
+    def test_batch_is_all_or_nothing(self):
+        item = create_item(self.ann, quantity=2)
+        hidden = create_item(self.bob)
+        response = self.adjust([{"id": item.id, "quantity": 5}, {"id": hidden.id, "quantity": 1},
+                                {"id": item.id, "quantity_delta": -9}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error["index"] for error in response.json()["errors"]], [1, 2])
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 2)
+        self.assertFalse(ItemHistory.objects.exists())
+
+    def test_patch_records_stock_changes(self):
+        item = create_item(self.ann, quantity=2, price="1.00")
+        response = self.client.patch(f'/api/items/{item.id}', {"name": "nut", "price": "1.50"},
+                                     content_type='application/json')
+        self.assertEqual((response.json()["name"], response.json()["price"]), ("nut", "1.50"))
+        self.assertEqual(ItemHistory.objects.get(item_id=item).price_after, 1.5)
+
+    def test_patch_refuses_stale_versions_with_409_and_bad_values_with_400(self):
+        item = create_item(self.ann, quantity=2)
+        self.client.patch(f'/api/items/{item.id}', {"quantity": 3}, content_type='application/json')
+        stale = self.client.patch(f'/api/items/{item.id}', {"quantity": 4, "version": 0},
+                                  content_type='application/json')
+        self.assertEqual(stale.status_code, 409)
+        self.assertIn("changed since version 0", stale.json()["error"])
+        negative = self.client.patch(f'/api/items/{item.id}', {"quantity_delta": -9, "version": 1},
+                                     content_type='application/json')
+        self.assertEqual(negative.status_code, 400)
+        self.assertIn("negative quantity", negative.json()["error"])
+        self.assertEqual(self.adjust([{"id": item.id, "quantity": 1, "version": 0}]).status_code, 409)
+        self.assertEqual(self.adjust([{"id": item.id, "quantity": 1, "version": 0},
+                                      {"id": item.id, "quantity": -1}]).status_code, 400)
+        item.refresh_from_db()
+        self.assertEqual((item.quantity, item.version), (3, 1))
+
+
+class AdjustmentTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user(username="ann", password="pw")
+
+    def test_stale_writes_are_detected(self):
+        item = create_item(self.ann, quantity=5)
+        apply_adjustments(self.ann, [Adjustment(item.id, quantity_delta=1)])
+        item.quantity = 1
+        with self.assertRaises(VersionConflict):
+            update_versioned([item], ['quantity'])
+        item.refresh_from_db()
+        self.assertEqual((item.quantity, item.version), (6, 1))
+
+    def test_edit_form_based_on_an_old_version_is_refused(self):
+        item = create_item(self.ann, quantity=5, price="1.00")
+        self.client.force_login(self.ann)
+        form = {"name": "widget", "description": "description", "price": "1.00"}
+        response = self.client.post(f'/userInventory/{item.id}/edit', dict(form, quantity=8, version=0))
+        self.assertEqual(response.status_code, 302)
+        response = self.client.post(f'/userInventory/{item.id}/edit', dict(form, quantity=3, version=0))
+        self.assertContains(response, "changed since version 0")
+        item.refresh_from_db()
+        self.assertEqual((item.quantity, item.version), (8, 1))
+        self.assertEqual(list(ItemHistory.objects.values_list('quantity_before', 'quantity_after')),
+                         [(5, 8)])
+
+
+class ConcurrentAdjustmentTests(TransactionTestCase):
+    writers = 4
+    adjustments_per_writer = 15
+
+    def test_parallel_writers_lose_no_updates(self):
+        ann = User.objects.create_user(username="ann", password="pw")
+        item = create_item(ann, quantity=0)
+        failures = []
+
+        def write():
+            try:
+                for _ in range(self.adjustments_per_writer):
+                    apply_adjustments(ann, [Adjustment(item.id, quantity_delta=1)], attempts=50)
+            except Exception as error:
+                failures.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write) for _ in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
+        item.refresh_from_db()
+        total = self.writers * self.adjustments_per_writer
+        self.assertEqual((item.quantity, item.version), (total, total))
+        changes = list(ItemHistory.objects.order_by('id').values_list('quantity_before', 'quantity_after'))
+        self.assertEqual(changes, [(count, count + 1) for count in range(total)])
+
+
+@skipUnless(settings.DATABASE_PROFILE == 'sqlite', "tests the tuned SQLite profile")
+class DatabaseProfileTests(TransactionTestCase):
+    def test_sqlite_connections_are_tuned_and_take_the_write_lock_up_front(self):
+        with connection.cursor() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone(), (1,))
+            self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone(), (20000,))
+        with CaptureQueriesContext(connection) as captured:
+            with transaction.atomic():
+                User.objects.count()
+        self.assertEqual(captured.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    def test_dropped_persistent_connections_are_replaced_once_per_request(self):
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'is_usable', return_value=False), \
+                mock.patch.object(connection, 'close') as close:
+            connection.close_if_unusable_or_obsolete()
+            close.reset_mock()
+            User.objects.count()
+            User.objects.count()
+        close.assert_called_once()
+
+
+@override_settings(DATABASE_REPLICAS=['replica0'])
+class ReplicaRouterTests(TestCase):
+    def route(self, method='get', cookies=None, write=False, marked=True):
+        """The alias a view read from, and the response, going through ReplicaMiddleware."""
+        router = ReplicaRouter()
+        seen = {}
+
+        def view(request):
+            seen['read'] = router.db_for_read(Item)
+            if write:
+                router.db_for_write(Item)
+            return HttpResponse()
+
+        if marked:
+            view = replica_reads(view)
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        middleware = ReplicaMiddleware(lambda request: middleware.process_view(request, view, (), {}) or view(request))
+        response = middleware(request)
+        return seen['read'], response
+
+    def test_marked_views_read_from_a_replica_and_writes_pin_the_primary(self):
+        self.assertEqual(self.route()[0], 'replica0')
+        self.assertIsNone(self.route(marked=False)[0])
+        self.assertIsNone(self.route(method='post')[0])
+        read, response = self.route(method='post', write=True)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+        self.assertIsNone(self.route(cookies={PIN_COOKIE: '1'})[0])
+        self.assertNotIn(PIN_COOKIE, self.route()[1].cookies)
+
+    def test_pages_read_from_a_lagging_replica_are_not_cached(self):
+        ann = User.objects.create_user(username="ann", password="pw")
+        bob = User.objects.create_user(username="bob", password="pw")
+        item = create_item(ann, name="bolt", shared_with=[bob])
+        request = RequestFactory().get('/')
+        request.user = bob
+        stale_page = views.inventory_page(request, 0, '')
+        item.name = "nut"
+        item.save()
+        self.client.force_login(bob)
+        # The replica has not caught up with the rename yet.
+        with mock.patch.object(views, 'inventory_page', return_value=stale_page):
+            self.assertContains(self.client.get('/userInventory/'), "bolt")
+        self.assertContains(self.client.get('/userInventory/'), "nut")
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertIsNone(ReplicaRouter().db_for_read(Item))
+        self.assertEqual(ReplicaRouter().db_for_write(Item), 'default')
+
+
+@override_settings(CHART_WORKERS=0)
+class AsyncViewTests(TransactionTestCase):
+    # Transactional, as the async views query from worker threads, each with its own connection.
+    def setUp(self):
+        chart_cache.clear()
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.bob = User.objects.create_user(username="bob", password="pw")
+        self.item = create_item(self.ann, name="bolt", quantity=4)
+        self.hidden = create_item(self.bob, name="secret")
+        create_history(self.item, 3)
+        create_history(self.hidden, 3)
+
+    def get(self, view, user, *args):
+        request = RequestFactory().get('/')
+        request.user = user
+        if asyncio.iscoroutinefunction(view):
+            return async_to_sync(view)(request, *args)
+        return view(request, *args)
+
+    def test_pages_read_concurrently_match_the_sync_views(self):
+        pages = ((async_views.user_inventory, views.user_inventory, "Quantity: 4"),
+                 (async_views.user_insights, views.user_insights, chart_urls(self.item.id)['price']))
+        for async_view, sync_view, expected in pages:
+            self.assertContains(self.get(async_view, self.ann, self.item.id), expected)
+            # The sync view reads the data the async one cached.
+            with self.assertNumQueries(0):
+                self.assertContains(self.get(sync_view, self.ann, self.item.id), expected)
+
+    def test_items_the_user_may_not_see_are_left_out(self):
+        response = self.get(async_views.user_inventory, self.bob, self.item.id)
+        self.assertNotContains(response, "Quantity: 4")
+        self.assertNotContains(self.get(async_views.user_insights, self.bob, self.item.id), "/chart/")
+        self.assertEqual(self.get(async_views.user_inventory, AnonymousUser()).status_code, 302)
+
+    def test_chart_is_awaited_from_the_chart_pool(self):
+        _, _, item_id, metric, name = chart_urls(self.item.id)['price'].split('/')
+        digest, fmt = name.split('.')
+        response = self.get(async_views.item_chart, self.ann, int(item_id), metric, digest, fmt)
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        with self.assertRaises(Http404):
+            self.get(async_views.item_chart, self.bob, int(item_id), metric, digest, fmt)
+
+    @override_settings(INSTRUMENTATION=True)
+    def test_instrumentation_stays_async_and_counts_worker_thread_queries(self):
+        store.clear()
+        bump_versions([self.ann.id])
+
+        async def view(request):
+            return await async_views.user_inventory(request, self.item.id)
+
+        middleware = InstrumentationMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        request = RequestFactory().get('/')
+        request.user = self.ann
+        response = async_to_sync(middleware)(request)
+        self.assertContains(response, "Quantity: 4")
+        self.assertIn("db;desc=", response['Server-Timing'])
+        self.assertGreater(store.report()['unmatched']['queries']['p50'], 0)
+
+
+class InventoryCacheTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.bob = User.objects.create_user(username="bob", password="pw")
+        self.item = create_item(self.ann, name="bolt", quantity=4, shared_with=[self.bob])
+        self.client.force_login(self.ann)
+
+    def test_repeat_page_views_skip_the_database(self):
+        for url in (f'/userInventory/{self.item.id}/', f'/userInsights/{self.item.id}/',
+                    f'/userInventory/{self.item.id}/edit'):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_cached_user_leaves_out_the_password_hash(self):
+        url = f'/userInventory/{self.item.id}/'
+        self.client.get(url)
+        cached = cache.get(user_key(self.ann.id))
+        self.assertNotIn(self.ann.password.encode(), pickle.dumps(cached))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.ann.set_password("new")
+        self.ann.save()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_changes_by_a_sharing_user_expire_the_cached_page(self):
+        url = f'/userInventory/{self.item.id}/'
+        self.assertContains(self.client.get(url), "Quantity: 4")
+        apply_adjustments(self.bob, [Adjustment(self.item.id, quantity=9)])
+        self.assertContains(self.client.get(url), "Quantity: 9")
+        Item.objects.get(id=self.item.id).delete()
+        self.assertNotContains(self.client.get('/userInventory/'), "bolt")
+
+
+class UserDirectoryTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.item = create_item(self.ann, name="bolt")
+        self.client.force_login(self.ann)
+
+    def create_users(self, prefix, count):
+        User.objects.bulk_create([User(username=f"{prefix}{number:03}") for number in range(count)])
+
+    def test_prefix_lookup_is_paginated(self):
+        self.create_users("clerk", 25)
+        self.create_users("driver", 3)
+        page = lookup_users("clerk", per_page=20)
+        self.assertEqual(len(page), 20)
+        self.assertTrue(page.has_next)
+        rest = lookup_users("clerk", after=page.next_cursor, per_page=20)
+        self.assertEqual([user.username for user in rest], [f"clerk{number:03}" for number in range(20, 25)])
+        self.assertFalse(rest.has_next)
+        response = self.client.get('/api/users', {"q": "dri", "item": self.item.id}).json()
+        self.assertEqual(response, {"users": [{"username": f"driver{number:03}", "visible": False}
+                                              for number in range(3)], "next": None})
+
+    def test_visibility_changes_touch_only_named_users(self):
+        self.create_users("clerk", 3)
+        clerks = list(User.objects.filter(username__startswith="clerk"))
+        self.item.visible_to.add(clerks[0])
+        response = self.client.post(f'/api/items/{self.item.id}/visibility',
+                                    {"add": ["clerk001"], "remove": ["clerk000", "ann"]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.item.get_user_visibility(), ["ann", "clerk001"])
+        response = self.client.post(f'/api/items/{self.item.id}/visibility', {"add": ["nobody"]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_the_owner_changes_visibility(self):
+        self.create_users("clerk", 2)
+        self.item.visible_to.add(*User.objects.filter(username__startswith="clerk"))
+        self.client.force_login(User.objects.get(username="clerk000"))
+        response = self.client.post(f'/api/items/{self.item.id}/visibility', {"remove": ["clerk001"]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(f'/userVisibility/{self.item.id}/0/',
+                                    {"shown": ["clerk001"], "visible": []})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.item.get_user_visibility(), ["ann", "clerk000", "clerk001"])
+
+    def test_visibility_page_cost_does_not_grow_with_accounts(self):
+        url = f'/userVisibility/{self.item.id}/0/'
+        self.create_users("clerk", 5)
+        for visible in ("clerk000", "clerk001"):
+            self.client.post(url, {"shown": ["clerk000", "clerk001"], "visible": [visible]})
+        with CaptureQueriesContext(connection) as few:
+            self.client.post(url, {"shown": ["clerk000", "clerk001"], "visible": ["clerk000"]})
+        self.create_users("temp", 200)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.post(url, {"shown": ["clerk000", "clerk001"], "visible": ["clerk001"]})
+        self.assertEqual(len(few), len(many))
+        self.assertContains(response, "Modification Successful")
+        self.assertEqual(self.item.get_user_visibility(), ["ann", "clerk001"])
+
+
+@override_settings(INSTRUMENTATION=True)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        store.clear()
+        self.ann = User.objects.create_user(username="ann", password="pw")
+        self.client.force_login(self.ann)
+
+    def test_requests_are_profiled_per_route(self):
+        item = create_item(self.ann)
+        create_history(item, 3)
+        response = self.client.get(f'/userInsights/{item.id}/')
+        self.assertIn("db;desc=", response['Server-Timing'])
+        self.client.get(chart_urls(item.id)['price'])
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.ann.is_staff = True
+        self.ann.save()
+        report = self.client.get('/metrics').json()
+        insights = report['userInsights/<int:item_id>/']
+        self.assertEqual(insights["count"], 1)
+        self.assertGreater(insights["queries"]["p50"], 0)
+        self.assertGreater(insights["template_seconds"]["p50"], 0)
+        self.assertGreater(report['chart/<int:item_id>/<slug:metric>/<slug:digest>.<slug:fmt>']
+                           ["graph_seconds"]["p99"], 0)
+        text = self.client.get('/metrics', {"format": "prometheus"}).content.decode()
+        self.assertIn('webventory_request_queries_count{route="userInsights/<int:item_id>/"} 1', text)
+
+    def test_repeated_queries_are_counted_as_duplicates(self):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            with connection.execute_wrapper(profile.record_query):
+                for user_id in range(3):
+                    list(User.objects.filter(id=user_id))
+        finally:
+            current_profile.reset(token)
+        self.assertEqual((profile.queries, profile.duplicate_queries), (3, 2))
+
+    @override_settings(INSTRUMENTATION=False)
+    def test_disabled_instrumentation_records_nothing(self):
+        response = self.client.get('/userInventory/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(store.report(), {})
+
+
+class ScalingTests(TestCase):
+    def pages(self, prefix, items, history):
+        created = generate_mock_data(users=3, items_per_user=items, history_per_item=history,
+                                     shares_per_item=1, prefix=prefix)
+        user_id, item_id = created['user_ids'][0], created['item_ids'][0]
+        self.client.force_login(User.objects.get(id=user_id))
+        return user_id, ['/userInventory/', f'/userInventory/{item_id}/', f'/userInventory/{item_id}/edit',
+                         f'/userInsights/{item_id}/', f'/userVisibility/{item_id}/', '/create']
+
+    def query_counts(self, user_id, urls):
+        counts = []
+        for url in urls:
+            bump_versions([user_id])
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts.append((len(queries), response.content.count(b'<tr')))
+        return counts
+
+    def test_pages_run_no_queries_while_rendering(self):
+        queries_while_rendering = []
+
+        def render(*args, **kwargs):
+            with CaptureQueriesContext(connection) as queries:
+                response = original_render(*args, **kwargs)
+            queries_while_rendering.append(len(queries))
+            return response
+
+        original_render = views.render
+        user_id, urls = self.pages('render', items=12, history=25)
+        with mock.patch.object(views, 'render', render):
+            self.query_counts(user_id, urls)
+        self.assertEqual(queries_while_rendering, [0] * len(urls))
+
+    def test_generator_creates_the_requested_rows(self):
+        created = generate_mock_data(users=4, items_per_user=5, history_per_item=3, shares_per_item=2)
+        self.assertEqual(Item.objects.filter(id__in=created['item_ids']).count(), 20)
+        self.assertEqual(ItemVisibility.objects.filter(item_id__in=created['item_ids']).count(), 60)
+        self.assertEqual(ItemHistory.objects.filter(item_id__in=created['item_ids']).count(), 60)
+        self.assertEqual(InventoryValuation.objects.filter(user_id__in=created['user_ids']).count(), 4)
+
+    def test_page_queries_and_rows_do_not_grow_with_inventory_size(self):
+        small = self.query_counts(*self.pages('small', items=12, history=25))
+        large = self.query_counts(*self.pages('large', items=60, history=40))
+        self.assertEqual(small, large)
+
+    def test_regressions_compare_medians_and_query_counts(self):
+        baseline = {"views": {"routes": {"a": {"cold": {"median_ms": 10, "p99_ms": 10, "queries": 3}}}}}
+        current = {"views": {"routes": {"a": {"cold": {"median_ms": 11, "p99_ms": 90, "queries": 4}}}}}
+        self.assertEqual(regressions(baseline, current, 0.25), ["views.routes.a.cold.queries: 3 -> 4"])
+        current["views"]["routes"]["a"]["cold"]["median_ms"] = 20
+        self.assertEqual(len(regressions(baseline, current, 0.25)), 2)
+
+    def test_web_workers_start_without_the_plotting_stack(self):
+        self.assertEqual(start('wsgi')['heavy_modules'], [])
+        self.assertEqual(regressions({"startup": {"wsgi": {"heavy_modules": 0, "peak_rss_mib": 60}}},
+                                     {"startup": {"wsgi": {"heavy_modules": 2, "peak_rss_mib": 90}}}, 0.25),
+                         ["startup.wsgi.heavy_modules: 0 -> 2", "startup.wsgi.peak_rss_mib: 60 -> 90"])
@@ -13,9 +13,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from . import views
+from . import api, views
+from django.conf import settings
 from django.urls import path
 
+# Pages with async versions, served by those under ASGI.
+if getattr(settings, 'ASYNC_VIEWS', False):
+    from . import async_views as page_views
+else:
+    page_views = views
+
 urlpatterns = [
     # Home page.
     path('', views.home),
@@ -28,28 +35,45 @@ urlpatterns = [
     # Logout redirect.
     path('logout', views.user_logout),
     # Inventory page.
-    path('userInventory/', views.user_inventory),
-    path('userInventory/deleteError/<int:delError>', views.user_inventory),
+    path('userInventory/', page_views.user_inventory),
+    path('userInventory/deleteError/<int:delError>', page_views.user_inventory),
     # Inventory Insights page.
-    path('userInsights/', views.user_insights),
-    path('userInsights/<int:item_id>/', views.user_insights),
+    path('userInsights/', page_views.user_insights),
+    path('userInsights/<int:item_id>/', page_views.user_insights),
+    # Insights chart images, addressed by content hash.
+    path('chart/<int:item_id>/<slug:metric>/<slug:digest>.<slug:fmt>', page_views.item_chart),
     # Specific Inventory Information given id number.
-    path('userInventory/<int:item_id>/', views.user_inventory),
+    path('userInventory/<int:item_id>/', page_views.user_inventory),
     # Edit Item in Inventory page.
     path('userInventory/<int:item_id>/edit', views.user_inventory_edit),
     # Sign-up Page
     path('signup', views.user_signup),
     path('create', views.create_item),
+    # Bulk import page.
+    path('import', views.import_items),
+    # Inventory and item history downloads.
+    path('export/items.<slug:fmt>', views.export_items),
+    path('export/<int:item_id>/history.<slug:fmt>', views.export_item_history),
+    # Deletes the items ticked in the inventory table.
+    path('userInventory/delete', views.delete_selected_items),
     path('userInventory/<int:item_id>/delete', views.delete_item),
     path('userInventory/<int:item_id>/<int:item_range>/delete', views.delete_item),
-    # Range
+    # Keyset pages: item_range is the id of the item the page starts after.
     path('userInventory/<int:item_id>/<int:item_range>/edit',
          views.user_inventory_edit),
-    path('userInventory/<int:item_id>/<int:item_range>/', views.user_inventory),
+    path('userInventory/<int:item_id>/<int:item_range>/', page_views.user_inventory),
     path('userInventory/<int:item_id>/<int:item_range>/edit',
          views.user_inventory_edit),
-    path('userInsights/<int:item_id>/<int:item_range>/', views.user_insights),
+    path('userInsights/<int:item_id>/<int:item_range>/', page_views.user_insights),
     path('userVisibility/', views.user_users),
     path('userVisibility/<int:item_id>/<int:item_range>/', views.user_users),
     path('userVisibility/<int:item_id>/', views.user_users),
+    # Request profiling report, for staff.
+    path('metrics', views.metrics),
+    # JSON API.
+    path('api/items', api.items),
+    path('api/items/adjust', api.adjust),
+    path('api/items/<int:item_id>', api.item),
+    path('api/items/<int:item_id>/visibility', api.visibility),
+    path('api/users', api.users),
 ]
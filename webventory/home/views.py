@@ -1,21 +1,57 @@
-import datetime
-import os
-import re
+import io
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from typing import List, Union
+from decimal import Decimal
+from typing import Dict, Optional, Tuple, Union
 
-import numpy as np
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.hashers import make_password
-from django.http import HttpRequest, HttpResponseRedirect
+from django.core.exceptions import PermissionDenied
+from django.http import (Http404, HttpRequest, HttpResponse, HttpResponseNotModified,
+                         HttpResponseRedirect, JsonResponse)
 from django.shortcuts import render
-
-from .decorators import is_logged_in
-from .figures import graph
-from .models import Item, ItemHistory, User
+from django.views.decorators.http import require_POST
+
+from .charts import (CHART_FORMATS, CHART_METRICS, chart_cache, chart_digest, chart_url,
+                     chart_urls, history_version, parse_date, submit_chart, wait_for_chart)
+from .adjustments import AdjustmentError, VersionConflict, apply_adjustments, clean_adjustment
+from .archive import latest_archived
+from .caching import UserCache
+from .chartpool import ChartCancelled
+from .deletion import DeletionRefused, delete_items
+from .decorators import is_logged_in, replica_reads, staff_required
+from .directory import lookup_users, visible_usernames
+from .exporter import (EXPORT_FORMATS, HISTORY_COLUMNS, ITEM_COLUMNS, export_response,
+                       history_rows, item_rows, xlsx_available)
+from .importer import HISTORY, ITEMS, RowError, import_inventory
+from .instrumentation import store
+from .pagination import KeysetPage, paginate
+from .models import InventoryValuation, Item, ItemHistory, ItemVisibility, User
+from .search import SearchPage, search_items
 
 USER_INVENTORY = '/userInventory'
+# Changes listed on an item's page; the rest are in its history export.
+RECENT_HISTORY = 20
+# ItemHistory fields shown in the history table.
+HISTORY_FIELDS = ('date_of_change', 'quantity_before', 'quantity_after', 'price_before', 'price_after')
+# Item fields shown in the inventory table.
+TABLE_FIELDS = ('id', 'name', 'description', 'quantity', 'price')
+
+
+def recent_history(item_id: int) -> list:
+    """An item's RECENT_HISTORY newest changes, from its archive once live history runs out."""
+    histories = list(ItemHistory.objects.filter(item_id=item_id).only(
+        *HISTORY_FIELDS).order_by('-date_of_change', '-id')[:RECENT_HISTORY])
+    if len(histories) < RECENT_HISTORY:
+        histories += latest_archived(item_id, RECENT_HISTORY - len(histories))
+    return histories
+
+
+def table_items(user: User):
+    """Items user may see, loading only the fields the inventory table shows."""
+    return Item.objects.visible_to(user).only(*TABLE_FIELDS)
 
 
 # Create your views here.
@@ -66,7 +102,6 @@ def user_logout(request: HttpRequest) -> HttpResponseRedirect:
     Returns:
         HttpResponseRedirect : baseHome.html
     """
-    clear_graph_history(request.user)
     logout(request)
     return HttpResponseRedirect('/')
 
@@ -117,7 +152,6 @@ def user_landing_page(request: HttpRequest) -> render:
     Returns:
         [type]: userHome.html with username.
     """
-    clear_graph_history(request.user)
     return render(request, 'home/userHome.html', {"username": str(request.user).title(), })
 
 
@@ -137,251 +171,436 @@ def create_item(request: HttpRequest) -> Union[render, HttpResponseRedirect]:
             name=request.POST['name'],
             description=request.POST['description'],
             price=request.POST['price'],
-            user_visibility=f'{request.user},',
+            owner=request.user,
             quantity=request.POST.get('quantity'))
-        item.save()
+        ItemVisibility.objects.create(item=item, user=request.user)
         return HttpResponseRedirect(USER_INVENTORY)
 
-    clear_graph_history(request.user)
-    items = Item.objects.all().select_related()
+    after = request.GET.get('after', '')
+    items = paginate(request, Item.objects.owned_by(request.user), int(after) if after.isdigit() else 0)
     return render(request, 'home/userHomeInventoryCreate.html',
                   {"username": str(request.user).title(), "items": items, })
 
 
 @login_required(login_url='/login')
-def delete_item(request: HttpRequest, item_id=0, item_range=10) -> HttpResponseRedirect:
-    """Inventory Home Page.
+def import_items(request: HttpRequest) -> render:
+    """Bulk item and item history upload page.
+
+    Args:
+        request (HttpRequest): HTTP request, may carry a CSV or JSON Lines file.
+
+    Returns:
+        render: userHomeInventoryImport.html with the import report, if any.
+    """
+    report = None
+    if request.POST and request.FILES.get('file'):
+        upload = request.FILES['file']
+        kind = HISTORY if request.POST.get('kind') == HISTORY else ITEMS
+        fmt = 'jsonl' if upload.name.endswith(('.jsonl', '.json')) else 'csv'
+        # Decodes the upload line by line instead of reading it into memory.
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        report = import_inventory(stream, request.user, kind, fmt)
+    return render(request, 'home/userHomeInventoryImport.html',
+                  {"username": str(request.user).title(), "report": report})
+
+
+@replica_reads
+@login_required(login_url='/login')
+def export_items(request: HttpRequest, fmt: str = 'csv') -> HttpResponse:
+    """Downloads the items visible to the user.
+
+    Args:
+        request (HttpRequest): HTTP request.
+        fmt (str, optional): "csv" or "xlsx". Defaults to "csv".
+
+    Returns:
+        HttpResponse: streamed CSV, or XLSX, attachment.
+    """
+    if fmt not in EXPORT_FORMATS or (fmt == 'xlsx' and not xlsx_available()):
+        raise Http404("Unsupported export format.")
+    return export_response(f'{request.user}-inventory', fmt, ITEM_COLUMNS,
+                           item_rows(request.user))
+
+
+@replica_reads
+@login_required(login_url='/login')
+def export_item_history(request: HttpRequest, item_id: int, fmt: str = 'csv') -> HttpResponse:
+    """Downloads an item's history, limited to ?start= and ?end= dates if given.
+
+    Args:
+        request (HttpRequest): HTTP request.
+        item_id (int): Item ID number.
+        fmt (str, optional): "csv" or "xlsx". Defaults to "csv".
+
+    Returns:
+        HttpResponse: streamed CSV, or XLSX, attachment.
+    """
+    if fmt not in EXPORT_FORMATS or (fmt == 'xlsx' and not xlsx_available()):
+        raise Http404("Unsupported export format.")
+    if not Item.objects.visible_to(request.user).filter(id=item_id).exists():
+        raise Http404("No such item.")
+    start_date, end_date = date_range(parse_date(request.GET.get('start')), parse_date(request.GET.get('end')))
+    return export_response(f'item-{item_id}-history', fmt, HISTORY_COLUMNS,
+                           history_rows(item_id, start_date, end_date))
+
+
+@login_required(login_url='/login')
+def delete_item(request: HttpRequest, item_id=0, item_range=0) -> HttpResponseRedirect:
+    """Deletes one of the user's items.
 
     Args:
         request (HttpRequest): HTTP request.
         item_id (int, optional): Item ID number, if specified. Defaults to 0.
 
     Returns:
-        [type]: userHomeInventory.html with username, item, items, and itemHistory.
+        HttpResponseRedirect: to the inventory, or to its delete error page.
     """
-    does_item_exist = Item.objects.filter(id=item_id).exists()
-    does_item_history_exist = ItemHistory.objects.filter(
-        item_id=item_id).exists()
-    user_owns = bool(str(request.user) == Item.objects.get(
-        id=item_id).user_visibility[:Item.objects.get(
-            id=item_id).user_visibility.find(',')])
-    if does_item_exist and user_owns:
-        item_to_delete = Item.objects.get(id=item_id)
-        item_to_delete.delete()
-        if does_item_history_exist:
-            item_history_delete = ItemHistory.objects.filter(
-                item_id=item_id).select_related()
-            item_history_delete.delete()
-            return HttpResponseRedirect(USER_INVENTORY)
-    else:
+    try:
+        delete_items(request.user, [item_id])
+    except DeletionRefused:
         return HttpResponseRedirect(USER_INVENTORY + '/deleteError/1')
+    return HttpResponseRedirect(USER_INVENTORY)
 
 
 @login_required(login_url='/login')
-def user_inventory(request: HttpRequest, item_id=0, item_range=10, delError=0) -> render:
-    """Creates an inventory item.
+@require_POST
+def delete_selected_items(request: HttpRequest) -> HttpResponseRedirect:
+    """Deletes the items ticked in the inventory table, all or none.
 
     Args:
-        request (HttpRequest): HTTP request.
+        request (HttpRequest): HTTP POST request with an "items" id per ticked item.
 
     Returns:
-        [type]: userHomeInventory.html with username, item, items, and item_history.
+        HttpResponseRedirect: to the inventory, or to its delete error page.
     """
-    clear_graph_history(request.user)
+    item_ids = request.POST.getlist('items')
+    if not item_ids or not all(item_id.isdigit() for item_id in item_ids):
+        return HttpResponseRedirect(USER_INVENTORY)
+    try:
+        delete_items(request.user, [int(item_id) for item_id in item_ids])
+    except DeletionRefused:
+        return HttpResponseRedirect(USER_INVENTORY + '/deleteError/1')
+    return HttpResponseRedirect(USER_INVENTORY)
+
+
+def inventory_page(request: HttpRequest, item_range: int, query: str) -> Union[KeysetPage, SearchPage]:
+    """The inventory table: search results for a query, otherwise a keyset page."""
+    if query:
+        try:
+            page_number = int(request.GET.get('page', 1))
+        except ValueError:
+            page_number = 1
+        return search_items(request.user, query, page_number)
+    return paginate(request, table_items(request.user), item_range)
+
+
+def inventory_item(user: User, item_id: int) -> Optional[Item]:
+    """The item detailed on the inventory page, with its worth and owner, if user may see it."""
+    if item_id == 0:
+        return None
+    return Item.objects.visible_to(user).with_worth().select_related('owner').only(
+        *TABLE_FIELDS, 'owner__username').filter(id=item_id).first()
+
+
+def inventory_context(page: Union[KeysetPage, SearchPage], item: Optional[Item], histories: list,
+                      total_assets: Decimal, item_range: int, query: str) -> dict:
+    """The cached data of the inventory page."""
+    return {"item": item, "items": page, "page": page,
+            "item_range": item_range if query else page.after,
+            "itemHistories": histories if item else [],
+            "recent_history": RECENT_HISTORY,
+            "total_item_worth": item.worth if item else 0,
+            "item_owner": item.owner if item else None,
+            "total_assets": total_assets}
+
+
+def render_inventory(request: HttpRequest, context: dict, user_cache: UserCache, parts: tuple,
+                     item_id: int, delError: int, query: str) -> HttpResponse:
+    """Renders the inventory page from its cached data."""
     msg = "Select an item to view more detailed information."
     if delError == 1:
         msg = "Could not Delete! Maybe you are not owner?"
-    total_assets = 0
-    all_items = Item.objects.filter(
-        user_visibility__contains=f'{request.user},').select_related()
-    if (request.POST.get('search')):
-        items = Item.objects.filter(
-            name__contains=request.POST['search'], user_visibility__contains=f'{request.user},').select_related()
-
-    else:
-        items = Item.objects.filter(id__range=((item_range - 10), item_range),
-                                    user_visibility__contains=f'{request.user},').select_related()
-    item_history = str()
-    item = None
-    item_owner = None
-    total_item_worth = 0
-    if item_id != 0:
-        item = Item.objects.get(id=item_id)
-        item_history = ItemHistory.objects.filter(
-            item_id=item_id).select_related()
-        total_item_worth = (item.price * item.quantity)
-        item_owner = item.user_visibility[:item.user_visibility.find(',')]
-    for item_iter in all_items:
-        total_assets += (item_iter.price * item_iter.quantity)
-    return render(request, 'home/userHomeInventory.html',
-                  {"username": str(request.user).title(), "item": item, "items": items, "itemHistories": item_history,
-                   'item_range': item_range, 'item_id': item_id,
-                   'total_item_worth': total_item_worth, 'total_assets': total_assets, "msg": msg, "item_owner": item_owner})
+    context = dict(context)
+    context.update({"username": str(request.user).title(), "query": query, "item_id": item_id,
+                    "msg": msg, "fragment_key": user_cache.key('inventory', parts),
+                    "cache_timeout": user_cache.timeout()})
+    return render(request, 'home/userHomeInventory.html', context)
 
 
+@replica_reads
 @login_required(login_url='/login')
-def user_inventory_edit(request: HttpRequest, item_id=0, item_range=10) -> Union[render, HttpResponseRedirect]:
+def user_inventory(request: HttpRequest, item_id=0, item_range=0, delError=0) -> render:
+    """Creates an inventory item.
+
+    Args:
+        request (HttpRequest): HTTP request.
+
+    Returns:
+        [type]: userHomeInventory.html with username, item, items, and item_history.
+    """
+    query = request.POST.get('search') or request.GET.get('q', '')
+    user_cache = UserCache(request.user)
+    parts = (item_id, item_range, query, request.GET.urlencode())
+
+    def inventory_data() -> dict:
+        item = inventory_item(request.user, item_id)
+        return inventory_context(inventory_page(request, item_range, query), item,
+                                 recent_history(item_id) if item else [],
+                                 InventoryValuation.total_assets_for(request.user), item_range, query)
+
+    context = user_cache.get_or_set('inventory', parts, inventory_data)
+    return render_inventory(request, context, user_cache, parts, item_id, delError, query)
+
+
+@replica_reads
+@login_required(login_url='/login')
+def user_inventory_edit(request: HttpRequest, item_id=0, item_range=0) -> Union[render, HttpResponseRedirect]:
     """Inventory edit page.
 
     Args:
         request (HttpRequest): HTTP request.
         item_id (int, optional): Item ID number, if specified. Defaults to 0.
-        item_range (int, optional): item range to load.
+        item_range (int, optional): keyset cursor, the item id the page starts after.
 
     Returns:
         Union[render, HttpResponseRedirect] : HTTPResponseRedirect to Inventory Home page if form submitted,
         otherwise, Renders Inventory Edit page.
     """
 
-    item = Item.objects.get(id=item_id)
-    if request.POST:
-        if ((request.POST['price'] != str(item.price)) or (request.POST['quantity'] != str(item.quantity))):
-            ItemHistory(item_id=item, date_of_change=datetime.now(), price_before=item.price,
-                        price_after=request.POST.get('price'), quantity_before=item.quantity,
-                        quantity_after=request.POST.get('quantity')).save()
-        item.name = request.POST['name']
-        item.description = request.POST['description']
-        item.price = request.POST['price']
-        item.quantity = request.POST.get('quantity')
-        item.save()
+    user_cache = UserCache(request.user)
+    parts = (item_id, item_range, request.GET.urlencode())
+
+    def edit_data() -> dict:
+        # filters item by range and user visibility.
+        items = paginate(request, table_items(request.user), item_range)
+        item = Item.objects.visible_to(request.user).filter(id=item_id).first()
+        return {"item": item, "items": items, "page": items, "item_range": items.after}
+
+    context = dict(user_cache.get_or_set('edit', parts, edit_data))
+    item = context["item"]
+    if item is None:
         return HttpResponseRedirect(USER_INVENTORY)
-    # filters item by range and user visibility.
-    items = Item.objects.filter(id__range=(
-        (item_range - 10), item_range), user_visibility__contains=f'{request.user},').select_related()
-    item_history = ItemHistory.objects.filter(
-        item_id=item).select_related()
-    return render(request, 'home/userHomeInventoryEdit.html',
-                  {"username": str(request.user).title(), "item": item, "items": items,
-                   "itemHistories": item_history, "item_range": item_range, "item_id": item_id, "inventory": True})
+    msg = None
+    if request.POST:
+        try:
+            apply_adjustments(request.user, [clean_adjustment({
+                "id": item.id, "version": request.POST.get('version'),
+                **{field: request.POST.get(field)
+                   for field in ('name', 'description', 'quantity', 'price')}})])
+            return HttpResponseRedirect(USER_INVENTORY)
+        except RowError as error:
+            msg = f"Could not save: {error}."
+        except AdjustmentError as error:
+            msg = f"Could not save: {error.errors[0][1]}. Review the current values and save again."
+            item.refresh_from_db()
+        except VersionConflict:
+            msg = "Could not save: the item is busy. Please try again."
+    context.update({"username": str(request.user).title(), "item_id": item_id, "inventory": True,
+                    "msg": msg, "fragment_key": user_cache.key('edit', parts),
+                    "cache_timeout": user_cache.timeout()})
+    return render(request, 'home/userHomeInventoryEdit.html', context)
+
+
+def date_range(start_date: Optional[datetime],
+               end_date: Optional[datetime]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """A date range with either end possibly open, (None, None) for the whole history."""
+    # if not a valid date range, chart the whole history.
+    if start_date and end_date and start_date >= end_date:
+        return None, None
+    return start_date, end_date
+
+
+def insights_range(request: HttpRequest) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Date range posted to the insights page, see date_range."""
+    return date_range(parse_date(request.POST.get('startDate')), parse_date(request.POST.get('endDate')))
+
+
+def insights_item(user: User, item_id: int) -> Optional[Item]:
+    """The item charted on the insights page, if user may see it."""
+    return Item.objects.visible_to(user).only('id', 'name').filter(id=item_id).first() if item_id != 0 else None
+
 
+def insights_context(items: KeysetPage, item: Optional[Item], graphs: Dict[str, str]) -> dict:
+    """The cached data of the insights page."""
+    return {"items": items, "page": items, "item_range": items.after, "item": item,
+            "price_graph": graphs.get('price', ''),
+            "quantity_graph": graphs.get('quantity', ''),
+            "file_does_not_exist": not graphs}
 
+
+def render_insights(request: HttpRequest, context: dict, user_cache: UserCache, parts: tuple,
+                    item_id: int) -> HttpResponse:
+    """Renders the insights page from its cached data."""
+    context = dict(context)
+    context.update({"username": str(request.user).title(), "item_id": item_id,
+                    "fragment_key": user_cache.key('insights', parts),
+                    "cache_timeout": user_cache.timeout()})
+    return render(request, 'home/userHomeInsights.html', context)
+
+
+@replica_reads
 @login_required(login_url='/login')
-def user_insights(request: HttpRequest, item_id=0, item_range=10) -> render:
+def user_insights(request: HttpRequest, item_id=0, item_range=0) -> render:
     """Inventory Insights Home page.
 
     Args:
         item_id (int): item id number.
         request (HttpRequest): request.
-        item_range(int): item range to display.
+        item_range(int): keyset cursor, the item id the page starts after.
 
     Returns:
         render : userHomeInsights.html.
     """
-    # Year-Month-Day
-    date_pattern = re.compile("[\d]{4}-[\d]{2}-[\d]{2}")
-    items = Item.objects.filter(id__range=(
-        (item_range - 10), item_range), user_visibility__contains=f'{request.user},').select_related()
+    start_date, end_date = insights_range(request)
+    user_cache = UserCache(request.user)
+    parts = (item_id, item_range, request.GET.urlencode(), start_date, end_date)
+
+    def insights_data() -> dict:
+        items = paginate(request, table_items(request.user), item_range)
+        item = insights_item(request.user, item_id)
+        graphs = chart_urls(item.id, start_date, end_date) if item is not None else {}
+        return insights_context(items, item, graphs)
+
     # html template variables
-    return_dict = {"username": str(request.user).title(), "items": items, "item_id": item_id,
-                   "item_range": item_range, }
-    if item_id != 0:
-        item = Item.objects.get(id=item_id)
-        if request.POST and (request.POST.get('start_date_query') and request.POST.get('end_date_query')) and (date_pattern.match(request.POST.get('start_date_query')) is not None and date_pattern.match(request.POST.get('end_date_query')) is not None):
-            start_date_query = request.POST['startDate'].split(
-                '-')
-            end_date_query = request.POST['endDate'].split('-')
-            start_date = datetime.datetime(int(start_date_query[0]), int(
-                start_date_query[1]), int(start_date_query[2]))
-            end_date = datetime.datetime(int(end_date_query[0]), int(
-                end_date_query[1]), int(end_date_query[2]))
-            # if valid date range
-            if (start_date < end_date):
-                item_history = ItemHistory.objects.filter(
-                    item_id=item, date_of_change__gte=start_date, date_of_change__lte=end_date)
-            else:
-                item_history = ItemHistory.objects.filter(
-                    item_id=item).select_related()
-        else:
-            item_history = ItemHistory.objects.filter(
-                item_id=item).select_related()
-        price_graph = quantity_graph = ''
-        # if there is more than one item history
-        if len(item_history) > 1:
-            date_change = np.array([], dtype=np.str)
-            price_change = np.array([], dtype=np.float32)
-            quantity_change = np.array([], dtype=np.int32)
-            print(quantity_change)
-            for item_iter in item_history:
-                if item_iter.date_of_change:
-                    date_change = np.append(date_change,
-                                            item_iter.date_of_change.strftime('%m-%d %I:%M %p'))
-                if item_iter.price_after:
-                    price_change = np.append(
-                        price_change, item_iter.price_after)
-                if item_iter.quantity_after:
-                    quantity_change = np.append(
-                        quantity_change, item_iter.quantity_after)
-            print(len(quantity_change), len(price_change), len(quantity_change))
-            price_graph = f"home/temp/{request.user}/" + str(graph(
-                np.asarray(date_change), np.asarray(price_change), str(request.user), True))
-            quantity_graph = f"home/temp/{request.user}/" + str(graph(
-                np.asarray(date_change), np.asarray(quantity_change), str(request.user), False))
-        file_does_not_exist = False if price_graph else True
-        return_dict.update({"price_graph": price_graph,
-                            "quantity_graph": quantity_graph,
-                            "item": item,
-                            "file_does_not_exist": file_does_not_exist})
-        return render(request, 'home/userHomeInsights.html', return_dict)
-    return render(request, 'home/userHomeInsights.html',
-                  return_dict)
+    return render_insights(request, user_cache.get_or_set('insights', parts, insights_data),
+                           user_cache, parts, item_id)
+
+
+def chart_job(request: HttpRequest, item_id: int, metric: str, digest: str,
+              fmt: str) -> Union[HttpResponse, Tuple[str, futures.Future]]:
+    """The answer to a chart request, or its digest and the job drawing it if not drawn yet.
+
+    Raises:
+        Http404: for an unknown metric or format, or an item the user may not see.
+    """
+    if metric not in CHART_METRICS or fmt not in CHART_FORMATS or not Item.objects.visible_to(
+            request.user).filter(id=item_id).exists():
+        raise Http404("No such chart.")
+    start_date, end_date = date_range(parse_date(request.GET.get('start')), parse_date(request.GET.get('end')))
+    history = history_version(item_id, start_date, end_date)
+    current_digest = chart_digest(
+        item_id, history.version, metric, start_date, end_date, fmt)
+    if digest != current_digest:
+        return HttpResponseRedirect(chart_url(item_id, history.version, metric, start_date,
+                                              end_date, fmt))
+    if request.headers.get('If-None-Match') == f'"{current_digest}"':
+        return chart_response(HttpResponseNotModified(), current_digest)
+    image = chart_cache.get(current_digest)
+    if image is not None:
+        return chart_response(HttpResponse(image, content_type=CHART_FORMATS[fmt]), current_digest)
+    return current_digest, submit_chart(current_digest, item_id, metric, start_date, end_date, history, fmt)
+
+
+def chart_response(response: HttpResponse, digest: str) -> HttpResponse:
+    """Marks a chart response as the never changing content of its digest."""
+    response['ETag'] = f'"{digest}"'
+    # The URL changes with the content, so a fetched chart never goes stale.
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+def chart_not_drawn(error: BaseException) -> HttpResponse:
+    """The answer to a chart request whose job timed out or failed."""
+    if isinstance(error, (MemoryError, BrokenProcessPool, ChartCancelled)):
+        return HttpResponse("Chart could not be drawn.", status=503)
+    # Still drawing; the insights page polls until it is done.
+    response = HttpResponse(status=202)
+    response['Retry-After'] = '1'
+    return response
+
+
+@replica_reads
+@login_required(login_url='/login')
+def item_chart(request: HttpRequest, item_id: int, metric: str, digest: str,
+               fmt: str) -> HttpResponse:
+    """Insights chart image, drawn by the chart workers and cached by content hash.
 
+    Args:
+        request (HttpRequest): request, may carry ?start= and ?end= dates.
+        item_id (int): item id number.
+        metric (str): "price" or "quantity".
+        digest (str): content hash of the chart the URL was issued for.
+        fmt (str): "png" or "svg".
 
+    Returns:
+        HttpResponse: chart image, 304 if the client's copy is current, a
+        redirect to the current chart if the history has changed, or 202 if
+        the chart is still being drawn.
+    """
+    outcome = chart_job(request, item_id, metric, digest, fmt)
+    if isinstance(outcome, HttpResponse):
+        return outcome
+    current_digest, job = outcome
+    try:
+        image = wait_for_chart(job)
+    except (futures.TimeoutError, MemoryError, BrokenProcessPool, ChartCancelled) as error:
+        return chart_not_drawn(error)
+    return chart_response(HttpResponse(image, content_type=CHART_FORMATS[fmt]), current_digest)
+
+
+@replica_reads
 @login_required(login_url='/login')
-def user_users(request: HttpRequest, item_id=0, item_range=10) -> render:
+def user_users(request: HttpRequest, item_id=0, item_range=0) -> render:
     """
     user_users Change visibility settings for other users.
 
     Args:
         request (HttpRequest): request.
         item_id (int, optional): current item to display. Defaults to 0.
-        item_range (int, optional): Range of item to display. Defaults to 10.
+        item_range (int, optional): keyset cursor, the item id the page starts after. Defaults to 0.
 
     Returns:
         render: page render.
+
+    Raises:
+        PermissionDenied: if someone other than the item's owner posts a change.
     """
 
-    item = str()
-    user_visibility = str()
-    item_msg = str()
-    users = np.asarray([str(user) for user in User.objects.all()])
-    if(item_id != 0):
-        user_visibility = Item.objects.get(
-            id=item_id).user_visibility.split(',')
-        item = Item.objects.get(id=item_id)
-        item_msg = item.name + " Visibility Settings"
-    items = Item.objects.filter(id__range=(
-        (item_range - 10), item_range), user_visibility__contains=f'{request.user},').select_related()
-    return_dict = {"username": str(request.user).title(
-    ), "items": items, "item_range": item_range, "users": users}
-    if request.POST:
-        print(request.POST)
-        user_visibility_list: str = f'{user_visibility[0]},'
-        for user in users:
-            print(user)
-            print(request.POST.get(str(user)))
-            if request.POST.get(f'{user}') and f'{user}' not in user_visibility_list:
-                user_visibility_list += f'{user},'
-        item.user_visibility = user_visibility_list
-        print(user_visibility_list)
-        item.save()
-        return_dict.update({"msg": "Modification Successful"})
-    else:
-        return_dict.update({"item_id": item_id, "item": item,
-                            "msg": "Select an item to modify user visibility.", "item_msg": item_msg})
+    def visibility_data() -> dict:
+        item = Item.objects.visible_to(request.user).select_related(
+            'owner').filter(id=item_id).first() if item_id != 0 else None
+        items = paginate(request, table_items(request.user), item_range)
+        return {"item": item, "items": items, "page": items, "item_range": items.after,
+                "item_msg": item.name + " Visibility Settings" if item else ""}
+
+    user_cache = UserCache(request.user)
+    parts = (item_id, item_range, request.GET.get('per_page'), request.GET.get('before'))
+    data = user_cache.get_or_set('visibility', parts, visibility_data)
+    item = data["item"]
+    msg = "Select an item to modify user visibility."
+    if request.POST and item is not None:
+        if item.owner_id != request.user.id:
+            raise PermissionDenied("Only the item's owner can change who sees it.")
+        # Only the users the form showed are compared, never every account.
+        shown = set(request.POST.getlist('shown'))
+        visible = set(request.POST.getlist('visible')) & shown
+        item.update_visibility(add=visible, remove=shown - visible)
+        msg = "Modification Successful"
+    return_dict = dict(data, username=str(request.user).title(), item_id=item_id, msg=msg,
+                       fragment_key=user_cache.key('visibility', parts),
+                       cache_timeout=user_cache.timeout())
+    if item is not None:
+        query = request.GET.get('q', '')
+        users = lookup_users(query, request.GET.get('after', ''))
+        if request.POST:
+            return_dict["item_msg"] = f"{item.name}: {msg}"
+        return_dict.update({"users": users, "query": query,
+                            "user_visibility": visible_usernames(
+                                item, [user.username for user in users])})
     return render(request, 'home/userHomeVisibility.html', return_dict)
 
 
-def clear_graph_history(username: str) -> None:
-    """
-    clear_graph_history Clears Graph History.
+@staff_required
+def metrics(request: HttpRequest) -> HttpResponse:
+    """Request profiling percentiles of this worker, per route.
 
     Args:
-        username (str): username of current user.
+        request (HttpRequest): request; ?format=prometheus for the Prometheus
+            text format instead of JSON.
+
+    Returns:
+        HttpResponse: the report, empty unless settings.INSTRUMENTATION is on.
     """
-    # gets currentworking directory plus graph directory.
-    path = os.path.join(os.path.dirname(__file__), 'static',
-                        'home', 'temp', f'{username}')
-    if os.path.exists(path):
-        os.chdir(path)
-        for file in os.listdir(path):
-            os.remove(file)
+    if request.GET.get('format') == 'prometheus':
+        return HttpResponse(store.prometheus(), content_type='text/plain; version=0.0.4')
+    return JsonResponse(store.report())
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -24,10 +25,18 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY")
 
+# Production mode: DEBUG off, and templates compiled once per process by the
+# cached template loader instead of reread and parsed on every render.
+# Static files are then no longer served by runserver.
+PRODUCTION = os.getenv("PRODUCTION", "False") == "True"
+
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = not PRODUCTION
 
-ALLOWED_HOSTS = []
+# Comma separated host names served. Required in production; otherwise any
+# host is served when it is left empty.
+ALLOWED_HOSTS = ([host for host in os.getenv("ALLOWED_HOSTS", "").split(",") if host]
+                 or ([] if PRODUCTION else ['*']))
 
 # Application definition
 
@@ -43,6 +52,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it counts the queries of the middleware below; removes itself
+    # unless INSTRUMENTATION is on.
+    'home.instrumentation.InstrumentationMiddleware',
+    # Before SessionMiddleware, so a saved session counts as a write;
+    # removes itself unless DATABASE_REPLICAS are configured.
+    'home.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,17 +65,21 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     # 'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
 ROOT_URLCONF = 'webventory.urls'
 
+# Project and app template directories, as APP_DIRS would search them.
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for the instrumentation middleware.
+        'BACKEND': 'home.instrumentation.TimedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -68,6 +87,8 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'loaders': ([('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+                        if PRODUCTION else TEMPLATE_LOADERS),
         },
     },
 ]
@@ -77,13 +98,79 @@ WSGI_APPLICATION = 'webventory.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# DATABASE_PROFILE picks one of DATABASE_PROFILES:
+# "sqlite" (the default) is SQLite in WAL mode with synchronous=NORMAL, a
+# busy timeout, memory mapped reads and BEGIN IMMEDIATE transactions, so
+# concurrent writers queue for the write lock instead of failing with
+# "database is locked"; "sqlite-basic" is Django's stock SQLite setup, kept
+# for comparison; "postgres" is PostgreSQL (DATABASE_HOST, DATABASE_PORT,
+# DATABASE_NAME, DATABASE_USER, DATABASE_PASSWORD) with a pool of up to
+# DATABASE_POOL_SIZE connections per process.
+# Connections are kept open for DATABASE_CONN_MAX_AGE seconds and checked
+# before reuse.
+DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "sqlite")
+DATABASE_CONN_MAX_AGE = int(os.getenv("DATABASE_CONN_MAX_AGE", "60"))
+SQLITE_NAME = os.getenv("DATABASE_NAME", str(BASE_DIR / 'db.sqlite3'))
+DATABASE_PROFILES = {
+    'sqlite-basic': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'NAME': SQLITE_NAME,
+    },
+    'sqlite': {
+        'ENGINE': 'home.db.sqlite3',
+        'NAME': SQLITE_NAME,
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds to wait for the write lock.
+            'timeout': int(os.getenv("SQLITE_BUSY_TIMEOUT", "20")),
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'mmap_size': int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+            },
+        },
+    },
+    'postgres': {
+        'ENGINE': 'home.db.postgresql',
+        'HOST': os.getenv("DATABASE_HOST", "localhost"),
+        'PORT': os.getenv("DATABASE_PORT", "5432"),
+        'NAME': os.getenv("DATABASE_NAME", "webventory"),
+        'USER': os.getenv("DATABASE_USER", "webventory"),
+        'PASSWORD': os.getenv("DATABASE_PASSWORD", ""),
+        'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {'min_size': 1, 'max_size': int(os.getenv("DATABASE_POOL_SIZE", "10"))},
+        },
+    },
+}
+DATABASES = {
+    'default': DATABASE_PROFILES[DATABASE_PROFILE],
 }
 
+# Read-only replicas of the default database, one per comma separated
+# DATABASE_REPLICAS entry: a file for the SQLite profiles (kept in step by
+# "manage.py sync_replicas"), a host for "postgres". Views marked
+# @replica_reads read from them; a user's reads go back to the primary for
+# READ_YOUR_WRITES_SECONDS after each of their writes.
+DATABASE_REPLICAS = []
+for number, location in enumerate(filter(None, os.getenv("DATABASE_REPLICAS", "").split(","))):
+    replica = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if DATABASE_PROFILE == 'postgres':
+        replica['HOST'] = location
+        replica['OPTIONS'] = dict(replica['OPTIONS'], options='-c default_transaction_read_only=on')
+    else:
+        replica['NAME'] = location
+        if 'OPTIONS' in replica:
+            replica['OPTIONS'] = dict(replica['OPTIONS'],
+                                      pragmas=dict(replica['OPTIONS']['pragmas'], query_only='ON'))
+    DATABASES[f'replica{number}'] = replica
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['home.routers.ReplicaRouter'] if DATABASE_REPLICAS else []
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -104,7 +191,6 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-ALLOWED_HOSTS = ['*']
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -128,3 +214,87 @@ STATIC_URL = '/static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
+# Keep a per-user materialized total of inventory worth, updated on Item and
+# visibility writes, instead of aggregating on every inventory page view.
+MATERIALIZED_VALUATIONS = os.getenv("MATERIALIZED_VALUATIONS", "True") == "True"
+
+# Default number of items per inventory table page; ?per_page= may pick
+# another size from home.pagination.PAGE_SIZES.
+INVENTORY_PAGE_SIZE = int(os.getenv("INVENTORY_PAGE_SIZE", "10"))
+
+# Number of rendered insights charts kept in each worker's in-memory LRU cache.
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "128"))
+
+# Longer item histories are downsampled (largest-triangle-three-buckets) to
+# this many points before an insights chart is drawn.
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "640"))
+
+# Most stock adjustments accepted by one /api/items/adjust request.
+API_MAX_BATCH = int(os.getenv("API_MAX_BATCH", "5000"))
+
+# Charts are drawn by CHART_WORKERS spawned processes (0 draws them in the
+# request thread). Each worker draws CHART_WORKER_JOBS charts before being
+# replaced and may use CHART_WORKER_MEMORY_MB of memory (0 for no limit). A
+# chart request waits CHART_WAIT_SECONDS before answering 202, which the
+# insights page retries.
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_WORKER_JOBS = int(os.getenv("CHART_WORKER_JOBS", "100"))
+CHART_WORKER_MEMORY_MB = int(os.getenv("CHART_WORKER_MEMORY_MB", "512"))
+CHART_WAIT_SECONDS = float(os.getenv("CHART_WAIT_SECONDS", "1.0"))
+
+# "manage.py archive_history" moves ItemHistory older than this many days,
+# rounded back to the start of its month, into compressed monthly archives.
+HISTORY_ARCHIVE_DAYS = int(os.getenv("HISTORY_ARCHIVE_DAYS", "365"))
+
+# Deleting items removes up to DELETE_INLINE_ROWS history rows in the
+# request; items with longer histories are hidden at once and their history
+# deleted by a background thread, DELETE_PURGE_CHUNK_SIZE rows per transaction.
+DELETE_INLINE_ROWS = int(os.getenv("DELETE_INLINE_ROWS", "2000"))
+DELETE_PURGE_CHUNK_SIZE = int(os.getenv("DELETE_PURGE_CHUNK_SIZE", "500"))
+
+# Cache for per-user inventory pages and logged in users. CACHE_BACKEND is
+# "locmem" (one cache per process), "file" (shared by the workers of one
+# host, kept in CACHE_LOCATION) or the dotted path of any Django cache
+# backend, e.g. "django_redis.cache.RedisCache" with
+# CACHE_LOCATION="redis://127.0.0.1:6379/1". A write expires cached pages
+# only in the cache it reaches, so "locmem" is refused when WEB_CONCURRENCY,
+# which gunicorn and uvicorn read as their worker count, is above 1, and
+# production defaults to "file".
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+}
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "file" if PRODUCTION else "locmem")
+if CACHE_BACKEND == 'locmem' and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+    raise ImproperlyConfigured("CACHE_BACKEND=locmem cannot be shared by several workers; "
+                               "use \"file\" or a shared cache server.")
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKEND),
+        'LOCATION': os.getenv("CACHE_LOCATION",
+                              str(BASE_DIR / 'cache') if CACHE_BACKEND == 'file' else 'webventory'),
+    }
+}
+
+# Seconds cached inventory pages live; edits invalidate them sooner.
+INVENTORY_CACHE_TIMEOUT = int(os.getenv("INVENTORY_CACHE_TIMEOUT", "600"))
+
+# Serves request.user from the cache above instead of a query per request.
+AUTHENTICATION_BACKENDS = ['home.backends.CachedModelBackend']
+
+# Profile every request (wall, SQL, duplicate query, template and chart
+# time) and report percentiles per route at /metrics, for staff users.
+INSTRUMENTATION = os.getenv("INSTRUMENTATION", "False") == "True"
+
+# When set, each worker also writes its metrics in the Prometheus text format
+# to this path every INSTRUMENTATION_FLUSH_SECONDS; "{pid}" is replaced by
+# the worker's process id, e.g. /var/lib/node_exporter/webventory-{pid}.prom.
+INSTRUMENTATION_FILE = os.getenv("INSTRUMENTATION_FILE", "")
+INSTRUMENTATION_FLUSH_SECONDS = int(os.getenv("INSTRUMENTATION_FLUSH_SECONDS", "15"))
+
+# Route the inventory, insights and chart pages to their async versions in
+# home/async_views.py, which read a page's data concurrently. Turn on when
+# serving webventory/asgi.py, e.g. "uvicorn webventory.asgi:application";
+# under WSGI each async view would cost an extra event loop per request.
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "False") == "True"